@@ -0,0 +1,68 @@
+import io
+
+import utils
+
+# Default upload codec of each backend. Azure uploads the WAV as is unless
+# another codec is asked for; GCP gets lossless FLAC.
+backend_codecs = {"azure": "wav", "gcp": "flac"}
+
+# soundfile format, subtype, MIME type and file extension for every codec
+codecs = {
+    "wav": ("WAV", "PCM_16", "audio/wav", ".wav"),
+    "flac": ("FLAC", "PCM_16", "audio/flac", ".flac"),
+    "opus": ("OGG", "OPUS", "audio/ogg", ".ogg"),
+}
+
+
+def encode_pcm16(chunks, sample_rate: int = 16000, codec: str = "flac") -> bytes:
+    """
+    Encode a stream of 16-bit mono PCM chunks into an in-memory audio file.
+
+    Chunks are fed to the encoder as they arrive, so only the encoded output is
+    held in memory.
+
+    Args:
+        chunks: Iterable of int16 arrays or raw little-endian int16 bytes.
+        sample_rate (int): Sample rate of the PCM.
+        codec (str): One of `codecs`.
+
+    Returns:
+        bytes: The encoded file.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    if codec not in codecs:
+        raise ValueError(f"Unsupported codec {codec}; expected one of {list(codecs)}.")
+    file_format, subtype, _, _ = codecs[codec]
+
+    buffer = io.BytesIO()
+    with sf.SoundFile(
+        buffer,
+        "w",
+        samplerate=sample_rate,
+        channels=1,
+        format=file_format,
+        subtype=subtype,
+    ) as f:
+        for chunk in chunks:
+            if isinstance(chunk, (bytes, bytearray, memoryview)):
+                chunk = np.frombuffer(chunk, dtype=np.int16)
+            if len(chunk):
+                f.write(chunk)
+    return buffer.getvalue()
+
+
+def encode_file(file_path: str, codec: str = "flac", sample_rate: int = 16000) -> bytes:
+    """
+    Decode an audio file to 16-bit mono PCM and encode it with a codec.
+
+    Args:
+        file_path (str): Path to the audio file.
+        codec (str): One of `codecs`.
+        sample_rate (int): Sample rate of the encoded audio.
+
+    Returns:
+        bytes: The encoded file.
+    """
+    return encode_pcm16(utils.iter_pcm16(file_path, sample_rate), sample_rate, codec)
@@ -0,0 +1,29 @@
+import asyncio
+import wave
+
+# Standard library only: commands that just read WAV headers (`cli.py duration`)
+# import this module instead of `utils`, which loads numpy.
+
+
+def wav_duration(file_path):
+    """
+    Returns the duration in seconds of a WAV file.
+
+    :param file_path: Path to the WAV file
+    :return: Duration in seconds (float)
+    """
+    with wave.open(file_path, "r") as wav_file:
+        frames = wav_file.getnframes()
+        rate = wav_file.getframerate()
+        duration = frames / float(rate)
+    return duration
+
+
+async def get_wav_duration(file_path):
+    """
+    Returns the duration in seconds of a WAV file, reading the header on a thread.
+
+    :param file_path: Path to the WAV file
+    :return: Duration in seconds (float)
+    """
+    return await asyncio.to_thread(wav_duration, file_path)
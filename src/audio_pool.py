@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import utils
+
+# Worker processes for CPU-bound audio work; 0 runs it on threads instead.
+# One-shot runs combine a handful of files, which is not worth spawning an
+# interpreter per core for, so they stay on threads; long-lived callers switch
+# to a process pool with `start`. Set AUDIO_POOL_WORKERS to override both.
+workers = int(os.getenv("AUDIO_POOL_WORKERS", 0))
+
+_pool = None
+
+
+def configure(pool_workers: int):
+    """
+    Change the number of worker processes, replacing any running pool.
+
+    Args:
+        pool_workers (int): Worker processes; 0 runs audio work on threads.
+    """
+    global workers
+    shutdown()
+    workers = pool_workers
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    The shared process pool, started on first use.
+
+    Workers are spawned rather than forked, so they do not inherit the event
+    loop's threads or locks.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown():
+    """
+    Stop the worker processes; the next job starts a new pool.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+async def run(function, *args):
+    """
+    Run a picklable function in the process pool without blocking the loop.
+
+    With `workers == 0` it runs on a thread instead.
+    """
+    if workers == 0:
+        return await asyncio.to_thread(function, *args)
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), function, *args)
+
+
+async def warm():
+    """
+    Start every worker process and import the audio modules in it.
+
+    Spawning a worker and importing soundfile and scipy there takes a few
+    hundred milliseconds, which long-lived callers pay here instead of on
+    their first job.
+    """
+    if workers:
+        await asyncio.gather(*(run(_warm_worker) for _ in range(workers)))
+
+
+async def start(pool_workers: int = None):
+    """
+    Move audio work to a warm process pool, for callers that run many jobs.
+
+    Args:
+        pool_workers (int): Worker processes; defaults to AUDIO_POOL_WORKERS,
+            or one per core.
+    """
+    if pool_workers is None:
+        pool_workers = int(os.getenv("AUDIO_POOL_WORKERS", os.cpu_count() or 4))
+    if pool_workers != workers:
+        configure(pool_workers)
+    await warm()
+
+
+def _warm_worker():
+    import soundfile  # noqa: F401
+    from scipy.signal import resample  # noqa: F401
+
+
+class SharedPCM:
+    """
+    16-bit mono PCM in a shared memory block, addressed by name across processes.
+
+    The creating process owns the block and must `unlink` it; workers open it
+    with `SharedPCM(name, frames)` and only `close` their mapping.
+    """
+
+    def __init__(self, name: str, frames: int):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = frames
+        self.array = np.ndarray((frames,), dtype=np.int16, buffer=self.shm.buf)
+
+    @classmethod
+    def create(cls, frames: int) -> "SharedPCM":
+        # Zero-length blocks are not allowed
+        shm = shared_memory.SharedMemory(create=True, size=max(1, frames * 2))
+        pcm = cls.__new__(cls)
+        pcm.shm = shm
+        pcm.frames = frames
+        pcm.array = np.ndarray((frames,), dtype=np.int16, buffer=shm.buf)
+        return pcm
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        # Views of the buffer must be released before the mapping
+        del self.array
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def decoded_length(file_path: str, target_samplerate: int = 16000) -> int:
+    """
+    Number of frames `utils.decode_signature` produces for a file.
+
+    Only the header is read.
+    """
+    import soundfile as sf
+
+    info = sf.info(file_path)
+    if info.samplerate == target_samplerate:
+        return info.frames
+    return int(info.frames * target_samplerate / info.samplerate)
+
+
+def decode_into(
+    file_path: str,
+    name: str,
+    frames: int,
+    start: int,
+    length: int,
+    target_samplerate: int = 16000,
+) -> int:
+    """
+    Decode and resample a file into its slot of a shared PCM block.
+
+    Runs in a worker process; only the file path and the block's name cross the
+    process boundary. The slot holds `length` frames, the count read from the
+    header by `decoded_length`. Decoders and the resampler can disagree with it
+    by a few frames, so the samples are cut or zero-padded to the slot and never
+    spill into the next file's.
+
+    Returns:
+        int: Frames decoded, which may differ from `length`.
+    """
+    data = utils.decode_signature(file_path, target_samplerate)
+    pcm = SharedPCM(name, frames)
+    try:
+        n = min(len(data), length)
+        pcm.array[start : start + n] = data[:n]
+        pcm.array[start + n : start + length] = 0
+    finally:
+        pcm.close()
+    return len(data)
+
+
+def write_wav(output_path: str, samples: np.ndarray, sample_rate: int = 16000):
+    """
+    Write 16-bit mono PCM as a WAV file straight from a buffer.
+    """
+    import wave
+
+    with wave.open(output_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.astype("<i2", copy=False).tobytes())
+
+
+async def decode_all(audio_file_paths: list, target_samplerate: int = 16000):
+    """
+    Decode and resample files in parallel into one shared PCM block.
+
+    Each file is decoded by its own job and written at its offset, so the block
+    holds the concatenation of the files, exactly as `utils.combine_audio`
+    builds it. The caller owns the block and must `unlink` it.
+
+    Returns:
+        SharedPCM: The concatenated samples.
+    """
+    # Workers keep the working directory they were started in
+    audio_file_paths = [os.path.abspath(path) for path in audio_file_paths]
+    lengths = await asyncio.gather(
+        *(
+            asyncio.to_thread(decoded_length, path, target_samplerate)
+            for path in audio_file_paths
+        )
+    )
+    starts = np.cumsum([0] + lengths)
+    pcm = SharedPCM.create(int(starts[-1]))
+    try:
+        decoded = await asyncio.gather(
+            *(
+                run(
+                    decode_into,
+                    path,
+                    pcm.name,
+                    pcm.frames,
+                    int(start),
+                    length,
+                    target_samplerate,
+                )
+                for path, start, length in zip(audio_file_paths, starts, lengths)
+            )
+        )
+    except BaseException:
+        pcm.unlink()
+        raise
+    for path, length, frames in zip(audio_file_paths, lengths, decoded):
+        if frames != length:
+            print(
+                f"{path}: decoded {frames} frames but the header gave {length}; "
+                "fitted to the header length"
+            )
+    return pcm
+
+
+async def combine(
+    audio_file_paths: list, output_path: str, target_samplerate: int = 16000
+) -> str:
+    """
+    Combine audio files into a WAV file without blocking the event loop.
+
+    Decoding and resampling run in the process pool (see `decode_all`) and the
+    output is written from a thread. Samples only ever travel through shared
+    memory.
+
+    Args:
+        audio_file_paths (list): Files to concatenate, in order.
+        output_path (str): Path of the combined file.
+        target_samplerate (int): Sample rate of the output.
+
+    Returns:
+        str: `output_path`.
+    """
+    pcm = await decode_all(audio_file_paths, target_samplerate)
+    try:
+        await asyncio.to_thread(write_wav, output_path, pcm.array, target_samplerate)
+    finally:
+        pcm.unlink()
+    return output_path
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.01) -> list:
+    """
+    Measure how late the event loop wakes a sleeper until `stop` is set.
+
+    Returns:
+        list: Lateness of each wake-up in seconds.
+    """
+    lags = []
+    while not stop.is_set():
+        t1 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t1 - interval)
+    return lags
+
+
+async def compare(audio_file_paths: list, jobs: int, output_dir: str) -> list:
+    """
+    Run concurrent combine jobs on the loop, on threads and in the process pool.
+
+    The "blocking" mode calls `utils.combine_pcm16` on the event loop thread, as
+    `combine_audio` did before it was offloaded.
+
+    Returns:
+        list: Wall time and event loop lag of every mode.
+    """
+    os.makedirs(".build/audio_pool", exist_ok=True)
+    results = []
+    for mode in ("blocking", "threads", "processes"):
+        configure((os.cpu_count() or 4) if mode == "processes" else 0)
+        await warm()
+        stop = asyncio.Event()
+        lag = asyncio.create_task(loop_lag(stop))
+        outputs = [f".build/audio_pool/{mode}_{i}.wav" for i in range(jobs)]
+        t1 = time.perf_counter()
+        if mode == "blocking":
+            for output in outputs:
+                utils.combine_pcm16(audio_file_paths, output)
+                await asyncio.sleep(0)
+        else:
+            await asyncio.gather(
+                *(combine(audio_file_paths, output) for output in outputs)
+            )
+        wall = time.perf_counter() - t1
+        stop.set()
+        lags = await lag
+        results.append(
+            {
+                "mode": mode,
+                "jobs": jobs,
+                "workers": workers,
+                "wall_seconds": wall,
+                "loop_lag_p99_ms": float(np.percentile(lags, 99)) * 1000,
+                "loop_lag_max_ms": max(lags) * 1000,
+            }
+        )
+        print(
+            f"{mode}: {wall:.2f}s for {jobs} jobs, event loop lag "
+            f"p99 {results[-1]['loop_lag_p99_ms']:.1f} ms, "
+            f"max {results[-1]['loop_lag_max_ms']:.1f} ms"
+        )
+    shutdown()
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"audio_pool_{int(time.time())}.json")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved as {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare event loop lag and wall time of combining audio on "
+        "the loop, on threads and in the process pool."
+    )
+    parser.add_argument("files", nargs="+", help="Files combined by every job")
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--output-dir", default="output_log/benchmarks")
+    args = parser.parse_args()
+    asyncio.run(compare(args.files, args.jobs, args.output_dir))
@@ -1,57 +1,270 @@
+import argparse
 import asyncio
-
-# This example uses aiofile for asynchronous file reads.
-# It's not a dependency of the project but can be installed
-# with `pip install aiofile`.
-import aiofile
+import contextlib
+import glob
+import inspect
+import json
+import os
+import time
 
 from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
 
-"""
-Here's an example of a custom event handler you can extend to
-process the returned transcription results as needed. This
-handler will simply print the text out to your interpreter.
-"""
+import utils
+
+
+class Pacer:
+    """
+    Holds a sender to a multiple of the audio's real-time rate.
+
+    `speed=1.0` sends in real time, `speed=4.0` at most four times faster and
+    `speed=None` without any limit.
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.started = None
+
+    async def wait(self, audio_seconds: float):
+        """
+        Sleep until `audio_seconds` of audio may have been sent.
+        """
+        if self.started is None:
+            self.started = time.perf_counter()
+        if self.speed:
+            delay = self.started + audio_seconds / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                return
+        # Let the output handler run between sends even when unpaced
+        await asyncio.sleep(0)
 
 
-class MyEventHandler(TranscriptResultStreamHandler):
+class CollectingHandler(TranscriptResultStreamHandler):
+    """
+    Collects transcript results as structured records instead of printing them.
+
+    Events are handed from the stream reader to a consumer task through a
+    bounded queue. `on_result` (sync or async) runs in that consumer for every
+    record, and the sender waits in `wait_for_capacity` while `max_pending`
+    events are still unprocessed, so a slow consumer slows the upload down.
+    Exceptions from `on_result` are kept in `errors` and the consumer keeps
+    draining, so a failing callback cannot stall the stream.
+    """
+
+    def __init__(self, output_stream, on_result=None, max_pending: int = 8):
+        super().__init__(output_stream)
+        self.on_result = on_result
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.capacity = asyncio.Event()
+        self.capacity.set()
+        self.results = []
+        self.errors = []
+        self.started = time.perf_counter()
+        self.audio_sent = 0.0
+
     async def handle_transcript_event(self, transcript_event: TranscriptEvent):
-        # This handler can be implemented to handle transcriptions as needed.
-        # Here's an example to get started.
-        results = transcript_event.transcript.results
-        for result in results:
-            for alt in result.alternatives:
-                print(alt.transcript)
+        await self.queue.put(transcript_event)
+        if self.queue.full():
+            self.capacity.clear()
+
+    async def wait_for_capacity(self):
+        """
+        Wait while the consumer is `max_pending` events behind.
+        """
+        await self.capacity.wait()
+
+    async def consume(self):
+        """
+        Turn queued events into records until `None` is queued.
+        """
+        while (transcript_event := await self.queue.get()) is not None:
+            self.capacity.set()
+            for result in transcript_event.transcript.results:
+                alternative = result.alternatives[0] if result.alternatives else None
+                record = {
+                    "result_id": result.result_id,
+                    "start": result.start_time,
+                    "end": result.end_time,
+                    "partial": result.is_partial,
+                    "text": alternative.transcript if alternative else "",
+                    "speakers": (
+                        sorted(
+                            {
+                                item.speaker
+                                for item in (alternative.items or [])
+                                if getattr(item, "speaker", None) is not None
+                            }
+                        )
+                        if alternative
+                        else []
+                    ),
+                    "received": time.perf_counter() - self.started,
+                    "audio_sent": self.audio_sent,
+                }
+                self.results.append(record)
+                if self.on_result is not None:
+                    try:
+                        returned = self.on_result(record)
+                        if inspect.isawaitable(returned):
+                            await returned
+                    except Exception as e:
+                        if not self.errors:
+                            print(f"on_result failed: {type(e).__name__}: {e}")
+                        self.errors.append(e)
+
+    async def handle_events(self):
+        consumer = asyncio.create_task(self.consume())
+        try:
+            await super().handle_events()
+        finally:
+            await self.queue.put(None)
+            await consumer
 
+    def finals(self) -> list:
+        """
+        The final (non-partial) records in order.
+        """
+        return [record for record in self.results if not record["partial"]]
 
-async def basic_transcribe():
-    # Set up our client with your chosen Region
-    client = TranscribeStreamingClient(region="us-west-2")
 
-    # Start transcription to generate async stream
+async def stream_file(
+    client,
+    audio_path: str,
+    chunk_ms: int = 100,
+    speed: float = 1.0,
+    max_pending: int = 8,
+    on_result=None,
+    sample_rate: int = 16000,
+    language_code: str = "en-US",
+) -> dict:
+    """
+    Stream one recording to Amazon Transcribe and collect the results.
+
+    Args:
+        client: A `TranscribeStreamingClient` (or the stand-in from
+            `mock_aws_transcribe`).
+        audio_path (str): Path to the audio file.
+        chunk_ms (int): Audio per `send_audio_event` call.
+        speed (float): Maximum multiple of real time to send at; None is unpaced.
+        max_pending (int): Unprocessed result events tolerated before the sender
+            pauses.
+        on_result: Called with every result record (sync or async).
+        sample_rate (int): Sample rate sent to the service.
+        language_code (str): The language of the recording.
+
+    Returns:
+        dict: The file, every result record, the final transcript and timings,
+            including how long the sender was held back by the handler.
+    """
     stream = await client.start_stream_transcription(
-        language_code="en-US",
-        media_sample_rate_hz=16000,
+        language_code=language_code,
+        media_sample_rate_hz=sample_rate,
         media_encoding="pcm",
     )
+    handler = CollectingHandler(stream.output_stream, on_result, max_pending)
+    pacer = Pacer(speed)
+    stats = {"chunks": 0, "audio_seconds": 0.0, "backpressure_seconds": 0.0}
 
     async def write_chunks():
-        # NOTE: For pre-recorded files longer than 5 minutes, the sent audio
-        # chunks should be rate limited to match the real-time bitrate of the
-        # audio stream to avoid signing issues.
-        async with aiofile.AIOFile("data/audio/isolation.wav", "rb") as afp:
-            reader = aiofile.Reader(afp, chunk_size=1024 * 16)
-            async for chunk in reader:
+        # Decoded in a thread, a few chunks ahead of the sender
+        chunks = utils.pcm_chunks_async(audio_path, chunk_ms, sample_rate)
+        async with contextlib.aclosing(chunks):
+            async for chunk in chunks:
+                t1 = time.perf_counter()
+                await handler.wait_for_capacity()
+                stats["backpressure_seconds"] += time.perf_counter() - t1
+                await pacer.wait(stats["audio_seconds"])
                 await stream.input_stream.send_audio_event(audio_chunk=chunk)
+                stats["chunks"] += 1
+                stats["audio_seconds"] += len(chunk) / 2 / sample_rate
+                handler.audio_sent = stats["audio_seconds"]
         await stream.input_stream.end_stream()
 
-    # Instantiate our handler and start processing events
-    handler = MyEventHandler(stream.output_stream)
+    t1 = time.perf_counter()
     await asyncio.gather(write_chunks(), handler.handle_events())
+    finals = handler.finals()
+    return {
+        "file": audio_path,
+        "results": handler.results,
+        "transcript": " ".join(record["text"] for record in finals),
+        "wall_seconds": time.perf_counter() - t1,
+        "on_result_errors": len(handler.errors),
+        **stats,
+    }
+
+
+async def transcribe_files(
+    audio_paths: list,
+    client=None,
+    concurrency: int = 4,
+    region: str = "us-west-2",
+    **kwargs,
+) -> list:
+    """
+    Stream many recordings at once, each with its own handler.
+
+    Args:
+        audio_paths (list): Paths of the recordings.
+        client: Shared streaming client; one for `region` is created if None.
+        concurrency (int): Maximum number of simultaneous streams.
+        **kwargs: Passed to `stream_file`.
+
+    Returns:
+        list: The `stream_file` result for every path, in order.
+    """
+    client = client or TranscribeStreamingClient(region=region)
+    semaphore = asyncio.Semaphore(concurrency)
 
+    async def run(audio_path):
+        async with semaphore:
+            result = await stream_file(client, audio_path, **kwargs)
+            print(
+                f"{audio_path}: {result['audio_seconds']:.1f}s audio in "
+                f"{result['wall_seconds']:.1f}s, {len(result['results'])} results"
+            )
+            return result
 
-loop = asyncio.get_event_loop()
-loop.run_until_complete(basic_transcribe())
-loop.close()
+    return await asyncio.gather(*(run(audio_path) for audio_path in audio_paths))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stream recordings to Amazon Transcribe."
+    )
+    parser.add_argument("paths", nargs="*", default=["audio/isolation.wav"])
+    parser.add_argument("--region", default="us-west-2")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Multiple of real time to send at (0 for unpaced)",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", default="output_log/aws_transcription.json")
+    args = parser.parse_args()
+
+    paths = [
+        path
+        for pattern in args.paths
+        for path in (
+            sorted(glob.glob(os.path.join(pattern, "*.wav")))
+            if os.path.isdir(pattern)
+            else [pattern]
+        )
+    ]
+    results = asyncio.run(
+        transcribe_files(
+            paths,
+            concurrency=args.concurrency,
+            region=args.region,
+            chunk_ms=args.chunk_ms,
+            speed=args.speed or None,
+        )
+    )
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved as {args.output}")
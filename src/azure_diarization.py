@@ -2,6 +2,11 @@ import os
 import requests
 import json
 import utils
+import upload
+import audio_codecs
+from tracing import tracer
+from transcript import PhraseTable
+from response_cache import ResponseCache
 import time
 from dotenv import load_dotenv
 import asyncio
@@ -16,6 +21,9 @@ definition = {
     "profanityFilterMode": "None",
 }
 
+# Responses cached by uploaded audio, definition and API version
+response_cache = ResponseCache()
+
 
 async def setup_azure():
     """
@@ -33,58 +41,277 @@ async def setup_azure():
     return url, SPEECH_KEY
 
 
-async def transcribe_azure(definition, url, SPEECH_KEY):
+@tracer.traced("transcribe_azure")
+async def transcribe_azure(
+    definition,
+    url,
+    SPEECH_KEY,
+    audio_path=audio_file,
+    in_memory=False,
+    local_identify=False,
+    use_cache=True,
+    codec=audio_codecs.backend_codecs["azure"],
+    trim_silence=False,
+    roster=None,
+    output_dir="output_log",
+    echo=True,
+    dispatcher=None,
+):
     """
     Transcribe the audio file using Azure Speech service.
 
     Args:
         definition (dict): The definition for the transcription.
         url (str): The URL for the Azure Speech service.
+        audio_path (str): Path to the audio file to transcribe.
+        in_memory (bool): Stream the signature prefix and audio straight into the
+            request body instead of writing `.build/combined_audio.wav`.
+        local_identify (bool): Upload only the audio, without the signature prefix,
+            and name the diarized speakers locally with `speaker_embedding`.
+        use_cache (bool): Serve and store responses through `response_cache`;
+            pass False to always call the service.
+        codec (str): Upload codec, one of `audio_codecs.codecs`; defaults to
+            `audio_codecs.backend_codecs["azure"]`. Anything but "wav" ("flac" is
+            lossless, "opus" lossy) implies `in_memory`.
+        trim_silence (bool): Remove non-speech regions with `vad.trim_silence`
+            before uploading; phrase offsets are mapped back to the original
+            recording.
+        roster (list): Names of the speakers expected in the recording; only
+            their signatures are uploaded and the speaker IDs refer to them.
+        output_dir (str): Directory to write the transcript to.
+        echo (bool): Also print each phrase.
+        dispatcher (HedgedDispatcher): Send the request through
+            `hedged_dispatch` across several regions instead of to `url`.
+            Implies `in_memory`.
 
     Returns:
-        None
+        PhraseTable: The phrases spoken after the signature prefix, with offsets
+            on the recording's timeline, or None if the request failed.
     """
-    # Combine the file with signatures and generate speaker maps
-    speaker_maps, final_output_path = await utils.speaker_map_processor(audio_file)
-
-    # Open the audio file and prepare the request
-    with open(final_output_path, "rb") as file:
-        files = {
-            "audio": file,  # The audio file in binary mode
-            "definition": (
-                None,
-                json.dumps(definition),
-                "application/json",
-            ),  # Definition as JSON with content type
-        }
-
-        t1 = time.time()
-        # Send the POST request
-        response = requests.post(
-            url, headers={"Ocp-Apim-Subscription-Key": SPEECH_KEY}, files=files
+    headers = {"Ocp-Apim-Subscription-Key": SPEECH_KEY}
+    json_data = None
+    request_seconds = None
+
+    # Upload a speech-only copy and keep the table to undo the cuts
+    upload_path = audio_path
+    if trim_silence:
+        import vad
+
+        with tracer.span("vad"):
+            upload_path, remap, vad_report = vad.trim_silence(audio_path)
+
+    try:
+        if in_memory or local_identify or codec != "wav" or dispatcher is not None:
+            speaker_maps, prefix, segments = upload.roster_prefix(roster)
+            signs_duration = segments[-1][2]
+            if local_identify:
+                prefix, signs_duration = b"", 0.0
+
+            # Look the response up before decoding or encoding anything
+            if use_cache:
+                with tracer.span("response_cache"):
+                    audio_digest = await asyncio.to_thread(
+                        lambda: upload.upload_digest(
+                            upload_path, upload.prefix_digest(prefix), codec
+                        )
+                    )
+                    cache_key = response_cache.key(audio_digest, definition, url)
+                    json_data = response_cache.get(cache_key)
+
+            if json_data is None:
+                # Build the request body from the cached prefix and the streamed audio
+                with tracer.span("prepare") as span:
+                    # Compressed codecs are encoded here; keep that off the event loop
+                    body = await asyncio.to_thread(
+                        upload.MultipartAudioBody,
+                        definition,
+                        prefix,
+                        upload_path,
+                        codec=codec,
+                    )
+                    span.add_bytes(len(body))
+
+            if json_data is None and dispatcher is not None:
+                t1 = time.perf_counter()
+                # Hedged across regions; every duplicate gets a fresh body
+                response, dispatch = await dispatcher.post(
+                    lambda: upload.MultipartAudioBody(
+                        definition, prefix, upload_path, codec=codec
+                    ),
+                    body,
+                )
+                t2 = time.perf_counter()
+                request_seconds = t2 - t1
+                print(
+                    f"Time taken: {t2 - t1} seconds (endpoint {dispatch['endpoint']}"
+                    f"{', hedged' if dispatch['hedged'] else ''})"
+                )
+                tracer.record("dispatch", t1, t2, len(body), **dispatch)
+                if response is None:
+                    print("No endpoint could be reached.")
+                    return
+            elif json_data is None:
+                t1 = time.perf_counter()
+                # Send the POST request
+                response = requests.post(
+                    url,
+                    headers={**headers, "Content-Type": body.content_type},
+                    data=body,
+                )
+                t2 = time.perf_counter()
+                request_seconds = t2 - t1
+                print(f"Time taken: {t2 - t1} seconds")
+                # The body records when its last byte was handed to the socket
+                tracer.record("upload", t1, body.sent_at or t2, len(body))
+                tracer.record("provider", body.sent_at or t2, t2, len(response.content))
+        else:
+            # The signature prefix file is only rebuilt when the signatures change
+            speaker_maps, signs_path = await utils.signature_prefix_file(roster=roster)
+            signs_duration = await utils.get_wav_duration(signs_path)
+
+            # Look the response up before combining the recording with the prefix
+            if use_cache:
+                with tracer.span("response_cache"):
+                    audio_digest = await asyncio.to_thread(
+                        lambda: upload.upload_digest(
+                            upload_path, utils.file_digest(signs_path)
+                        )
+                    )
+                    cache_key = response_cache.key(audio_digest, definition, url)
+                    json_data = response_cache.get(cache_key)
+
+            if json_data is None:
+                final_output_path = await utils.prepend_signatures(
+                    signs_path, upload_path
+                )
+
+                # Open the audio file and prepare the request
+                with open(final_output_path, "rb") as file:
+                    files = {
+                        "audio": file,  # The audio file in binary mode
+                        "definition": (
+                            None,
+                            json.dumps(definition),
+                            "application/json",
+                        ),  # Definition as JSON with content type
+                    }
+
+                    t1 = time.perf_counter()
+                    # Send the POST request
+                    response = requests.post(url, headers=headers, files=files)
+                    t2 = time.perf_counter()
+                    request_seconds = t2 - t1
+                    print(f"Time taken: {t2 - t1} seconds")
+                    # Upload and service time cannot be told apart for a file body
+                    tracer.record(
+                        "upload_provider",
+                        t1,
+                        t2,
+                        os.path.getsize(final_output_path),
+                    )
+
+        if json_data is not None:
+            print("Served from the response cache.")
+        elif response.status_code == 200:
+            with tracer.span("parsing", len(response.content)):
+                json_data = response.json()
+            if use_cache:
+                response_cache.put(cache_key, json_data)
+        else:
+            print(f"Request failed with status code {response.status_code}")
+            print(response.text)
+            return
+
+        # Handle the response
+        if local_identify:
+            import speaker_embedding
+
+            # Map the anonymous speaker IDs to enrolled names by voice embedding
+            with tracer.span("identify"):
+                bank = speaker_embedding.SpeakerBank.from_signatures()
+                if roster is not None:
+                    keep = [
+                        i
+                        for i, name in enumerate(bank.names)
+                        if name in speaker_maps.values()
+                    ]
+                    bank = speaker_embedding.SpeakerBank(
+                        [bank.names[i] for i in keep], bank.embeddings[keep]
+                    )
+                speaker_maps = speaker_embedding.identify_speakers(
+                    upload_path, json_data, bank
+                )
+        if trim_silence:
+            json_data = remap.remap_response(json_data, int(signs_duration * 1000))
+            if request_seconds is not None and vad_report["kept_seconds"]:
+                # Assume service time scales with the uploaded audio length
+                saved = (
+                    request_seconds
+                    / (vad_report["kept_seconds"] + signs_duration)
+                    * vad_report["removed_seconds"]
+                )
+                print(
+                    f"VAD saved an estimated {saved:.1f}s of request time "
+                    f"(stage cost {vad_report['vad_seconds']:.2f}s)"
+                )
+        await save_transcript(
+            json_data, speaker_maps, signs_duration, audio_path, output_dir, echo
+        )
+        return (
+            PhraseTable.from_azure(json_data)
+            .rename(speaker_maps)
+            .after(signs_duration - 1)
+            .shift(-int(round(signs_duration * 1000)))
         )
-        t2 = time.time()
-        print(f"Time taken: {t2 - t1} seconds")
-
-    # Handle the response
-    if response.status_code == 200:
-        output_dir = "output_log"
-        os.makedirs(output_dir, exist_ok=True)
-        with open(
-            f"output/azure_diarization_output_{audio_file.split("/")[-1].split(".")[0]}.txt",
-            "w",
-        ) as f:
-            for i in await utils.parse_speaker_text(response.json(), speaker_maps):
-                if (
-                    float(i.split("Offset:")[-1].split("Duration:")[0])
-                    > await utils.get_wav_duration(".build/combined_signs.wav") - 1
-                ):
+    finally:
+        # The trimmed copy is private to this request
+        if upload_path != audio_path:
+            os.remove(upload_path)
+
+
+async def save_transcript(
+    json_data,
+    speaker_maps,
+    signs_duration,
+    audio_path,
+    output_dir="output_log",
+    echo=True,
+    name=None,
+):
+    """
+    Write the phrases spoken after the signature prefix to the output log.
+
+    Args:
+        json_data (dict): The transcription JSON response.
+        speaker_maps (dict): A dictionary mapping speaker IDs to speaker names.
+        signs_duration (float): Duration of the signature prefix in seconds.
+        audio_path (str): Path to the transcribed audio file.
+        output_dir (str): Directory to write the transcript to.
+        echo (bool): Also print each phrase.
+        name (str): Name of the transcript; defaults to the audio file's stem.
+
+    Returns:
+        str: Path to the written transcript.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    name = name or os.path.splitext(os.path.basename(audio_path))[0]
+    output_path = f"{output_dir}/azure_diarization_output_{name}.txt"
+
+    # Drop the phrases spoken during the signature prefix
+    with tracer.span("phrase_table"):
+        table = PhraseTable.from_azure(json_data).rename(speaker_maps)
+        table = table.after(signs_duration - 1)
+
+    with tracer.span("output") as span:
+        with open(output_path, "w") as f:
+            for i in table.render_text():
+                if echo:
                     print(i, end="\n\n")
-                    f.write(i + "\n\n")
-    else:
-        print(f"Request failed with status code {response.status_code}")
-        print(utils.parse_speaker_text(response.text))
+                f.write(i + "\n\n")
+        span.add_bytes(os.path.getsize(output_path))
+    return output_path
 
 
-url, SPEECH_KEY = asyncio.run(setup_azure())
-asyncio.run(transcribe_azure(definition, url, SPEECH_KEY))
+if __name__ == "__main__":
+    url, SPEECH_KEY = asyncio.run(setup_azure())
+    asyncio.run(transcribe_azure(definition, url, SPEECH_KEY))
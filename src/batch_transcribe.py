@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+import azure_diarization
+import upload
+import utils
+
+# Status codes worth retrying: throttling and transient server errors
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Seconds to connect, and to wait for each read of the response; the service
+# answers only once the whole recording is transcribed
+request_timeout = (10, 600)
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how many requests are started per second.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Wait until a request may be started.
+        """
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """
+    Create a session whose keep-alive pool can hold one connection per worker.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def collect_inputs(source: str) -> list:
+    """
+    Resolve a directory of recordings or a manifest into a list of audio paths.
+
+    A manifest is either a JSON list of paths or a text file with one path per
+    line; relative paths are resolved against the manifest's directory.
+
+    Args:
+        source (str): Directory or manifest path.
+
+    Returns:
+        list: Paths of the audio files to transcribe.
+    """
+    source_path = Path(source)
+    if source_path.is_dir():
+        return [
+            str(path)
+            for path in sorted(source_path.iterdir())
+            if path.suffix.lower() in utils.signature_formats
+        ]
+
+    with open(source_path, "r") as f:
+        if source_path.suffix == ".json":
+            entries = json.load(f)
+        else:
+            entries = [
+                line.strip() for line in f if line.strip() and not line.startswith("#")
+            ]
+    return [str(source_path.parent / entry) for entry in entries]
+
+
+def transcript_names(audio_paths: list) -> dict:
+    """
+    Name every recording's transcript by its stem, made unique across directories.
+
+    Recordings sharing a stem (`a/talk.wav`, `b/talk.wav`, `b/talk.flac`) get a
+    short digest of their resolved path appended, so none overwrites another.
+
+    Args:
+        audio_paths (list): Paths of the recordings.
+
+    Returns:
+        dict: Audio path to transcript name.
+    """
+    stems = [Path(audio_path).stem for audio_path in audio_paths]
+    names = {}
+    for audio_path, stem in zip(audio_paths, stems):
+        if stems.count(stem) > 1:
+            digest = hashlib.sha256(str(Path(audio_path).resolve()).encode())
+            stem = f"{stem}_{digest.hexdigest()[:8]}"
+        names[audio_path] = stem
+    return names
+
+
+def percentiles(values: list) -> dict:
+    """
+    Summarise a list of latencies.
+
+    Args:
+        values (list): Latencies in seconds.
+
+    Returns:
+        dict: p50/p90/p95/p99, mean and max, or an empty dict for no values.
+    """
+    if not values:
+        return {}
+    data = np.asarray(values)
+    p50, p90, p95, p99 = np.percentile(data, [50, 90, 95, 99])
+    return {
+        "p50": float(p50),
+        "p90": float(p90),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(data.mean()),
+        "max": float(data.max()),
+    }
+
+
+async def post_with_retry(
+    session,
+    url,
+    SPEECH_KEY,
+    definition,
+    audio_path,
+    limiter,
+    retries=4,
+    backoff=0.5,
+    make_body=None,
+    timeout=request_timeout,
+):
+    """
+    Upload one recording, retrying throttled and transient failures with backoff.
+
+    The request body is rebuilt for every attempt since it is a one-shot stream.
+    A `Retry-After` header from the service takes precedence over the
+    exponential backoff.
+
+    Args:
+        session (requests.Session): The shared session.
+        url (str): The URL for the Azure Speech service.
+        SPEECH_KEY (str): The subscription key.
+        definition (dict): The definition for the transcription.
+        audio_path (str): Path to the audio file to transcribe.
+        limiter (RateLimiter): Limits the request start rate.
+        retries (int): Maximum number of retries.
+        backoff (float): Base delay in seconds for exponential backoff.
+        make_body (callable): Builds a fresh `MultipartAudioBody` per attempt;
+            defaults to the signature prefix followed by the whole recording.
+        timeout (tuple): (connect, read) timeouts in seconds; a timed out
+            attempt is retried like a connection error.
+
+    Returns:
+        requests.Response: The last response (None if every attempt failed to connect).
+        int: Number of attempts made.
+        int: Bytes uploaded by the last attempt.
+    """
+    if make_body is None:
+        speaker_maps, prefix = upload.signature_prefix()
+
+        def make_body():
+            return upload.MultipartAudioBody(definition, prefix, audio_path)
+
+    response = None
+    size = 0
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        # The body reads the audio header as it is built; keep that off the loop
+        body = await asyncio.to_thread(make_body)
+        size = len(body)
+        delay = backoff * 2**attempt * (0.5 + random.random())
+        try:
+            response = await asyncio.to_thread(
+                session.post,
+                url,
+                headers={
+                    "Ocp-Apim-Subscription-Key": SPEECH_KEY,
+                    "Content-Type": body.content_type,
+                },
+                data=body,
+                timeout=timeout,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"Connection error for {audio_path}: {e}")
+            response = None
+        else:
+            if response.status_code not in retry_statuses:
+                return response, attempt + 1, size
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    delay = float(retry_after)
+                except ValueError:
+                    pass
+
+        if attempt < retries:
+            await asyncio.sleep(delay)
+    return response, retries + 1, size
+
+
+async def run_batch(
+    source,
+    url,
+    SPEECH_KEY,
+    definition=azure_diarization.definition,
+    concurrency=4,
+    rate=2.0,
+    retries=4,
+    output_dir="output_log",
+):
+    """
+    Transcribe every recording in a directory or manifest with bounded concurrency.
+
+    All uploads share one keep-alive connection pool. Each successful transcript
+    is written to `output_dir` like `transcribe_azure` does, and a summary with
+    throughput and latency percentiles is written next to them.
+
+    Args:
+        source (str): Directory or manifest of recordings.
+        url (str): The URL for the Azure Speech service.
+        SPEECH_KEY (str): The subscription key.
+        definition (dict): The definition for the transcription.
+        concurrency (int): Maximum number of requests in flight.
+        rate (float): Maximum request starts per second (0 disables the limit).
+        retries (int): Maximum retries per file for 429/5xx responses.
+        output_dir (str): Directory for transcripts and the summary.
+
+    Returns:
+        dict: The batch summary.
+    """
+    audio_paths = collect_inputs(source)
+    if not audio_paths:
+        raise ValueError(f"No audio files found in {source}.")
+
+    # Warm the signature prefix once so workers share the cached bytes
+    speaker_maps, prefix = upload.signature_prefix()
+    signs_duration = len(prefix) / 2 / 16000
+
+    names = transcript_names(audio_paths)
+    session = make_session(concurrency)
+    limiter = RateLimiter(rate, burst=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def worker(audio_path):
+        record = {
+            "file": audio_path,
+            "audio_seconds": None,
+            "attempts": 0,
+            "bytes_uploaded": 0,
+            "latency_seconds": None,
+            "status": None,
+            "error": None,
+        }
+        # One unreadable or failing file must not abort the rest of the batch
+        try:
+            record["audio_seconds"] = await utils.get_audio_duration(audio_path)
+            async with semaphore:
+                t1 = time.perf_counter()
+                response, attempts, size = await post_with_retry(
+                    session, url, SPEECH_KEY, definition, audio_path, limiter, retries
+                )
+                latency = time.perf_counter() - t1
+
+            record.update(
+                attempts=attempts,
+                bytes_uploaded=size,
+                latency_seconds=latency,
+                status=response.status_code if response is not None else None,
+            )
+            if response is not None and response.status_code == 200:
+                record["output"] = await azure_diarization.save_transcript(
+                    response.json(),
+                    speaker_maps,
+                    signs_duration,
+                    audio_path,
+                    output_dir=output_dir,
+                    echo=False,
+                    name=names[audio_path],
+                )
+            print(
+                f"{audio_path}: status {record['status']} in {latency:.2f}s ({attempts} attempt(s))"
+            )
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            print(f"{audio_path}: failed: {record['error']}")
+        results.append(record)
+
+    t1 = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker(audio_path) for audio_path in audio_paths))
+    finally:
+        session.close()
+    wall = time.perf_counter() - t1
+
+    succeeded = [r for r in results if r["status"] == 200 and r["error"] is None]
+    audio_seconds = sum(r["audio_seconds"] for r in succeeded)
+    summary = {
+        "source": source,
+        "files": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "retries": sum(max(r["attempts"] - 1, 0) for r in results),
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "files_per_second": len(results) / wall if wall else 0.0,
+        "audio_seconds_per_second": audio_seconds / wall if wall else 0.0,
+        "bytes_uploaded": sum(r["bytes_uploaded"] for r in results),
+        "latency_seconds": percentiles([r["latency_seconds"] for r in succeeded]),
+        "results": sorted(results, key=lambda r: r["file"]),
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    summary_path = os.path.join(output_dir, f"batch_summary_{int(time.time())}.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(
+        f"Transcribed {summary['succeeded']}/{summary['files']} files in {wall:.2f}s; "
+        f"summary saved as {summary_path}"
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Transcribe a directory or manifest of recordings with Azure."
+    )
+    parser.add_argument("source", help="Directory of recordings or manifest file")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests per second")
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--output-dir", default="output_log")
+    parser.add_argument(
+        "--url", help="Override the transcription URL (e.g. a mock_azure_server)"
+    )
+    args = parser.parse_args()
+
+    url, SPEECH_KEY = asyncio.run(azure_diarization.setup_azure())
+    if args.url:
+        url, SPEECH_KEY = args.url, SPEECH_KEY or "local"
+    asyncio.run(
+        run_batch(
+            args.source,
+            url,
+            SPEECH_KEY,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            retries=args.retries,
+            output_dir=args.output_dir,
+        )
+    )
@@ -0,0 +1,553 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import threading
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+import audio_pool
+import utils
+from tracing import tracer
+from transcript import PhraseTable
+
+# Preprocessing options of the Azure path, as `transcribe_azure` arguments
+azure_options = {
+    "baseline": {},
+    "in_memory": {"in_memory": True},
+    "flac": {"codec": "flac"},
+    "vad": {"in_memory": True, "trim_silence": True},
+}
+
+# Backends whose transcripts are synthetic and never scored for accuracy
+unscored_backends = {"mock"}
+
+# Frame length (seconds) of the diarization error rate timeline
+der_frame = 0.01
+
+
+def normalize_words(text: str) -> list:
+    """
+    Lower-case words without punctuation, as compared by `word_error_rate`.
+    """
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_error_rate(reference: list, hypothesis: list) -> dict:
+    """
+    Word error rate from the Levenshtein alignment of two word lists.
+
+    The edit-distance table is filled one reference word at a time with whole-row
+    NumPy operations; insertions within a row are resolved with a running
+    minimum, so no Python loop runs over hypothesis words.
+
+    Args:
+        reference (list): Reference words.
+        hypothesis (list): Hypothesis words.
+
+    Returns:
+        dict: `wer`, `errors` and `reference_words`.
+    """
+    if not reference:
+        return {
+            "wer": float(bool(hypothesis)),
+            "errors": len(hypothesis),
+            "reference_words": 0,
+        }
+    vocabulary = {word: i for i, word in enumerate(set(reference) | set(hypothesis))}
+    hyp = np.array([vocabulary[word] for word in hypothesis], dtype=np.int64)
+    steps = np.arange(len(hyp) + 1)
+    row = steps.copy()
+    for word in reference:
+        substitution = row[:-1] + (hyp != vocabulary[word])
+        candidate = np.concatenate(
+            ([row[0] + 1], np.minimum(substitution, row[1:] + 1))
+        )
+        row = np.minimum.accumulate(candidate - steps) + steps
+    errors = int(row[-1])
+    return {
+        "wer": errors / len(reference),
+        "errors": errors,
+        "reference_words": len(reference),
+    }
+
+
+def _frame_labels(table: PhraseTable, frames: int) -> np.ndarray:
+    # Speaker code per frame, -1 for silence; later phrases win on overlap
+    labels = np.full(frames, -1, dtype=np.int32)
+    starts = np.clip((table.offset_ms / 1000 / der_frame).astype(int), 0, frames)
+    stops = np.clip(
+        ((table.offset_ms + table.duration_ms) / 1000 / der_frame).astype(int),
+        0,
+        frames,
+    )
+    for start, stop, speaker in zip(starts, stops, table.speaker):
+        labels[start:stop] = speaker
+    return labels
+
+
+def diarization_error_rate(reference: PhraseTable, hypothesis: PhraseTable) -> dict:
+    """
+    Frame-level diarization error rate with the optimal speaker mapping.
+
+    Both transcripts are rasterised into `der_frame` frames, the reference and
+    hypothesis speaker co-occurrence matrix is counted with one `bincount`, and
+    hypothesis speakers are matched to reference speakers by the assignment that
+    maximises agreement.
+
+    Args:
+        reference (PhraseTable): Reference phrases on the recording timeline.
+        hypothesis (PhraseTable): Hypothesis phrases on the same timeline.
+
+    Returns:
+        dict: `der` and its `missed`, `false_alarm` and `confusion` parts as
+            fractions of reference speech.
+    """
+    end = max(
+        (reference.offset_ms + reference.duration_ms).max(initial=0),
+        (hypothesis.offset_ms + hypothesis.duration_ms).max(initial=0),
+    )
+    frames = int(end / 1000 / der_frame) + 1
+    ref = _frame_labels(reference, frames)
+    hyp = _frame_labels(hypothesis, frames)
+
+    speech = ref >= 0
+    total = int(speech.sum())
+    if total == 0:
+        return {"der": None, "missed": None, "false_alarm": None, "confusion": None}
+    missed = int((speech & (hyp < 0)).sum())
+    false_alarm = int((~speech & (hyp >= 0)).sum())
+
+    both = speech & (hyp >= 0)
+    n_ref, n_hyp = len(reference.labels), max(len(hypothesis.labels), 1)
+    overlap = np.bincount(
+        ref[both] * n_hyp + hyp[both], minlength=n_ref * n_hyp
+    ).reshape(n_ref, n_hyp)
+    rows, cols = linear_sum_assignment(-overlap)
+    confusion = int(both.sum() - overlap[rows, cols].sum())
+    return {
+        "der": (missed + false_alarm + confusion) / total,
+        "missed": missed / total,
+        "false_alarm": false_alarm / total,
+        "confusion": confusion / total,
+    }
+
+
+def load_reference(stem: str, reference_dir: str = "audio/references"):
+    """
+    Load the reference transcript of a recording.
+
+    `<reference_dir>/<stem>.json` holds Azure-shaped phrases on the recording
+    timeline and supports both DER and WER. Otherwise the hand-collected
+    `output_log/azure_diarization_output_<stem>.txt` is used for WER only, since
+    its offsets (when present) include the signature prefix of that run.
+
+    Args:
+        stem (str): File name of the recording without extension.
+        reference_dir (str): Directory of JSON references.
+
+    Returns:
+        PhraseTable: The reference, or None if there is none.
+        bool: Whether its timestamps can be used for DER.
+    """
+    json_path = os.path.join(reference_dir, f"{stem}.json")
+    if os.path.exists(json_path):
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        phrases = data.get("phrases", []) if isinstance(data, dict) else data
+        return PhraseTable.from_records(phrases), True
+
+    text_path = f"output_log/azure_diarization_output_{stem}.txt"
+    if not os.path.exists(text_path):
+        return None, False
+    with open(text_path, "r") as f:
+        blocks = f.read().split("\n\n")
+    records = []
+    for block in blocks:
+        fields = dict(
+            line.split(": ", 1) for line in block.strip().splitlines() if ": " in line
+        )
+        if "Speaker" in fields and "Text" in fields:
+            records.append(
+                {"speaker": fields["Speaker"], "text": fields["Text"].strip('"')}
+            )
+    return PhraseTable.from_records(records), False
+
+
+class PeakRSS:
+    """
+    Samples the resident set size on a background thread to find a run's peak.
+
+    Reads `/proc/self/statm` every `interval` seconds; where that file does not
+    exist the process-wide `ru_maxrss` is reported instead.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> int:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._sample())
+
+    def __enter__(self):
+        if os.path.exists("/proc/self/statm"):
+            self.peak = self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self._sample())
+        else:
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            scale = 1 if platform.system() == "Darwin" else 1024
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        return False
+
+
+async def run_azure(audio_path: str, url: str, SPEECH_KEY: str, options: dict):
+    """
+    Run the Azure path once and read the uploaded bytes from its trace.
+    """
+    import azure_diarization
+
+    # The run's own trace, so concurrent runs cannot mix their spans
+    with tracer.trace() as spans:
+        table = await azure_diarization.transcribe_azure(
+            azure_diarization.definition,
+            url,
+            SPEECH_KEY,
+            audio_path,
+            use_cache=False,
+            output_dir="output_log/benchmarks/transcripts",
+            echo=False,
+            **options,
+        )
+    uploaded = sum(
+        span["bytes"]
+        for span in spans
+        if span["stage"] in ("upload", "upload_provider")
+    )
+    return table, uploaded
+
+
+async def run_gcp(audio_path: str):
+    import gcp_diarization
+    import upload
+
+    phrases = await gcp_diarization.transcribe_gcp(
+        audio_path, output_dir="output_log/benchmarks/transcripts"
+    )
+    # Every streaming window carries the prefix; estimate from the PCM sizes
+    _, prefix = upload.signature_prefix()
+    return PhraseTable.from_records(phrases), len(prefix) + 2 * utils.pcm16_length(
+        audio_path
+    )
+
+
+async def run_aws(audio_path: str):
+    import aws_transcription
+
+    [result] = await aws_transcription.transcribe_files([audio_path], speed=None)
+    records = [
+        {
+            "speaker": record["speakers"][0] if record["speakers"] else "Speaker",
+            "offsetMilliseconds": int(record["start"] * 1000),
+            "durationMilliseconds": int((record["end"] - record["start"]) * 1000),
+            "text": record["text"],
+        }
+        for record in result["results"]
+        if not record["partial"]
+    ]
+    return PhraseTable.from_records(records), int(result["audio_seconds"] * 32000)
+
+
+async def run_benchmark(
+    audio_dir: str = "audio",
+    backends: list = ("mock",),
+    options: list = tuple(azure_options),
+    repeat: int = 1,
+    mock_seconds_per_audio_second: float = 0.01,
+    reference_dir: str = "audio/references",
+    require_references: bool = False,
+) -> dict:
+    """
+    Run every backend and preprocessing option over a corpus of recordings.
+
+    WER and DER are only reported for recordings with a reference (see
+    `load_reference`) and never for the mock, whose "Phrase N." transcripts
+    are placeholders; recordings without a reference are listed up front.
+
+    Args:
+        audio_dir (str): Directory of recordings.
+        backends (list): Any of "mock", "azure", "gcp" and "aws".
+        options (list): Keys of `azure_options`, applied to "azure" and "mock".
+        repeat (int): Runs per recording and configuration.
+        mock_seconds_per_audio_second (float): Simulated service time of the mock.
+        reference_dir (str): Directory of JSON reference transcripts.
+        require_references (bool): Raise instead of warning when a scored
+            backend would run on recordings without a reference.
+
+    Returns:
+        dict: Environment, one row per run and a summary per configuration.
+
+    Raises:
+        FileNotFoundError: If `require_references` is set and references are
+            missing.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    tracer.enabled = True
+    tracer.output_dir = "output_log/benchmarks/traces"
+
+    files = sorted(glob.glob(os.path.join(audio_dir, "*.wav")))
+    references = {
+        audio_path: load_reference(
+            os.path.splitext(os.path.basename(audio_path))[0], reference_dir
+        )
+        for audio_path in files
+    }
+    scored = set(backends) - unscored_backends
+    missing = [path for path in files if references[path][0] is None]
+    if missing and scored:
+        message = (
+            f"No reference transcript in {reference_dir}/ or output_log/ for "
+            f"{len(missing)} of {len(files)} recordings; WER and DER are not "
+            f"reported for: {', '.join(os.path.basename(p) for p in missing)}"
+        )
+        if require_references:
+            raise FileNotFoundError(message)
+        print(f"Warning: {message}")
+    if scored and not any(timed for _, timed in references.values()):
+        print(
+            f"Warning: no JSON references in {reference_dir}/, so DER is not reported"
+        )
+    if unscored_backends & set(backends):
+        print("The mock backend returns placeholder text; WER and DER are not scored")
+    # The file-path options combine every recording with the signatures; start
+    # the process pool once so its startup is not charged to the first run
+    await audio_pool.start()
+    runs = []
+    for backend in backends:
+        if backend == "mock":
+            from mock_azure_server import start_mock_server
+
+            server, url = start_mock_server(
+                seconds_per_audio_second=mock_seconds_per_audio_second
+            )
+            SPEECH_KEY = "local"
+        elif backend == "azure":
+            url = (
+                f"https://{os.getenv('SPEECH_REGION')}.api.cognitive.microsoft.com"
+                "/speechtotext/transcriptions:transcribe?api-version=2024-11-15"
+            )
+            SPEECH_KEY = os.getenv("SPEECH_KEY")
+        configurations = (
+            [(name, azure_options[name]) for name in options]
+            if backend in ("mock", "azure")
+            else [("default", None)]
+        )
+
+        for option, kwargs in configurations:
+            for audio_path in files:
+                duration = await utils.get_wav_duration(audio_path)
+                for attempt in range(repeat):
+                    row = {
+                        "backend": backend,
+                        "option": option,
+                        "file": audio_path,
+                        "attempt": attempt,
+                        "audio_seconds": duration,
+                    }
+                    try:
+                        with PeakRSS() as rss:
+                            t1 = time.perf_counter()
+                            if backend in ("mock", "azure"):
+                                table, uploaded = await run_azure(
+                                    audio_path, url, SPEECH_KEY, kwargs
+                                )
+                            elif backend == "gcp":
+                                table, uploaded = await run_gcp(audio_path)
+                            elif backend == "aws":
+                                table, uploaded = await run_aws(audio_path)
+                            else:
+                                raise ValueError(f"Unknown backend {backend}")
+                            wall = time.perf_counter() - t1
+                    except Exception as err:
+                        row.update(status="error", error=f"{type(err).__name__}: {err}")
+                        runs.append(row)
+                        print(f"{backend}/{option} {audio_path}: {row['error']}")
+                        continue
+                    if table is None:
+                        row.update(status="error", error="request failed")
+                        runs.append(row)
+                        continue
+
+                    row.update(
+                        status="ok",
+                        seconds=wall,
+                        rtf=wall / duration if duration else None,
+                        bytes_uploaded=uploaded,
+                        peak_rss=rss.peak,
+                    )
+                    reference, timed = references[audio_path]
+                    if reference is not None and backend not in unscored_backends:
+                        row.update(
+                            word_error_rate(
+                                normalize_words(" ".join(reference.text)),
+                                normalize_words(" ".join(table.text)),
+                            )
+                        )
+                        if timed:
+                            row.update(diarization_error_rate(reference, table))
+                    runs.append(row)
+                    print(
+                        f"{backend}/{option} {audio_path}: RTF {row['rtf']:.3f}, "
+                        f"{uploaded / 1e6:.2f} MB, WER {row.get('wer')}, DER {row.get('der')}"
+                    )
+        if backend == "mock":
+            server.shutdown()
+    audio_pool.shutdown()
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "commit": subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+            ).stdout.strip(),
+        },
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+
+
+def summarize(runs: list) -> dict:
+    """
+    Per-configuration totals: RTF, latency percentiles, bytes, RSS and errors.
+
+    Args:
+        runs (list): Rows from `run_benchmark`.
+
+    Returns:
+        dict: Summary keyed by "<backend>/<option>".
+    """
+    summary = {}
+    for key in sorted({f"{run['backend']}/{run['option']}" for run in runs}):
+        rows = [run for run in runs if f"{run['backend']}/{run['option']}" == key]
+        ok = [run for run in rows if run["status"] == "ok"]
+        seconds = np.array([run["seconds"] for run in ok])
+        audio = sum(run["audio_seconds"] for run in ok)
+
+        def mean(name):
+            values = [run[name] for run in ok if run.get(name) is not None]
+            return float(np.mean(values)) if values else None
+
+        summary[key] = {
+            "runs": len(rows),
+            "errors": len(rows) - len(ok),
+            "rtf": float(seconds.sum() / audio) if audio else None,
+            "p50_seconds": float(np.percentile(seconds, 50)) if len(ok) else None,
+            "p95_seconds": float(np.percentile(seconds, 95)) if len(ok) else None,
+            "bytes_uploaded": int(sum(run["bytes_uploaded"] for run in ok)),
+            "peak_rss": max((run["peak_rss"] for run in ok), default=None),
+            "wer": mean("wer"),
+            "der": mean("der"),
+        }
+    return summary
+
+
+def compare(baseline_path: str, candidate_path: str):
+    """
+    Print the change of every summary metric between two benchmark files.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["summary"]
+    with open(candidate_path, "r") as f:
+        candidate = json.load(f)["summary"]
+    for key in sorted(set(baseline) | set(candidate)):
+        print(key)
+        old, new = baseline.get(key, {}), candidate.get(key, {})
+        for metric in (
+            "rtf",
+            "p50_seconds",
+            "p95_seconds",
+            "bytes_uploaded",
+            "peak_rss",
+            "wer",
+            "der",
+        ):
+            a, b = old.get(metric), new.get(metric)
+            change = f"{(b - a) / a:+.1%}" if a and b is not None else ""
+            print(f"  {metric:>15}: {a} -> {b} {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark speed and accuracy of the transcription backends."
+    )
+    parser.add_argument("--audio-dir", default="audio")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["mock"],
+        choices=["mock", "azure", "gcp", "aws"],
+    )
+    parser.add_argument(
+        "--options", nargs="+", default=list(azure_options), choices=list(azure_options)
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--reference-dir", default="audio/references")
+    parser.add_argument(
+        "--require-references",
+        action="store_true",
+        help="Fail if a recording has no reference transcript",
+    )
+    parser.add_argument("--output", help="Result file (default: timestamped)")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CANDIDATE"),
+        help="Diff two result files",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        results = asyncio.run(
+            run_benchmark(
+                args.audio_dir,
+                args.backends,
+                args.options,
+                args.repeat,
+                reference_dir=args.reference_dir,
+                require_references=args.require_references,
+            )
+        )
+        output = args.output or f"output_log/benchmarks/bench_{int(time.time())}.json"
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved as {output}")
@@ -0,0 +1,314 @@
+import argparse
+import json
+import os
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+# Only the standard library is imported up front. Every subcommand imports the
+# provider SDK and numeric modules it needs when it runs, so `--help` and light
+# commands such as `duration` start without numpy, scipy, soundfile, PortAudio
+# or any cloud SDK.
+
+src_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Subcommands backed by an existing script, whose own arguments follow them
+delegated_scripts = {
+    "batch": "batch_transcribe",
+    "realtime": "real_time_azure",
+    "bench": "benchmark",
+    "serve": "transcription_service",
+    "schedule": "transcription_scheduler",
+}
+
+# Top-level packages that light commands must not import
+heavy_modules = (
+    "numpy",
+    "scipy",
+    "soundfile",
+    "sounddevice",
+    "requests",
+    "azure",
+    "google",
+    "amazon_transcribe",
+)
+
+# Cold-start budget in seconds for each measured command: median wall time
+# above that of a bare interpreter (`python -c pass`)
+startup_budget = {
+    "--help": 0.05,
+    "duration": 0.3,
+}
+
+
+async def enroll(args):
+    import utils
+    from signature_bank import SignatureBank
+
+    os.makedirs(args.signatures_path, exist_ok=True)
+    extension = os.path.splitext(args.file)[1].lower() if args.file else ".wav"
+    path = os.path.join(args.signatures_path, f"{args.name.lower()}{extension}")
+    if args.file:
+        shutil.copyfile(args.file, path)
+    else:
+        await utils.record_audio(path, args.seconds)
+
+    bank = SignatureBank()
+    bank.sync(args.signatures_path)
+    name = args.name.title()
+    print(f"Enrolled {name} with ID {bank.speakers[name]['id']} from {path}")
+
+
+async def transcribe(args):
+    import audio_codecs
+
+    codec = args.codec or audio_codecs.backend_codecs.get(args.backend)
+    if args.backend == "azure":
+        import azure_diarization
+
+        url, SPEECH_KEY = await azure_diarization.setup_azure()
+        if args.url:
+            url, SPEECH_KEY = args.url, SPEECH_KEY or "local"
+        dispatcher = None
+        if args.hedge:
+            import hedged_dispatch
+
+            dispatcher = hedged_dispatch.HedgedDispatcher.from_env()
+            url = dispatcher.endpoints[0].url
+        await azure_diarization.transcribe_azure(
+            azure_diarization.definition,
+            url,
+            SPEECH_KEY,
+            args.audio_path,
+            in_memory=args.in_memory,
+            local_identify=args.local_identify,
+            use_cache=not args.no_cache,
+            codec=codec,
+            trim_silence=args.trim_silence,
+            roster=args.roster,
+            output_dir=args.output_dir,
+            dispatcher=dispatcher,
+        )
+    elif args.backend == "gcp":
+        import gcp_diarization
+
+        await gcp_diarization.transcribe_gcp(
+            args.audio_path, codec=codec, output_dir=args.output_dir
+        )
+    else:
+        import aws_transcription
+
+        await aws_transcription.transcribe_files([args.audio_path])
+
+
+async def duration(args):
+    import audio_header
+
+    for audio_path in args.audio_paths:
+        print(f"{audio_path}: {await audio_header.get_wav_duration(audio_path):.3f}s")
+
+
+def import_profile(stderr: str) -> (dict, set):
+    """
+    Parse the output of `python -X importtime`.
+
+    Args:
+        stderr (str): The interpreter's stderr.
+
+    Returns:
+        dict: Cumulative import seconds of each module imported directly by
+            the entry point (nested imports are included in their importer).
+        set: Every module imported.
+    """
+    top_level = {}
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip())
+        # Nested imports are indented by two spaces per level
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative) / 1e6
+    return top_level, imported
+
+
+def measure_startup(command: list, runs: int = 5) -> dict:
+    """
+    Time cold starts of a command in fresh interpreters.
+
+    Args:
+        command (list): Interpreter arguments, e.g. ["cli.py", "--help"].
+        runs (int): Number of timed runs.
+
+    Returns:
+        dict: Wall times, import profile and the heavy modules it imported.
+    """
+    walls = []
+    for _ in range(runs):
+        t1 = time.perf_counter()
+        subprocess.run([sys.executable, *command], capture_output=True, check=True)
+        walls.append(time.perf_counter() - t1)
+
+    profiled = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules, imported = import_profile(profiled.stderr)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "command": command,
+        "wall_seconds": walls,
+        "median_seconds": statistics.median(walls),
+        "import_seconds": sum(modules.values()),
+        "slowest_imports": dict(slowest[:8]),
+        "heavy_imports": sorted(
+            {name.split(".")[0] for name in imported} & set(heavy_modules)
+        ),
+    }
+
+
+async def startup(args):
+    cli_path = os.path.join(src_dir, "cli.py")
+    commands = {
+        "--help": [cli_path, "--help"],
+        "duration": [cli_path, "duration", args.audio_path],
+    }
+    baseline = measure_startup(["-c", "pass"], args.runs)
+    print(f"python -c pass: {baseline['median_seconds'] * 1000:.0f} ms")
+    results = []
+    failed = False
+    for name, command in commands.items():
+        result = measure_startup(command, args.runs)
+        result["overhead_seconds"] = (
+            result["median_seconds"] - baseline["median_seconds"]
+        )
+        result["budget_seconds"] = startup_budget[name]
+        result["within_budget"] = (
+            result["overhead_seconds"] <= result["budget_seconds"]
+            and not result["heavy_imports"]
+        )
+        failed |= not result["within_budget"]
+        results.append(result)
+        print(
+            f"{' '.join(command[1:])}: +{result['overhead_seconds'] * 1000:.0f} ms "
+            f"(budget {result['budget_seconds'] * 1000:.0f} ms)"
+            + (
+                f"; heavy imports: {', '.join(result['heavy_imports'])}"
+                if result["heavy_imports"]
+                else ""
+            )
+        )
+
+    output = args.output or f"output_log/benchmarks/startup_{int(time.time())}.json"
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {"python": sys.version, "baseline": baseline, "results": results},
+            f,
+            indent=2,
+        )
+    print(f"Results saved as {output}")
+    if failed:
+        sys.exit(1)
+
+
+def run_script(name: str, argv: list):
+    """
+    Run one of the repository's scripts as `__main__` with the given arguments.
+    """
+    sys.argv = [os.path.join(src_dir, f"{name}.py"), *argv]
+    runpy.run_module(name, run_name="__main__", alter_sys=True)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Speaker diarization and transcription tools."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enroll_parser = commands.add_parser(
+        "enroll", help="Record or import a speaker signature"
+    )
+    enroll_parser.add_argument("name")
+    enroll_parser.add_argument("--file", help="Import this recording instead")
+    enroll_parser.add_argument("--seconds", type=int, default=5)
+    enroll_parser.add_argument(
+        "--signatures-path", default="known_speakers/audio_files/"
+    )
+
+    transcribe_parser = commands.add_parser(
+        "transcribe", help="Transcribe and diarize one recording"
+    )
+    transcribe_parser.add_argument("audio_path")
+    transcribe_parser.add_argument(
+        "--backend", choices=["azure", "gcp", "aws"], default="azure"
+    )
+    transcribe_parser.add_argument("--in-memory", action="store_true")
+    transcribe_parser.add_argument("--local-identify", action="store_true")
+    transcribe_parser.add_argument("--no-cache", action="store_true")
+    transcribe_parser.add_argument(
+        "--codec", help="Upload codec (default: audio_codecs.backend_codecs[backend])"
+    )
+    transcribe_parser.add_argument("--trim-silence", action="store_true")
+    transcribe_parser.add_argument("--roster", nargs="+")
+    transcribe_parser.add_argument("--output-dir", default="output_log")
+    transcribe_parser.add_argument(
+        "--url", help="Override the transcription URL (e.g. a mock_azure_server)"
+    )
+    transcribe_parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Hedge across the regions in SPEECH_REGIONS (see hedged_dispatch.py)",
+    )
+
+    duration_parser = commands.add_parser(
+        "duration", help="Print the duration of WAV files"
+    )
+    duration_parser.add_argument("audio_paths", nargs="+")
+
+    startup_parser = commands.add_parser(
+        "startup", help="Measure cold-start time against the startup budget"
+    )
+    startup_parser.add_argument("--audio-path", default="audio/test.wav")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--output", help="Result file (default: timestamped)")
+
+    for command, script in delegated_scripts.items():
+        delegated = commands.add_parser(
+            command,
+            help=f"Run src/{script}.py; arguments are passed through",
+            add_help=False,
+        )
+        delegated.add_argument("args", nargs=argparse.REMAINDER)
+    return parser
+
+
+def main(argv: list = None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Delegated scripts parse their own arguments, including --help
+    if argv and argv[0] in delegated_scripts:
+        run_script(delegated_scripts[argv[0]], argv[1:])
+        return
+    args = build_parser().parse_args(argv)
+    handler = {
+        "enroll": enroll,
+        "transcribe": transcribe,
+        "duration": duration,
+        "startup": startup,
+    }[args.command]
+
+    import asyncio
+
+    asyncio.run(handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+
+def compare_codecs(
+    audio_dir: str = "audio",
+    codec_names: list = ("wav", "flac", "opus"),
+    url: str = None,
+    SPEECH_KEY: str = None,
+    definition: dict = None,
+) -> list:
+    """
+    Measure upload size, encode time and optionally end-to-end latency per codec.
+
+    Every file in `audio_dir` is sent with the signature prefix exactly as
+    `transcribe_azure(in_memory=True, codec=...)` would send it. When `url` is
+    given each body is also posted once and the request time recorded.
+
+    Args:
+        audio_dir (str): Directory of recordings to measure.
+        codec_names (list): Codecs to compare; the first one is the baseline.
+        url (str): Transcription URL to time requests against (optional).
+        SPEECH_KEY (str): The subscription key for `url`.
+        definition (dict): The definition for the transcription.
+
+    Returns:
+        list: One result dict per file and codec.
+    """
+    import requests
+
+    import upload
+
+    speaker_maps, prefix = upload.signature_prefix()
+    definition = definition or {}
+    results = []
+    for audio_file in sorted(glob.glob(os.path.join(audio_dir, "*.wav"))):
+        baseline = None
+        for codec in codec_names:
+            t1 = time.perf_counter()
+            body = upload.MultipartAudioBody(
+                definition, prefix, audio_file, codec=codec
+            )
+            encode_seconds = time.perf_counter() - t1
+            size = len(body)
+            baseline = baseline or size
+            result = {
+                "file": audio_file,
+                "codec": codec,
+                "bytes": size,
+                "bytes_saved": baseline - size,
+                "ratio": size / baseline,
+                "encode_seconds": encode_seconds,
+            }
+            if url:
+                t1 = time.perf_counter()
+                response = requests.post(
+                    url,
+                    headers={
+                        "Ocp-Apim-Subscription-Key": SPEECH_KEY,
+                        "Content-Type": body.content_type,
+                    },
+                    data=body,
+                )
+                result["status"] = response.status_code
+                result["request_seconds"] = time.perf_counter() - t1
+                result["end_to_end_seconds"] = (
+                    encode_seconds + result["request_seconds"]
+                )
+            results.append(result)
+            print(
+                f"{audio_file} {codec:>5}: {size / 1e6:7.2f} MB "
+                f"({result['ratio']:.0%} of {codec_names[0]}), encode {encode_seconds:.3f}s"
+                + (f", end-to-end {result['end_to_end_seconds']:.3f}s" if url else "")
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare upload size and latency of WAV, FLAC and Opus."
+    )
+    parser.add_argument("--audio-dir", default="audio")
+    parser.add_argument("--codecs", nargs="+", default=["wav", "flac", "opus"])
+    parser.add_argument("--url", help="Transcription URL to time requests against")
+    parser.add_argument("--output", default="output_log/codec_comparison.json")
+    args = parser.parse_args()
+
+    SPEECH_KEY = os.getenv("SPEECH_KEY") or "local"
+    results = compare_codecs(args.audio_dir, args.codecs, args.url, SPEECH_KEY)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved as {args.output}")
@@ -1,22 +1,21 @@
 from google.cloud import speech_v1p1beta1 as speech
+import argparse
+import asyncio
 import os
 import json
+import time
 import utils
+import upload
+import audio_codecs
+import windowed_transcribe
+from transcript import PhraseTable
 
-# Define the path to the combined audio file
-audio_file = "data/audio/moderate_noise.wav"
+# Define the path to the audio file needed to be transcribed
+audio_file = "audio/moderate_noise.wav"
 
-# Combine the file with signatures and generate speaker maps
-speaker_maps = utils.pre_processor(audio_file)
-
-client = speech.SpeechClient()
-
-speech_file = ".build/combined_audio.wav"
-
-with open(speech_file, "rb") as audio_file:
-    content = audio_file.read()
-
-audio = speech.RecognitionAudio(content=content)
+# Audio limits of one synchronous request and one streaming session in seconds
+sync_limit_seconds = 60
+stream_limit_seconds = 290
 
 diarization_config = speech.SpeakerDiarizationConfig(
     enable_speaker_diarization=True,
@@ -24,38 +23,266 @@ diarization_config = speech.SpeakerDiarizationConfig(
     max_speaker_count=10,
 )
 
-config = speech.RecognitionConfig(
-    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-    sample_rate_hertz=16000,
-    language_code="en-IN",
-    diarization_config=diarization_config,
-)
 
-print("Waiting for operation to complete...")
-response = client.recognize(config=config, audio=audio)
-
-# Process the diarization results
-result = response.results[-1]
-words_info = result.alternatives[0].words
-
-# Group words by speaker
-speaker_transcriptions = {}
-for word_info in words_info:
-    speaker_tag = f"Speaker {word_info.speaker_tag}"
-    if speaker_tag not in speaker_transcriptions:
-        speaker_transcriptions[speaker_tag] = []
-    speaker_transcriptions[speaker_tag].append(word_info.word)
-
-# Create JSON structure
-final_output = []
-for speaker, words in speaker_transcriptions.items():
-    transcription = " ".join(words)
-    final_output.append({"speaker": speaker, "transcription": transcription})
-
-# Output as JSON
-output_file = "output/gcp_diarization_output.json"
-with open(output_file, "w") as f:
-    json.dump(final_output, f, indent=2)
-
-# Print the final JSON
-print(json.dumps(final_output, indent=2))
+def recognition_config(codec: str = "wav") -> speech.RecognitionConfig:
+    """
+    Recognition settings shared by the synchronous and streaming modes.
+
+    Args:
+        codec (str): "wav" for raw LINEAR16, "flac" or "opus".
+
+    Returns:
+        speech.RecognitionConfig: The config.
+    """
+    return speech.RecognitionConfig(
+        encoding={
+            "wav": speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            "flac": speech.RecognitionConfig.AudioEncoding.FLAC,
+            "opus": speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
+        }[codec],
+        sample_rate_hertz=16000,
+        language_code="en-IN",
+        diarization_config=diarization_config,
+    )
+
+
+def _seconds(duration) -> float:
+    # proto-plus returns timedelta, raw protobuf returns Duration
+    if hasattr(duration, "total_seconds"):
+        return duration.total_seconds()
+    return duration.seconds + duration.nanos / 1e9
+
+
+def collect_words(results) -> list:
+    """
+    Gather the diarized words of every final result, without duplicates.
+
+    Google repeats all words of a request in its last result, the only one that
+    carries speaker tags, so tagged words win and repeats of the same word at the
+    same time are dropped.
+
+    Args:
+        results: Recognition results (`SpeechRecognitionResult` or final
+            `StreamingRecognitionResult`).
+
+    Returns:
+        list: `WordInfo` objects in time order.
+    """
+    words = {}
+    for result in results:
+        if not result.alternatives:
+            continue
+        for word in result.alternatives[0].words:
+            key = (_seconds(word.start_time), _seconds(word.end_time), word.word)
+            if word.speaker_tag or key not in words:
+                words[key] = word
+    tagged = [word for word in words.values() if word.speaker_tag]
+    return tagged or list(words.values())
+
+
+def words_to_phrases(words_info, max_gap_ms: int = 1500) -> dict:
+    """
+    Rebuild speaker turns from diarized words in one pass.
+
+    Consecutive words by the same speaker become one phrase, split again where
+    the pause between them exceeds `max_gap_ms`. The result is shaped like the
+    Azure `transcriptions:transcribe` response, so both backends share
+    `PhraseTable` and the windowed stitching.
+
+    Args:
+        words_info (list): `WordInfo` objects in time order.
+        max_gap_ms (int): Longest pause inside one phrase.
+
+    Returns:
+        dict: {"phrases": [...]} with speaker, offset, duration, confidence and text.
+    """
+    starts = [int(_seconds(word.start_time) * 1000) for word in words_info]
+    ends = [int(_seconds(word.end_time) * 1000) for word in words_info]
+    table = PhraseTable.from_records(
+        [
+            {
+                "speaker": word.speaker_tag,
+                "offsetMilliseconds": start,
+                "durationMilliseconds": end - start,
+                "confidence": word.confidence or float("nan"),
+                "text": word.word,
+            }
+            for word, start, end in zip(words_info, starts, ends)
+        ]
+    )
+    return {"phrases": table.merge_turns(max_gap_ms).records()}
+
+
+def recognize_sync(client, prefix: bytes, audio_path: str, codec: str) -> dict:
+    """
+    Transcribe a short recording with one synchronous `recognize` request.
+
+    Args:
+        client (speech.SpeechClient): The client.
+        prefix (bytes): PCM signature prefix from `upload.signature_prefix`.
+        audio_path (str): Path to the audio file.
+        codec (str): Upload codec, see `audio_codecs.codecs`.
+
+    Returns:
+        dict: Azure-shaped phrases on the uploaded timeline.
+    """
+    content = audio_codecs.encode_pcm16(
+        [prefix, *utils.iter_pcm16(audio_path)], codec=codec
+    )
+    print(f"Uploading {len(content)} bytes of {codec}")
+    response = client.recognize(
+        config=recognition_config(codec),
+        audio=speech.RecognitionAudio(content=content),
+    )
+    return words_to_phrases(collect_words(response.results))
+
+
+def recognize_stream(
+    client, prefix: bytes, audio_path: str, start: float, stop: float, chunk_ms: int
+) -> dict:
+    """
+    Transcribe one window through `streaming_recognize`.
+
+    The signature prefix and the window are sent as raw PCM chunks while they
+    are decoded, so the window is never held in memory.
+
+    Args:
+        client (speech.SpeechClient): The client.
+        prefix (bytes): PCM signature prefix from `upload.signature_prefix`.
+        audio_path (str): Path to the audio file.
+        start (float): Window start in seconds.
+        stop (float): Window end in seconds.
+        chunk_ms (int): Audio per streaming request.
+
+    Returns:
+        dict: Azure-shaped phrases on the uploaded timeline.
+    """
+    chunk_bytes = 16000 * chunk_ms // 1000 * 2
+
+    def requests():
+        for i in range(0, len(prefix), chunk_bytes):
+            yield speech.StreamingRecognizeRequest(
+                audio_content=prefix[i : i + chunk_bytes]
+            )
+        for chunk in utils.pcm_chunks(audio_path, chunk_ms, start=start, stop=stop):
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    responses = client.streaming_recognize(
+        config=speech.StreamingRecognitionConfig(
+            config=recognition_config("wav"), interim_results=False
+        ),
+        requests=requests(),
+    )
+    results = [
+        result
+        for response in responses
+        for result in response.results
+        if result.is_final
+    ]
+    return words_to_phrases(collect_words(results))
+
+
+async def transcribe_gcp(
+    audio_path: str = audio_file,
+    mode: str = "stream",
+    window_seconds: float = None,
+    overlap_seconds: float = 10.0,
+    concurrency: int = 2,
+    chunk_ms: int = 100,
+    codec: str = audio_codecs.backend_codecs["gcp"],
+    output_dir: str = "output_log",
+) -> list:
+    """
+    Transcribe and diarize a recording with Google Speech-to-Text.
+
+    Every request starts with the signature prefix, whose segments name the
+    diarized speakers. "sync" sends one `recognize` request and is limited to
+    about a minute of audio in total. "stream" splits the recording into
+    overlapping windows that fit one streaming session each, streams them
+    concurrently and stitches them like `windowed_transcribe`.
+
+    Args:
+        audio_path (str): Path to the audio file to transcribe.
+        mode (str): "stream" or "sync".
+        window_seconds (float): Audio per streaming window; by default as much as
+            fits next to the prefix.
+        overlap_seconds (float): Overlap between consecutive windows.
+        concurrency (int): Maximum number of concurrent streams.
+        chunk_ms (int): Audio per streaming request.
+        codec (str): Upload codec of the "sync" mode.
+        output_dir (str): Directory to write the transcript to.
+
+    Returns:
+        list: Azure-shaped phrases on the recording timeline with speaker names.
+    """
+    client = speech.SpeechClient()
+    speaker_maps, prefix = upload.signature_prefix()
+    segments = upload.signature_segments()
+    signs_duration = len(prefix) / 2 / 16000
+    duration = await utils.get_wav_duration(audio_path)
+
+    t1 = time.perf_counter()
+    if mode == "sync":
+        if signs_duration + duration > sync_limit_seconds:
+            raise ValueError(
+                f"{duration:.0f}s of audio plus the {signs_duration:.0f}s prefix exceeds "
+                f"the {sync_limit_seconds}s synchronous limit; use mode='stream'."
+            )
+        windows = windowed_transcribe.plan_windows(duration, duration + 1, 0)
+        responses = [recognize_sync(client, prefix, audio_path, codec)]
+    elif mode == "stream":
+        window_seconds = window_seconds or stream_limit_seconds - signs_duration
+        if window_seconds <= overlap_seconds:
+            raise ValueError("The signature prefix leaves no room for audio.")
+        windows = windowed_transcribe.plan_windows(
+            duration, window_seconds, overlap_seconds
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(start, stop):
+            async with semaphore:
+                return await asyncio.to_thread(
+                    recognize_stream, client, prefix, audio_path, start, stop, chunk_ms
+                )
+
+        responses = await asyncio.gather(
+            *(run(start, stop) for start, stop, _, _ in windows)
+        )
+    else:
+        raise ValueError(f"Unknown mode {mode}; expected 'stream' or 'sync'.")
+    print(f"Time taken: {time.perf_counter() - t1} seconds ({len(windows)} window(s))")
+
+    phrases = windowed_transcribe.stitch_windows(
+        windows, responses, segments, speaker_maps, signs_duration, overlap_seconds
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(audio_path))[0]
+    output_path = f"{output_dir}/gcp_diarization_output_{stem}.txt"
+    with open(output_path, "w") as f:
+        for i in PhraseTable.from_records(phrases).render_text():
+            print(i, end="\n\n")
+            f.write(i + "\n\n")
+    with open(f"{output_dir}/gcp_diarization_output_{stem}.json", "w") as f:
+        json.dump(phrases, f, indent=2)
+    return phrases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Diarize a recording with Google Speech-to-Text."
+    )
+    parser.add_argument("audio_path", nargs="?", default=audio_file)
+    parser.add_argument("--mode", choices=["stream", "sync"], default="stream")
+    parser.add_argument("--window-seconds", type=float)
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    asyncio.run(
+        transcribe_gcp(
+            args.audio_path,
+            args.mode,
+            args.window_seconds,
+            concurrency=args.concurrency,
+        )
+    )
@@ -0,0 +1,461 @@
+import argparse
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+import batch_transcribe
+import upload
+
+api_path = "/speechtotext/transcriptions:transcribe?api-version=2024-11-15"
+
+
+class Endpoint:
+    """
+    One regional transcription endpoint and its recent latency.
+
+    Latencies are stored per second of uploaded audio (signature prefix
+    included), so recordings of different lengths share one distribution.
+    Samples older than `max_age` seconds are forgotten, which lets an endpoint
+    that was routed away from be tried again later. Attempts run on worker
+    threads, so samples and counters are only touched under `lock`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        SPEECH_KEY: str,
+        window: int = 200,
+        max_age: float = 300.0,
+    ):
+        self.name = name
+        self.url = url
+        self.SPEECH_KEY = SPEECH_KEY
+        self.max_age = max_age
+        # (monotonic time, seconds per audio second or None for a failure)
+        self.samples = deque(maxlen=window)
+        self.counts = {
+            "requests": 0,
+            "hedges": 0,
+            "wins": 0,
+            "cancelled": 0,
+            "errors": 0,
+        }
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float, audio_seconds: float, ok: bool):
+        """
+        Add the outcome of a finished request.
+        """
+        with self.lock:
+            self.samples.append(
+                (time.monotonic(), seconds / audio_seconds if ok else None)
+            )
+
+    def count(self, name: str):
+        """
+        Increment one of the `counts`.
+        """
+        with self.lock:
+            self.counts[name] += 1
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - self.max_age
+        with self.lock:
+            samples = list(self.samples)
+        return [ratio for stamp, ratio in samples if stamp >= cutoff]
+
+    def quantile(self, q: float, min_samples: int = 1, last: int = None) -> float:
+        """
+        Quantile of the recent successful latencies per audio second.
+
+        Args:
+            q (float): Quantile in [0, 1].
+            min_samples (int): Fewest samples to compute the quantile from.
+            last (int): Use only the most recent samples.
+
+        Returns:
+            float: The quantile, or None with fewer than `min_samples` samples.
+        """
+        ratios = [ratio for ratio in self._recent() if ratio is not None]
+        ratios = ratios[-last:] if last else ratios
+        if len(ratios) < min_samples:
+            return None
+        return float(np.quantile(ratios, q))
+
+    def error_rate(self) -> float:
+        """
+        Share of recent requests that failed.
+        """
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        return sum(ratio is None for ratio in recent) / len(recent)
+
+    def stats(self) -> dict:
+        ratios = [ratio for ratio in self._recent() if ratio is not None]
+        with self.lock:
+            counts = dict(self.counts)
+        return {
+            "name": self.name,
+            "samples": len(ratios),
+            "p50_per_audio_second": self.quantile(0.5),
+            "p95_per_audio_second": self.quantile(0.95),
+            "error_rate": self.error_rate(),
+            "last_error": self.last_error,
+            **counts,
+        }
+
+
+class _CancellableBody:
+    # Stops the upload as soon as the attempt is cancelled
+    def __init__(self, body, cancelled: threading.Event):
+        self.body = body
+        self.cancelled = cancelled
+
+    def __len__(self) -> int:
+        return len(self.body)
+
+    def __iter__(self):
+        for chunk in self.body:
+            if self.cancelled.is_set():
+                raise ConnectionAbortedError("Hedged request cancelled")
+            yield chunk
+
+
+class HedgedDispatcher:
+    """
+    Sends each transcription request to the best endpoint and hedges slow ones.
+
+    The request goes to the first healthy endpoint in configuration order. If
+    it has not answered within the lowest rolling `hedge_quantile` latency of
+    any endpoint (scaled to the request's audio length) or fails with a
+    retryable status, a duplicate goes to the next endpoint. Taking the lowest
+    keeps hedging early while the primary itself is degraded. The first usable response wins and the other
+    attempt is cancelled: an upload still in progress is aborted, and a
+    response that arrives later is discarded after its latency is recorded.
+
+    An endpoint counts as degraded, and is moved behind the others, when the
+    median of its last `degrade_window` latencies exceeds `degrade_ratio` times
+    the best endpoint's or more than `max_error_rate` of its recent requests
+    failed. Losing attempts keep their worker thread until the endpoint
+    answers, so requests run on a dedicated thread pool.
+    """
+
+    def __init__(
+        self,
+        endpoints: list,
+        hedge_quantile: float = 0.95,
+        min_samples: int = 20,
+        initial_hedge_ratio: float = 1.0,
+        max_hedges: int = 1,
+        degrade_ratio: float = 2.0,
+        degrade_window: int = 20,
+        max_error_rate: float = 0.5,
+        pool_size: int = 4,
+        timeout: float = 300.0,
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required.")
+        self.endpoints = endpoints
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.initial_hedge_ratio = initial_hedge_ratio
+        self.max_hedges = max_hedges
+        self.degrade_ratio = degrade_ratio
+        self.degrade_window = degrade_window
+        self.max_error_rate = max_error_rate
+        self.timeout = timeout
+        self.session = batch_transcribe.make_session(pool_size)
+        self.executor = ThreadPoolExecutor(2 * pool_size * (max_hedges + 1))
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "HedgedDispatcher":
+        """
+        Build a dispatcher from `SPEECH_REGIONS`, a comma-separated list of
+        regions in order of preference. Each region uses `SPEECH_KEY_<REGION>`
+        if set, else `SPEECH_KEY`.
+        """
+        load_dotenv()
+        regions = os.getenv("SPEECH_REGIONS") or os.getenv("SPEECH_REGION") or ""
+        endpoints = [
+            Endpoint(
+                region,
+                f"https://{region}.api.cognitive.microsoft.com{api_path}",
+                os.getenv(f"SPEECH_KEY_{region.upper()}") or os.getenv("SPEECH_KEY"),
+            )
+            for region in (region.strip() for region in regions.split(","))
+            if region
+        ]
+        return cls(endpoints, **kwargs)
+
+    def degraded(self, endpoint: Endpoint) -> bool:
+        """
+        Whether requests should prefer other endpoints over this one.
+        """
+        if endpoint.error_rate() > self.max_error_rate:
+            return True
+        window = (0.5, self.min_samples, self.degrade_window)
+        p50 = endpoint.quantile(*window)
+        if p50 is None:
+            return False
+        medians = [e.quantile(*window) for e in self.endpoints]
+        best = min(m for m in medians if m is not None)
+        return p50 > self.degrade_ratio * best
+
+    def ranked(self) -> list:
+        """
+        Endpoints in the order they should be tried.
+        """
+        return sorted(self.endpoints, key=self.degraded)
+
+    def hedge_delay(self, audio_seconds: float) -> float:
+        """
+        How long to wait for an attempt before sending a hedged duplicate.
+        """
+        ratios = [
+            endpoint.quantile(self.hedge_quantile, self.min_samples)
+            for endpoint in self.endpoints
+        ]
+        ratios = [ratio for ratio in ratios if ratio is not None]
+        return (min(ratios) if ratios else self.initial_hedge_ratio) * audio_seconds
+
+    def _send(self, endpoint, body, audio_seconds, cancelled):
+        # Runs in a worker thread; records the latency even for a losing attempt
+        t1 = time.perf_counter()
+        try:
+            response = self.session.post(
+                endpoint.url,
+                headers={
+                    "Ocp-Apim-Subscription-Key": endpoint.SPEECH_KEY,
+                    "Content-Type": body.content_type,
+                },
+                data=_CancellableBody(body, cancelled),
+                timeout=self.timeout,
+            )
+        except Exception as e:
+            # Any failure of one attempt, including building or streaming its
+            # body, leaves the hedge to the other endpoints
+            if cancelled.is_set():
+                endpoint.count("cancelled")
+            else:
+                endpoint.record(time.perf_counter() - t1, audio_seconds, False)
+                endpoint.count("errors")
+                endpoint.last_error = f"{type(e).__name__}: {e}"
+            return None
+        ok = response.status_code not in batch_transcribe.retry_statuses
+        endpoint.record(time.perf_counter() - t1, audio_seconds, ok)
+        if cancelled.is_set():
+            response.close()
+        return response
+
+    async def post(self, make_body, body=None) -> (requests.Response, dict):
+        """
+        Send one request with hedging.
+
+        Args:
+            make_body (callable): Builds a fresh `MultipartAudioBody`; called
+                once more for every hedged duplicate.
+            body (MultipartAudioBody): Body of the first attempt, if already
+                built.
+
+        Returns:
+            requests.Response: The winning response, or the last failure (None
+                if no endpoint could be reached).
+            dict: The endpoint that answered, whether the request was hedged and
+                the latency.
+        """
+        t1 = time.perf_counter()
+        candidates = self.ranked()[: self.max_hedges + 1]
+        body = body if body is not None else await asyncio.to_thread(make_body)
+        audio_seconds = body.num_frames / body.sample_rate
+        attempts = {}
+        loop = asyncio.get_running_loop()
+
+        def launch(endpoint, body):
+            cancelled = threading.Event()
+            task = loop.run_in_executor(
+                self.executor,
+                functools.partial(self._send, endpoint, body, audio_seconds, cancelled),
+            )
+            endpoint.count("requests")
+            attempts[task] = (endpoint, cancelled)
+            return task
+
+        launch(candidates[0], body)
+        deadline = t1 + self.hedge_delay(audio_seconds)
+        pending = set(attempts)
+        response = winner = None
+        while pending:
+            more = len(attempts) < len(candidates)
+            timeout = max(0.0, deadline - time.perf_counter()) if more else None
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            failed = False
+            for task in done:
+                response = task.result()
+                if (
+                    response is not None
+                    and response.status_code not in batch_transcribe.retry_statuses
+                ):
+                    winner = attempts[task][0]
+                    break
+                failed = True
+            if winner is not None:
+                break
+            # Hedge when the current attempt is late or has failed
+            if more and (failed or time.perf_counter() >= deadline):
+                endpoint = candidates[len(attempts)]
+                endpoint.count("hedges")
+                pending.add(launch(endpoint, await asyncio.to_thread(make_body)))
+                deadline = time.perf_counter() + self.hedge_delay(audio_seconds)
+
+        for task in pending:
+            attempts[task][1].set()
+        if winner is not None:
+            winner.count("wins")
+        return response, {
+            "endpoint": winner.name if winner is not None else None,
+            "hedged": len(attempts) > 1,
+            "seconds": time.perf_counter() - t1,
+        }
+
+    def stats(self) -> list:
+        """
+        Latency and counters of every endpoint.
+        """
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+async def simulate(
+    audio_path: str = "audio/test.wav",
+    requests_count: int = 200,
+    concurrency: int = 4,
+    latency: float = 0.2,
+    slow_rate: float = 0.05,
+    slow_latency: float = 2.0,
+) -> dict:
+    """
+    Compare plain and hedged dispatch against local servers that inject delays.
+
+    Two `mock_azure_server` instances stand in for two regions; each delays a
+    random `slow_rate` share of its requests by `slow_latency`. A third phase
+    makes the primary slow for most requests to show routing away from it.
+
+    Returns:
+        dict: Latency percentiles and endpoint statistics per phase.
+    """
+    import azure_diarization
+    import mock_azure_server
+
+    speaker_maps, prefix, _ = upload.roster_prefix()
+
+    def make_body():
+        return upload.MultipartAudioBody(
+            azure_diarization.definition, prefix, audio_path
+        )
+
+    servers = []
+    for name in ("primary", "secondary"):
+        server, url = mock_azure_server.start_mock_server(
+            latency=latency, slow_rate=slow_rate, slow_latency=slow_latency
+        )
+        servers.append((name, server, url))
+
+    # The degraded phase keeps the hedged dispatcher and its latency history
+    phases = ["single_region", "hedged", "degraded_primary"]
+    report = {}
+    try:
+        for phase in phases:
+            if phase == "single_region":
+                dispatcher = HedgedDispatcher(
+                    [Endpoint(name, url, "local") for name, _, url in servers],
+                    max_hedges=0,
+                    pool_size=2 * concurrency,
+                )
+            elif phase == "hedged":
+                dispatcher.close()
+                dispatcher = HedgedDispatcher(
+                    [Endpoint(name, url, "local") for name, _, url in servers],
+                    min_samples=10,
+                    pool_size=2 * concurrency,
+                )
+            else:
+                servers[0][1].slow_rate = 0.8
+            wins_before = {e.name: e.counts["wins"] for e in dispatcher.endpoints}
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+            hedged = 0
+
+            async def one():
+                nonlocal hedged
+                async with semaphore:
+                    response, info = await dispatcher.post(make_body)
+                    if response is None or response.status_code != 200:
+                        raise RuntimeError(f"Request failed: {info}")
+                    latencies.append(info["seconds"])
+                    hedged += info["hedged"]
+
+            await asyncio.gather(*(one() for _ in range(requests_count)))
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            wins = {
+                e.name: e.counts["wins"] - wins_before[e.name]
+                for e in dispatcher.endpoints
+            }
+            report[phase] = {
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(max(latencies)),
+                "hedged": hedged,
+                "wins": wins,
+                "endpoints": dispatcher.stats(),
+            }
+            print(
+                f"{phase:>16}: p50 {p50:.3f}s  p95 {p95:.3f}s  p99 {p99:.3f}s  "
+                f"hedged {hedged}/{requests_count}  "
+                + "  ".join(f"{name} {count} wins" for name, count in wins.items())
+            )
+        dispatcher.close()
+    finally:
+        for _, server, _ in servers:
+            server.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate hedged multi-region dispatch against local servers."
+    )
+    parser.add_argument("--audio-path", default="audio/test.wav")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    asyncio.run(
+        simulate(
+            args.audio_path,
+            args.requests,
+            args.concurrency,
+            args.latency,
+            args.slow_rate,
+            args.slow_latency,
+        )
+    )
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from amazon_transcribe.model import (
+    Alternative,
+    Item,
+    Result,
+    Transcript,
+    TranscriptEvent,
+)
+
+
+class MockInputStream:
+    """
+    Receiving side of a stand-in stream: counts audio and checks the send rate.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    async def send_audio_event(self, audio_chunk: bytes):
+        stream = self.stream
+        if stream.ended:
+            raise RuntimeError("send_audio_event after end_stream")
+        if stream.started is None:
+            stream.started = time.perf_counter()
+        stream.received += len(audio_chunk)
+        stream.chunks += 1
+        # Audio ahead of the allowed multiple of real time is a violation
+        audio_seconds = stream.received / 2 / stream.sample_rate
+        elapsed = time.perf_counter() - stream.started
+        if stream.max_speed and audio_seconds > (elapsed + 0.5) * stream.max_speed:
+            stream.rate_violations += 1
+        await stream.audio.put(audio_seconds)
+
+    async def end_stream(self):
+        self.stream.ended = True
+        await self.stream.audio.put(None)
+
+
+class MockStream:
+    """
+    Stand-in for the object returned by `start_stream_transcription`.
+
+    Every `result_seconds` of received audio produces a partial result, and once
+    the segment is complete a final one, each delayed by `latency`. The output
+    stream yields real `amazon_transcribe.model.TranscriptEvent` objects, so the
+    SDK's `TranscriptResultStreamHandler` dispatches them as usual.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        latency: float = 0.05,
+        result_seconds: float = 2.0,
+        max_speed: float = None,
+        speakers: int = 2,
+    ):
+        self.sample_rate = sample_rate
+        self.latency = latency
+        self.result_seconds = result_seconds
+        self.max_speed = max_speed
+        self.speakers = speakers
+        self.audio = asyncio.Queue()
+        self.received = 0
+        self.chunks = 0
+        self.rate_violations = 0
+        self.started = None
+        self.ended = False
+        self.input_stream = MockInputStream(self)
+        self.output_stream = self._events()
+
+    def _event(self, index: int, start: float, end: float, partial: bool):
+        speaker = str(index % self.speakers)
+        text = f"Segment {index + 1}" + ("" if partial else ".")
+        item = Item(
+            start_time=start,
+            end_time=end,
+            item_type="pronunciation",
+            content=text,
+            speaker=speaker,
+        )
+        result = Result(
+            result_id=f"result-{index}",
+            start_time=start,
+            end_time=end,
+            is_partial=partial,
+            alternatives=[Alternative(transcript=text, items=[item])],
+        )
+        return TranscriptEvent(transcript=Transcript(results=[result]))
+
+    async def _events(self):
+        index = 0
+        segment_start = 0.0
+        partial_sent = False
+        audio_seconds = 0.0
+        while (received := await self.audio.get()) is not None:
+            audio_seconds = received
+            if not partial_sent and audio_seconds - segment_start > 0.5:
+                await asyncio.sleep(self.latency)
+                yield self._event(index, segment_start, audio_seconds, True)
+                partial_sent = True
+            if audio_seconds - segment_start >= self.result_seconds:
+                await asyncio.sleep(self.latency)
+                yield self._event(index, segment_start, audio_seconds, False)
+                index += 1
+                segment_start = audio_seconds
+                partial_sent = False
+        if audio_seconds > segment_start:
+            await asyncio.sleep(self.latency)
+            yield self._event(index, segment_start, audio_seconds, False)
+
+
+class MockTranscribeStreamingClient:
+    """
+    Local stand-in for `TranscribeStreamingClient` with the same stream API.
+
+    Args:
+        latency (float): Delay before every result event.
+        result_seconds (float): Audio covered by each final result.
+        max_speed (float): Multiple of real time above which sends count as
+            rate violations (None disables the check).
+    """
+
+    def __init__(
+        self, latency: float = 0.05, result_seconds: float = 2.0, max_speed=None
+    ):
+        self.latency = latency
+        self.result_seconds = result_seconds
+        self.max_speed = max_speed
+        self.streams = []
+
+    async def start_stream_transcription(
+        self, language_code: str, media_sample_rate_hz: int, media_encoding: str, **_
+    ) -> MockStream:
+        if media_encoding != "pcm":
+            raise ValueError(f"Unsupported media encoding {media_encoding}")
+        stream = MockStream(
+            media_sample_rate_hz, self.latency, self.result_seconds, self.max_speed
+        )
+        self.streams.append(stream)
+        return stream
@@ -0,0 +1,193 @@
+import queue
+import threading
+import time
+
+import azure.cognitiveservices.speech as speechsdk
+
+
+class MockPushStream:
+    """
+    Stand-in for `speechsdk.audio.PushAudioInputStream` that counts the audio.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.received = 0
+        self.audio = queue.Queue()
+
+    def write(self, audio_buffer: bytes):
+        self.received += len(audio_buffer)
+        self.audio.put(self.received / 2 / self.sample_rate)
+
+    def close(self):
+        self.audio.put(None)
+
+
+class MockSignal:
+    """
+    Stand-in for an SDK event signal: callbacks run in connection order.
+    """
+
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def emit(self, evt):
+        for callback in self.callbacks:
+            callback(evt)
+
+
+class MockResult:
+    def __init__(self, reason, text: str, speaker_id: str, start: float, end: float):
+        self.reason = reason
+        self.text = text
+        self.speaker_id = speaker_id
+        # The SDK reports offsets and durations in 100 ns ticks
+        self.offset = int(start * 10_000_000)
+        self.duration = int((end - start) * 10_000_000)
+
+
+class MockEvent:
+    def __init__(self, result: MockResult = None):
+        self.result = result
+
+
+class MockFuture:
+    def get(self):
+        return None
+
+
+class MockConversationTranscriber:
+    """
+    Local stand-in for `speechsdk.transcription.ConversationTranscriber`.
+
+    A reader thread follows the push stream: every `partial_seconds` of audio
+    in an utterance produces a `transcribing` result and every
+    `utterance_seconds` a `transcribed` one, each due `latency` seconds later.
+    A single dispatcher thread delivers them, like the SDK's callback thread, so
+    a slow callback delays every later result of the session.
+
+    Args:
+        stream (MockPushStream): The audio source.
+        latency (float): Service delay before every result.
+        partial_seconds (float): Audio between partial results.
+        utterance_seconds (float): Audio covered by each final result.
+        speakers (int): Number of speaker IDs to rotate through.
+    """
+
+    def __init__(
+        self,
+        stream: MockPushStream,
+        latency: float = 0.2,
+        partial_seconds: float = 0.5,
+        utterance_seconds: float = 3.0,
+        speakers: int = 2,
+    ):
+        self.stream = stream
+        self.latency = latency
+        self.partial_seconds = partial_seconds
+        self.utterance_seconds = utterance_seconds
+        self.speakers = speakers
+        self.transcribing = MockSignal()
+        self.transcribed = MockSignal()
+        self.session_started = MockSignal()
+        self.session_stopped = MockSignal()
+        self.canceled = MockSignal()
+        self.results = queue.Queue()
+        self.threads = []
+
+    def _result(self, index: int, start: float, end: float, final: bool):
+        reason = (
+            speechsdk.ResultReason.RecognizedSpeech
+            if final
+            else speechsdk.ResultReason.RecognizingSpeech
+        )
+        text = f"Utterance {index + 1}" + ("." if final else "")
+        speaker = f"Guest-{index % self.speakers + 1}"
+        signal = self.transcribed if final else self.transcribing
+        self.results.put(
+            (
+                time.perf_counter() + self.latency,
+                signal,
+                MockEvent(MockResult(reason, text, speaker, start, end)),
+            )
+        )
+
+    def _read(self):
+        index = 0
+        start = 0.0
+        partial_at = start + self.partial_seconds
+        audio_seconds = 0.0
+        while (received := self.stream.audio.get()) is not None:
+            audio_seconds = received
+            if audio_seconds >= partial_at:
+                self._result(index, start, audio_seconds, False)
+                partial_at = audio_seconds + self.partial_seconds
+            if audio_seconds - start >= self.utterance_seconds:
+                self._result(index, start, audio_seconds, True)
+                index += 1
+                start = audio_seconds
+                partial_at = start + self.partial_seconds
+        if audio_seconds > start:
+            self._result(index, start, audio_seconds, True)
+        self.results.put((time.perf_counter() + self.latency, None, None))
+
+    def _dispatch(self):
+        self.session_started.emit(MockEvent())
+        while True:
+            due, signal, evt = self.results.get()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if signal is None:
+                break
+            signal.emit(evt)
+        self.session_stopped.emit(MockEvent())
+
+    def start_transcribing_async(self) -> MockFuture:
+        self.threads = [
+            threading.Thread(target=self._read, daemon=True),
+            threading.Thread(target=self._dispatch, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        return MockFuture()
+
+    def stop_transcribing_async(self) -> MockFuture:
+        return MockFuture()
+
+
+class MockTranscriberFactory:
+    """
+    Builds mock push streams and transcribers for `realtime_sessions`.
+
+    Called as `factory(sample_rate, stopped)`, like the SDK-backed factory, and
+    returns `(stream, transcriber)`; `stopped` is set when the session ends.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        partial_seconds: float = 0.5,
+        utterance_seconds: float = 3.0,
+        speakers: int = 2,
+    ):
+        self.latency = latency
+        self.partial_seconds = partial_seconds
+        self.utterance_seconds = utterance_seconds
+        self.speakers = speakers
+
+    def __call__(self, sample_rate: int, stopped: threading.Event):
+        stream = MockPushStream(sample_rate)
+        transcriber = MockConversationTranscriber(
+            stream,
+            self.latency,
+            self.partial_seconds,
+            self.utterance_seconds,
+            self.speakers,
+        )
+        transcriber.session_stopped.connect(lambda evt: stopped.set())
+        transcriber.canceled.connect(lambda evt: stopped.set())
+        return stream, transcriber
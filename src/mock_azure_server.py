@@ -0,0 +1,421 @@
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import uuid
+
+import soundfile as sf
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Path of the fast transcription endpoint imitated by the stand-in server
+transcribe_path = "/speechtotext/transcriptions:transcribe"
+
+# Batch transcription API: submit, then poll the job and fetch its result files
+submit_path = "/speechtotext/transcriptions:submit"
+jobs_path = "/speechtotext/transcriptions/"
+
+# Stand-in blob container that batch jobs read their audio from
+blobs_path = "/blobs/"
+results_path = "/results/"
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+    """
+    Split a multipart/form-data body into its named parts.
+
+    Args:
+        content_type (str): The request Content-Type header.
+        body (bytes): The raw request body.
+
+    Returns:
+        dict: Part name to decoded payload bytes.
+    """
+    message = BytesParser().parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    return {
+        part.get_param("name", header="content-disposition"): part.get_payload(
+            decode=True
+        )
+        for part in message.get_payload()
+    }
+
+
+def fake_phrases(duration: float, phrase_seconds: float = 5.0, speakers: int = 3):
+    """
+    Produce a deterministic `phrases` list covering an audio duration.
+
+    Args:
+        duration (float): Audio duration in seconds.
+        phrase_seconds (float): Length of each fake phrase.
+        speakers (int): Number of speakers to rotate through.
+
+    Returns:
+        list: Phrases shaped like the `transcriptions:transcribe` response.
+    """
+    phrases = []
+    offset = 0.0
+    i = 0
+    while offset < duration:
+        length = min(phrase_seconds, duration - offset)
+        phrases.append(
+            {
+                "speaker": i % speakers + 1,
+                "offsetMilliseconds": int(offset * 1000),
+                "durationMilliseconds": int(length * 1000),
+                "text": f"Phrase {i + 1}.",
+                "confidence": 0.9,
+            }
+        )
+        offset += phrase_seconds
+        i += 1
+    return phrases
+
+
+def batch_result(duration: float, source: str) -> dict:
+    """
+    Produce the result file of a batch transcription covering an audio duration.
+
+    Args:
+        duration (float): Audio duration in seconds.
+        source (str): URL of the transcribed audio.
+
+    Returns:
+        dict: A result file shaped like the batch API's `Transcription` file,
+            with the same phrases `fake_phrases` gives the fast endpoint.
+    """
+    return {
+        "source": source,
+        "durationMilliseconds": int(duration * 1000),
+        "recognizedPhrases": [
+            {
+                "recognitionStatus": "Success",
+                "channel": 0,
+                "speaker": phrase["speaker"],
+                "offsetMilliseconds": phrase["offsetMilliseconds"],
+                "durationMilliseconds": phrase["durationMilliseconds"],
+                "offsetInTicks": phrase["offsetMilliseconds"] * 10_000,
+                "durationInTicks": phrase["durationMilliseconds"] * 10_000,
+                "nBest": [
+                    {
+                        "confidence": phrase["confidence"],
+                        "lexical": phrase["text"].rstrip(".").lower(),
+                        "display": phrase["text"],
+                    }
+                ],
+            }
+            for phrase in fake_phrases(duration)
+        ],
+    }
+
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    """
+    Request handler imitating the Azure `transcriptions:transcribe` endpoint.
+
+    Behaviour is configured through attributes on the server: `latency` (seconds
+    per request), `seconds_per_audio_second` (extra latency proportional to the
+    audio length), `failure_rate` (probability of answering 429/503),
+    `slow_rate` and `slow_latency` (probability and length of an extra delay
+    imitating a degraded region), `fast_max_seconds` (longest audio the fast
+    endpoint accepts) and `require_key` (reject requests without a subscription
+    key).
+
+    It also imitates the batch API: audio is PUT into `blobs_path`, a job
+    submitted to `submit_path` stays `NotStarted` for `batch_latency` seconds
+    and `Running` for `batch_seconds_per_audio_second` per second of audio, and
+    then lists a result file under `results_path`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except ConnectionError:
+            # The client gave up on this request, e.g. a cancelled hedge
+            self.close_connection = True
+
+    def _authorized(self) -> bool:
+        server = self.server
+        if server.require_key and not self.headers.get("Ocp-Apim-Subscription-Key"):
+            self._reply(401, {"error": {"code": "Unauthorized"}})
+            return False
+        if random.random() < server.failure_rate:
+            status = random.choice([429, 503])
+            self._reply(status, {"error": {"code": "Throttled"}}, {"Retry-After": "0"})
+            return False
+        return True
+
+    def _job_url(self, job_id: str, suffix: str = "") -> str:
+        return (
+            f"http://{self.headers['Host']}{jobs_path}{job_id}{suffix}"
+            "?api-version=2024-11-15"
+        )
+
+    def _job(self, job: dict) -> dict:
+        elapsed = time.monotonic() - job["created"]
+        if job["error"]:
+            status = "Failed"
+        elif elapsed < self.server.batch_latency:
+            status = "NotStarted"
+        elif elapsed < job["running_seconds"] + self.server.batch_latency:
+            status = "Running"
+        else:
+            status = "Succeeded"
+        payload = {
+            "self": self._job_url(job["id"]),
+            "displayName": job["displayName"],
+            "status": status,
+            "links": {"files": self._job_url(job["id"], "/files")},
+            "properties": {},
+        }
+        if job["error"]:
+            payload["properties"]["error"] = {
+                "code": "InvalidData",
+                "message": job["error"],
+            }
+        return payload
+
+    def _submit(self, body: bytes):
+        server = self.server
+        try:
+            request = json.loads(body)
+            content_url = request["contentUrls"][0]
+        except (KeyError, IndexError, TypeError, ValueError):
+            self._reply(400, {"error": {"code": "InvalidPayload"}})
+            return
+        job = {
+            "id": uuid.uuid4().hex,
+            "displayName": request.get("displayName", ""),
+            "created": time.monotonic(),
+            "source": content_url,
+            "duration": 0.0,
+            "running_seconds": 0.0,
+            "error": None,
+        }
+        blob = server.blobs.get(content_url.split(blobs_path, 1)[-1].split("?")[0])
+        try:
+            job["duration"] = sf.info(io.BytesIO(blob)).duration
+            job["running_seconds"] = (
+                job["duration"] * server.batch_seconds_per_audio_second
+            )
+        except (TypeError, RuntimeError):
+            job["error"] = f"Cannot read audio from {content_url}."
+        with server.lock:
+            server.jobs[job["id"]] = job
+        self._reply(201, self._job(job), {"Location": self._job_url(job["id"])})
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.startswith(blobs_path):
+            self._reply(404, {"error": {"code": "NotFound"}})
+            return
+        if self.headers.get("x-ms-blob-type") != "BlockBlob":
+            self._reply(400, {"error": {"code": "MissingRequiredHeader"}})
+            return
+        with self.server.lock:
+            self.server.blobs[self.path[len(blobs_path) :].split("?")[0]] = body
+        self._reply(201, {})
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?")[0]
+        if path.startswith(results_path):
+            job = server.jobs.get(path[len(results_path) :].removesuffix(".json"))
+            if job is None:
+                self._reply(404, {"error": {"code": "NotFound"}})
+                return
+            self._reply(200, batch_result(job["duration"], job["source"]))
+            return
+        if not path.startswith(jobs_path):
+            self._reply(404, {"error": {"code": "NotFound"}})
+            return
+        with server.lock:
+            server.polls += 1
+        if not self._authorized():
+            return
+        job_id, _, files = path[len(jobs_path) :].partition("/")
+        job = server.jobs.get(job_id)
+        if job is None:
+            self._reply(404, {"error": {"code": "NotFound"}})
+            return
+        if not files:
+            self._reply(200, self._job(job))
+            return
+        values = []
+        if self._job(job)["status"] == "Succeeded":
+            host = self.headers["Host"]
+            values = [
+                {
+                    "kind": "Transcription",
+                    "links": {
+                        "contentUrl": f"http://{host}{results_path}{job_id}.json"
+                    },
+                },
+                {"kind": "TranscriptionReport", "links": {"contentUrl": ""}},
+            ]
+        self._reply(200, {"values": values})
+
+    def do_DELETE(self):
+        server = self.server
+        path = self.path.split("?")[0]
+        if path.startswith(blobs_path):
+            with server.lock:
+                server.blobs.pop(path[len(blobs_path) :], None)
+            self.send_response(202)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with server.lock:
+            job = server.jobs.pop(path[len(jobs_path) :], None)
+        if not path.startswith(jobs_path) or job is None:
+            self._reply(404, {"error": {"code": "NotFound"}})
+            return
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+
+        if self.path.startswith(submit_path):
+            if self._authorized():
+                self._submit(body)
+            return
+        if not self.path.startswith(transcribe_path):
+            self._reply(404, {"error": {"code": "NotFound"}})
+            return
+        if not self._authorized():
+            return
+
+        try:
+            parts = parse_multipart(self.headers["Content-Type"], body)
+            duration = sf.info(io.BytesIO(parts["audio"])).duration
+            json.loads(parts["definition"])
+        except (KeyError, TypeError, ValueError, RuntimeError):
+            self._reply(400, {"error": {"code": "InvalidRequest"}})
+            return
+        if server.fast_max_seconds and duration > server.fast_max_seconds:
+            self._reply(400, {"error": {"code": "InvalidAudioLength"}})
+            return
+
+        delay = server.latency + duration * server.seconds_per_audio_second
+        if random.random() < server.slow_rate:
+            delay += server.slow_latency
+        time.sleep(delay)
+        self._reply(
+            200,
+            {
+                "durationMilliseconds": int(duration * 1000),
+                "phrases": fake_phrases(duration),
+            },
+        )
+
+
+def start_mock_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    seconds_per_audio_second: float = 0.0,
+    failure_rate: float = 0.0,
+    require_key: bool = True,
+    slow_rate: float = 0.0,
+    slow_latency: float = 0.0,
+    fast_max_seconds: float = None,
+    batch_latency: float = 0.0,
+    batch_seconds_per_audio_second: float = 0.0,
+) -> (ThreadingHTTPServer, str):
+    """
+    Start the stand-in Azure server on a background thread.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 for any free port.
+        latency (float): Fixed latency added to every successful request.
+        seconds_per_audio_second (float): Latency added per second of audio.
+        failure_rate (float): Probability of answering with 429 or 503.
+        require_key (bool): Reject requests without a subscription key.
+        slow_rate (float): Probability of delaying a request by `slow_latency`.
+        slow_latency (float): Extra latency of slow requests.
+        fast_max_seconds (float): Longest audio accepted by the fast endpoint
+            (None for no limit).
+        batch_latency (float): Time a batch job spends queued.
+        batch_seconds_per_audio_second (float): Time a batch job spends
+            running per second of audio.
+
+    Returns:
+        ThreadingHTTPServer: The running server (call `shutdown()` to stop it).
+        str: The transcription URL served by it.
+    """
+    server = ThreadingHTTPServer((host, port), MockAzureHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.seconds_per_audio_second = seconds_per_audio_second
+    server.failure_rate = failure_rate
+    server.require_key = require_key
+    server.slow_rate = slow_rate
+    server.slow_latency = slow_latency
+    server.fast_max_seconds = fast_max_seconds
+    server.batch_latency = batch_latency
+    server.batch_seconds_per_audio_second = batch_seconds_per_audio_second
+    server.blobs = {}
+    server.jobs = {}
+    server.polls = 0
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://{host}:{server.server_port}{transcribe_path}?api-version=2024-11-15"
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the Azure fast and batch transcription APIs."
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--seconds-per-audio-second", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=0.0)
+    parser.add_argument("--fast-max-seconds", type=float)
+    parser.add_argument("--batch-latency", type=float, default=0.0)
+    parser.add_argument("--batch-seconds-per-audio-second", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(
+        port=args.port,
+        latency=args.latency,
+        seconds_per_audio_second=args.seconds_per_audio_second,
+        failure_rate=args.failure_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        fast_max_seconds=args.fast_max_seconds,
+        batch_latency=args.batch_latency,
+        batch_seconds_per_audio_second=args.batch_seconds_per_audio_second,
+    )
+    print(f"Serving mock transcription endpoint at {url}")
+    print(f"Blob container for batch jobs at {url.split(transcribe_path)[0]}/blobs")
+    try:
+        while True:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,7 +1,18 @@
+import argparse
+import json
 import os
+import threading
 import time
+from pathlib import Path
+
+import numpy as np
 import azure.cognitiveservices.speech as speechsdk
 
+import utils
+
+# Latency histogram bin edges in milliseconds, fixed so runs can be compared
+latency_bins = [0, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000]
+
 
 # Transcriber helper functions
 def conversation_transcriber_transcribed_cb(evt: speechsdk.SpeechRecognitionEventArgs):
@@ -33,7 +44,162 @@ def conversation_transcriber_session_stopped_cb(evt: speechsdk.SessionEventArgs)
     print("Session Stopped: {}".format(evt))
 
 
-def recognize_from_microphone():
+class RingBuffer:
+    """
+    Fixed-size byte ring buffer shared by one writer and one reader thread.
+
+    `write` blocks while the buffer is full and `read` blocks until data arrives
+    or the writer calls `close`, so decoding runs ahead of the pusher by at most
+    `capacity` bytes.
+    """
+
+    def __init__(self, capacity: int):
+        self.buffer = np.zeros(capacity, dtype=np.uint8)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, data: bytes):
+        """
+        Append bytes, waiting for free space as needed.
+        """
+        data = np.frombuffer(data, dtype=np.uint8)
+        while len(data):
+            with self.condition:
+                while self.size == self.capacity:
+                    self.condition.wait()
+                n = min(len(data), self.capacity - self.size)
+                end = (self.start + self.size) % self.capacity
+                first = min(n, self.capacity - end)
+                self.buffer[end : end + first] = data[:first]
+                self.buffer[: n - first] = data[first:n]
+                self.size += n
+                self.condition.notify_all()
+            data = data[n:]
+
+    def read(self, n: int) -> bytes:
+        """
+        Take up to `n` bytes; returns b"" once the buffer is closed and drained.
+        """
+        with self.condition:
+            while self.size == 0 and not self.closed:
+                self.condition.wait()
+            n = min(n, self.size)
+            first = min(n, self.capacity - self.start)
+            data = (
+                self.buffer[self.start : self.start + first].tobytes()
+                + self.buffer[: n - first].tobytes()
+            )
+            self.start = (self.start + n) % self.capacity
+            self.size -= n
+            self.condition.notify_all()
+            return data
+
+    def close(self):
+        """
+        Mark the end of the stream.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class LatencyTracker:
+    """
+    Per-utterance latency from pushing audio to receiving its results.
+
+    The pusher records how many milliseconds of audio had been written at each
+    wall-clock time. A result covering audio up to `offset + duration` is
+    compared with the time that audio was sent: the first `transcribing` partial
+    of an utterance gives the partial latency and `transcribed` the final one.
+    """
+
+    def __init__(self):
+        self.sent_ms = [0]
+        self.sent_at = [time.perf_counter()]
+        self.partial_ms = {}
+        self.final_ms = {}
+        self.lock = threading.Lock()
+
+    def sent(self, audio_ms: int):
+        """
+        Record that audio up to `audio_ms` has been pushed.
+        """
+        with self.lock:
+            self.sent_ms.append(audio_ms)
+            self.sent_at.append(time.perf_counter())
+
+    def _latency(self, offset: int, duration: int, received: float) -> float:
+        # SDK offsets and durations are in 100 ns ticks
+        end_ms = (offset + duration) // 10_000
+        with self.lock:
+            i = np.searchsorted(self.sent_ms, end_ms, side="left")
+            sent_at = self.sent_at[min(i, len(self.sent_at) - 1)]
+        return (received - sent_at) * 1000
+
+    def observe(self, final: bool, offset: int, duration: int, received: float):
+        """
+        Record a result received at `received` (`time.perf_counter()`).
+
+        Args:
+            final (bool): A `transcribed` result rather than a partial.
+            offset (int): Result offset in 100 ns ticks.
+            duration (int): Result duration in 100 ns ticks.
+            received (float): When the SDK delivered the result.
+        """
+        if final:
+            self.final_ms[offset] = self._latency(offset, duration, received)
+        elif offset not in self.partial_ms:
+            self.partial_ms[offset] = self._latency(offset, duration, received)
+
+    def transcribing(self, evt: speechsdk.SpeechRecognitionEventArgs):
+        self.observe(False, evt.result.offset, evt.result.duration, time.perf_counter())
+
+    def transcribed(self, evt: speechsdk.SpeechRecognitionEventArgs):
+        if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech:
+            self.observe(
+                True, evt.result.offset, evt.result.duration, time.perf_counter()
+            )
+
+    def report(self) -> dict:
+        """
+        Histograms and percentiles of the partial and final latencies.
+
+        Returns:
+            dict: For "partial" and "final", the utterance count, p50/p95/p99 and
+                the histogram counts over `latency_bins` (the last bin is open).
+        """
+        report = {"bins_ms": latency_bins}
+        for name, values in (("partial", self.partial_ms), ("final", self.final_ms)):
+            values = np.fromiter(values.values(), dtype=np.float64)
+            counts, _ = np.histogram(
+                np.minimum(values, latency_bins[-1]), bins=latency_bins + [np.inf]
+            )
+            report[name] = {
+                "utterances": len(values),
+                "p50_ms": float(np.percentile(values, 50)) if len(values) else None,
+                "p95_ms": float(np.percentile(values, 95)) if len(values) else None,
+                "p99_ms": float(np.percentile(values, 99)) if len(values) else None,
+                "histogram": counts.tolist(),
+            }
+        return report
+
+
+def create_transcriber(audio_config, stopped: threading.Event, echo: bool = True):
+    """
+    Create a conversation transcriber with the printing callbacks connected.
+
+    Args:
+        audio_config (speechsdk.audio.AudioConfig): The audio source.
+        stopped (threading.Event): Set when the session stops or is canceled.
+        echo (bool): Connect the printing callbacks; without them the caller
+            handles every event itself.
+
+    Returns:
+        speechsdk.transcription.ConversationTranscriber: The transcriber.
+    """
     speech_config = speechsdk.SpeechConfig(
         subscription=os.environ.get("SPEECH_KEY"),
         region=os.environ.get("SPEECH_REGION"),
@@ -46,20 +212,20 @@ def recognize_from_microphone():
         value="false",
     )
 
-    # Use the microphone as the audio input
-    audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
-
     # Create a conversation transcriber
     conversation_transcriber = speechsdk.transcription.ConversationTranscriber(
         speech_config=speech_config, audio_config=audio_config
     )
 
-    transcribing_stop = False
-
     def stop_cb(evt: speechsdk.SessionEventArgs):
-        print("Stopping transcription due to event: {}".format(evt))
-        nonlocal transcribing_stop
-        transcribing_stop = True
+        if echo:
+            print("Stopping transcription due to event: {}".format(evt))
+        stopped.set()
+
+    conversation_transcriber.session_stopped.connect(stop_cb)
+    conversation_transcriber.canceled.connect(stop_cb)
+    if not echo:
+        return conversation_transcriber
 
     # Connect callbacks to the events fired by the conversation transcriber
     conversation_transcriber.transcribed.connect(
@@ -77,25 +243,197 @@ def recognize_from_microphone():
     conversation_transcriber.canceled.connect(
         conversation_transcriber_recognition_canceled_cb
     )
-    conversation_transcriber.session_stopped.connect(stop_cb)
-    conversation_transcriber.canceled.connect(stop_cb)
+    return conversation_transcriber
+
+
+def recognize_from_microphone():
+    # Use the microphone as the audio input
+    audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
+    stopped = threading.Event()
+    conversation_transcriber = create_transcriber(audio_config, stopped)
 
     # Start continuous transcription
     conversation_transcriber.start_transcribing_async()
 
     print("Transcriber Started. Speak into the mic.\n Press Ctrl+C to stop.")
     try:
-        while True:
-            time.sleep(0.5)
+        while not stopped.wait(0.5):
+            pass
     except KeyboardInterrupt:
         print("Stopping transcription...")
 
     conversation_transcriber.stop_transcribing_async()
 
 
+def pump_file(
+    audio_path: str,
+    stream,
+    tracker: LatencyTracker,
+    realtime: bool = True,
+    chunk_ms: int = 100,
+    ring_seconds: float = 5.0,
+    sample_rate: int = 16000,
+) -> float:
+    """
+    Decode a recording into a push stream, then close the stream.
+
+    A decoder thread fills a ring buffer with 16-bit mono PCM; the pusher takes
+    `chunk_ms` of audio at a time and writes it to the push stream, either paced
+    to the audio clock (`realtime`) or as fast as the service accepts it. Returns
+    once everything has been pushed.
+
+    Args:
+        audio_path (str): Path to the audio file to replay.
+        stream (speechsdk.audio.PushAudioInputStream): The push stream.
+        tracker (LatencyTracker): Told how much audio has been pushed.
+        realtime (bool): Pace the pushes to real time instead of sending flat out.
+        chunk_ms (int): Audio pushed per write.
+        ring_seconds (float): Capacity of the ring buffer in seconds of audio.
+        sample_rate (int): Sample rate sent to the service.
+
+    Returns:
+        float: CPU seconds used by the decoder and pusher threads.
+
+    Raises:
+        Exception: Whatever decoding or pushing raised; the stream is closed
+            first either way.
+    """
+    bytes_per_ms = sample_rate * 2 // 1000
+    ring = RingBuffer(int(ring_seconds * 1000) * bytes_per_ms)
+    cpu = {}
+
+    errors = []
+
+    def decode():
+        # The ring is closed even if decoding fails, so the pusher never hangs
+        try:
+            for block in utils.iter_pcm16(audio_path, sample_rate):
+                ring.write(block.astype("<i2").tobytes())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            ring.close()
+            cpu["decode"] = time.thread_time()
+
+    def push():
+        pushed = 0
+        started = time.perf_counter()
+        try:
+            while chunk := ring.read(chunk_ms * bytes_per_ms):
+                if realtime:
+                    delay = started + pushed / bytes_per_ms / 1000 - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                stream.write(chunk)
+                pushed += len(chunk)
+                tracker.sent(pushed // bytes_per_ms)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stream.close()
+            cpu["push"] = time.thread_time()
+
+    threads = [threading.Thread(target=decode), threading.Thread(target=push)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return sum(cpu.values())
+
+
+def recognize_from_file(
+    audio_path: str,
+    realtime: bool = True,
+    chunk_ms: int = 100,
+    ring_seconds: float = 5.0,
+    sample_rate: int = 16000,
+    output_dir: str = "output_log",
+    stop_timeout: float = 30.0,
+) -> dict:
+    """
+    Replay a recording through a push stream and measure result latency.
+
+    The recording is pushed with `pump_file`, either paced to the audio clock
+    (`realtime`) or as fast as the service accepts it.
+
+    Args:
+        audio_path (str): Path to the audio file to replay.
+        realtime (bool): Pace the pushes to real time instead of sending flat out.
+        chunk_ms (int): Audio pushed per write.
+        ring_seconds (float): Capacity of the ring buffer in seconds of audio.
+        sample_rate (int): Sample rate sent to the service.
+        output_dir (str): Directory for the latency report.
+        stop_timeout (float): Seconds to wait, after the last push, for the
+            service to deliver its final results and stop the session.
+
+    Returns:
+        dict: The latency report, also written as JSON to `output_dir`.
+    """
+    stream = speechsdk.audio.PushAudioInputStream(
+        stream_format=speechsdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate, bits_per_sample=16, channels=1
+        )
+    )
+    stopped = threading.Event()
+    conversation_transcriber = create_transcriber(
+        speechsdk.audio.AudioConfig(stream=stream), stopped
+    )
+    tracker = LatencyTracker()
+    conversation_transcriber.transcribing.connect(tracker.transcribing)
+    conversation_transcriber.transcribed.connect(tracker.transcribed)
+
+    conversation_transcriber.start_transcribing_async().get()
+    t1 = time.perf_counter()
+    try:
+        pump_file(
+            audio_path, stream, tracker, realtime, chunk_ms, ring_seconds, sample_rate
+        )
+        if not stopped.wait(stop_timeout):
+            print(f"Session did not stop within {stop_timeout}s of the last push")
+    finally:
+        conversation_transcriber.stop_transcribing_async().get()
+
+    report = {
+        "file": audio_path,
+        "mode": "realtime" if realtime else "fast",
+        "chunk_ms": chunk_ms,
+        "audio_seconds": tracker.sent_ms[-1] / 1000,
+        "wall_seconds": time.perf_counter() - t1,
+        **tracker.report(),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(
+        output_dir,
+        f"realtime_latency_{Path(audio_path).stem}_{report['mode']}_{int(time.time())}.json",
+    )
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    for name in ("partial", "final"):
+        print(
+            f"{name}: {report[name]['utterances']} utterances, "
+            f"p50 {report[name]['p50_ms']} ms, p95 {report[name]['p95_ms']} ms"
+        )
+    print(f"Latency report saved as {output_path}")
+    return report
+
+
 # Main entry point
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Real-time diarization from the microphone or a replayed file."
+    )
+    parser.add_argument("--file", help="Replay this recording instead of the mic")
+    parser.add_argument(
+        "--fast", action="store_true", help="Push the file as fast as possible"
+    )
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    args = parser.parse_args()
     try:
-        recognize_from_microphone()
+        if args.file:
+            recognize_from_file(args.file, not args.fast, args.chunk_ms)
+        else:
+            recognize_from_microphone()
     except Exception as err:
         print("Encountered an exception: {}".format(err))
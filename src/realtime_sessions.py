@@ -0,0 +1,397 @@
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import azure.cognitiveservices.speech as speechsdk
+
+import real_time_azure
+
+
+class RecognitionEvent:
+    """
+    A result copied out of an SDK callback, with the time it was received.
+    """
+
+    __slots__ = (
+        "session",
+        "final",
+        "text",
+        "speaker",
+        "offset",
+        "duration",
+        "received",
+    )
+
+    def __init__(self, session, final, text, speaker, offset, duration, received):
+        self.session = session
+        self.final = final
+        self.text = text
+        self.speaker = speaker
+        self.offset = offset
+        self.duration = duration
+        self.received = received
+
+
+class EventRing:
+    """
+    Bounded event queue between the SDK callback threads and the consumers.
+
+    `put` never blocks, so a slow consumer cannot stall recognition: when the
+    ring is full the oldest event is dropped and counted against its session.
+    `get` blocks until an event arrives and returns None once the ring is
+    closed and drained.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.events = collections.deque()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, event: RecognitionEvent):
+        with self.condition:
+            if len(self.events) == self.capacity:
+                dropped = self.events.popleft()
+                with dropped.session.lock:
+                    dropped.session.dropped += 1
+            self.events.append(event)
+            self.condition.notify()
+
+    def get(self) -> RecognitionEvent:
+        with self.condition:
+            while not self.events and not self.closed:
+                self.condition.wait()
+            return self.events.popleft() if self.events else None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class Session:
+    """
+    One room: its audio source, result latency and delivery counters.
+    """
+
+    def __init__(self, session_id: str, audio_path: str, ring: EventRing = None):
+        self.id = session_id
+        self.audio_path = audio_path
+        self.ring = ring
+        self.tracker = real_time_azure.LatencyTracker()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.events = 0
+        self.partials = 0
+        self.finals = 0
+        self.dropped = 0
+        self.lag_ms = []
+        self.callback_cpu = 0.0
+        self.handler_cpu = 0.0
+        self.pump_cpu = 0.0
+        self.transcript = []
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def report(self) -> dict:
+        """
+        Delivery counters, queue lag, CPU and result latency of the session.
+
+        Queue lag is the time an event spent in the ring before a consumer took
+        it; CPU is split between the SDK callbacks, the consumers and the audio
+        pump. A session that failed reports its `error`, and no wall time if it
+        never started.
+        """
+        lag = np.asarray(self.lag_ms, dtype=np.float64)
+        latency = self.tracker.report()
+        return {
+            "session": self.id,
+            "file": self.audio_path,
+            "error": self.error,
+            "audio_seconds": self.tracker.sent_ms[-1] / 1000,
+            "wall_seconds": (
+                (self.finished or time.perf_counter()) - self.started
+                if self.started is not None
+                else None
+            ),
+            "events": self.events,
+            "partials": self.partials,
+            "finals": self.finals,
+            "dropped": self.dropped,
+            "lag_p50_ms": float(np.percentile(lag, 50)) if len(lag) else None,
+            "lag_p95_ms": float(np.percentile(lag, 95)) if len(lag) else None,
+            "lag_max_ms": float(lag.max()) if len(lag) else None,
+            "callback_cpu_seconds": self.callback_cpu,
+            "handler_cpu_seconds": self.handler_cpu,
+            "pump_cpu_seconds": self.pump_cpu,
+            "partial_p95_ms": latency["partial"]["p95_ms"],
+            "final_p50_ms": latency["final"]["p50_ms"],
+            "final_p95_ms": latency["final"]["p95_ms"],
+        }
+
+
+def sdk_transcriber(sample_rate: int, stopped: threading.Event):
+    """
+    Create a push stream and a conversation transcriber without printing callbacks.
+
+    Returns:
+        tuple: The push stream and the transcriber.
+    """
+    stream = speechsdk.audio.PushAudioInputStream(
+        stream_format=speechsdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate, bits_per_sample=16, channels=1
+        )
+    )
+    transcriber = real_time_azure.create_transcriber(
+        speechsdk.audio.AudioConfig(stream=stream), stopped, echo=False
+    )
+    return stream, transcriber
+
+
+class SessionManager:
+    """
+    Run several conversation transcribers at once from push-stream sources.
+
+    The SDK callbacks only copy each result into an `EventRing` and return; a
+    pool of consumer threads drains the rings, records latency and lag, and
+    calls `on_event`. Every consumer has its own ring and every session is
+    assigned to one of them, so the events of a session are handled by a single
+    thread in the order they arrived. Each session is fed by
+    `real_time_azure.pump_file` on its own thread; a session that fails records
+    its error without affecting the others.
+
+    Args:
+        consumers (int): Consumer threads, each draining its own ring.
+        capacity (int): Events each ring holds before dropping the oldest.
+        transcriber_factory (callable): `(sample_rate, stopped) -> (stream,
+            transcriber)`; defaults to `sdk_transcriber`. `stopped` must be set
+            when the session ends.
+        on_event (callable): Called with `(session, event)` on a consumer
+            thread; defaults to collecting the final results.
+        realtime (bool): Pace every push stream to real time.
+        chunk_ms (int): Audio pushed per write.
+        sample_rate (int): Sample rate sent to the service.
+        stop_timeout (float): Seconds to wait, after the last push, for a
+            session to deliver its final results and stop.
+    """
+
+    def __init__(
+        self,
+        consumers: int = 4,
+        capacity: int = 4096,
+        transcriber_factory=None,
+        on_event=None,
+        realtime: bool = True,
+        chunk_ms: int = 100,
+        sample_rate: int = 16000,
+        stop_timeout: float = 30.0,
+    ):
+        self.consumers = consumers
+        self.capacity = capacity
+        self.rings = []
+        self.transcriber_factory = transcriber_factory or sdk_transcriber
+        self.on_event = on_event or self.collect
+        self.realtime = realtime
+        self.chunk_ms = chunk_ms
+        self.sample_rate = sample_rate
+        self.stop_timeout = stop_timeout
+        self.sessions = []
+
+    @staticmethod
+    def collect(session: Session, event: RecognitionEvent):
+        if event.final:
+            session.transcript.append(f"{event.speaker}: {event.text}")
+
+    def _callback(self, session: Session, final: bool):
+        def callback(evt: speechsdk.SpeechRecognitionEventArgs):
+            received = time.perf_counter()
+            cpu = time.thread_time()
+            result = evt.result
+            if final and result.reason != speechsdk.ResultReason.RecognizedSpeech:
+                return
+            session.ring.put(
+                RecognitionEvent(
+                    session,
+                    final,
+                    result.text,
+                    result.speaker_id,
+                    result.offset,
+                    result.duration,
+                    received,
+                )
+            )
+            with session.lock:
+                session.callback_cpu += time.thread_time() - cpu
+
+        return callback
+
+    def _consume(self, ring: EventRing):
+        while (event := ring.get()) is not None:
+            session = event.session
+            cpu = time.thread_time()
+            lag = (time.perf_counter() - event.received) * 1000
+            session.tracker.observe(
+                event.final, event.offset, event.duration, event.received
+            )
+            self.on_event(session, event)
+            with session.lock:
+                session.events += 1
+                session.partials += not event.final
+                session.finals += event.final
+                session.lag_ms.append(lag)
+                session.handler_cpu += time.thread_time() - cpu
+
+    def _run_session(self, session: Session):
+        try:
+            stream, transcriber = self.transcriber_factory(
+                self.sample_rate, session.stopped
+            )
+            transcriber.transcribing.connect(self._callback(session, False))
+            transcriber.transcribed.connect(self._callback(session, True))
+            transcriber.start_transcribing_async().get()
+            session.started = time.perf_counter()
+            try:
+                session.pump_cpu = real_time_azure.pump_file(
+                    session.audio_path,
+                    stream,
+                    session.tracker,
+                    self.realtime,
+                    self.chunk_ms,
+                    sample_rate=self.sample_rate,
+                )
+                if not session.stopped.wait(self.stop_timeout):
+                    print(
+                        f"[{session.id}] Session did not stop within "
+                        f"{self.stop_timeout}s of the last push"
+                    )
+            finally:
+                transcriber.stop_transcribing_async().get()
+        except Exception as e:
+            session.error = f"{type(e).__name__}: {e}"
+            print(f"[{session.id}] Failed: {session.error}")
+        finally:
+            session.finished = time.perf_counter()
+
+    def run(self, audio_paths: list) -> dict:
+        """
+        Transcribe every recording in its own session and wait for all of them.
+
+        Args:
+            audio_paths (list): One recording per session.
+
+        Returns:
+            dict: The per-session reports and the totals over all sessions.
+        """
+        self.rings = [EventRing(self.capacity) for _ in range(self.consumers)]
+        self.sessions = [
+            Session(f"{i}-{Path(path).stem}", path, self.rings[i % self.consumers])
+            for i, path in enumerate(audio_paths)
+        ]
+        consumers = [
+            threading.Thread(target=self._consume, args=(ring,), daemon=True)
+            for ring in self.rings
+        ]
+        runners = [
+            threading.Thread(target=self._run_session, args=(session,))
+            for session in self.sessions
+        ]
+        cpu = time.process_time()
+        t1 = time.perf_counter()
+        for thread in consumers + runners:
+            thread.start()
+        for thread in runners:
+            thread.join()
+        for ring in self.rings:
+            ring.close()
+        for thread in consumers:
+            thread.join()
+        wall = time.perf_counter() - t1
+        cpu = time.process_time() - cpu
+
+        sessions = [session.report() for session in self.sessions]
+        audio_seconds = sum(session["audio_seconds"] for session in sessions)
+        return {
+            "sessions": sessions,
+            "total": {
+                "sessions": len(sessions),
+                "failed": sum(session["error"] is not None for session in sessions),
+                "wall_seconds": wall,
+                "audio_seconds": audio_seconds,
+                "throughput_x_realtime": audio_seconds / wall,
+                "events": sum(session["events"] for session in sessions),
+                "dropped": sum(session["dropped"] for session in sessions),
+                "lag_max_ms": max(
+                    (s["lag_max_ms"] for s in sessions if s["lag_max_ms"] is not None),
+                    default=None,
+                ),
+                "cpu_seconds": cpu,
+                "cpu_percent": 100 * cpu / wall,
+            },
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Transcribe several rooms at once and measure how throughput "
+        "scales with the number of sessions."
+    )
+    parser.add_argument("files", nargs="+", help="Recordings, reused round-robin")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--fast", action="store_true", help="Push the files as fast as possible"
+    )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="Use mock_azure_realtime instead of the Speech service",
+    )
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=4096)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--echo", action="store_true", help="Print final results")
+    parser.add_argument("--output-dir", default="output_log")
+    args = parser.parse_args()
+
+    factory = None
+    if args.mock:
+        from mock_azure_realtime import MockTranscriberFactory
+
+        factory = MockTranscriberFactory()
+
+    def echo(session, event):
+        SessionManager.collect(session, event)
+        if event.final:
+            print(f"[{session.id}] {event.speaker}: {event.text}")
+
+    runs = []
+    for count in args.sessions:
+        manager = SessionManager(
+            args.consumers,
+            args.capacity,
+            factory,
+            echo if args.echo else None,
+            not args.fast,
+            args.chunk_ms,
+        )
+        report = manager.run([args.files[i % len(args.files)] for i in range(count)])
+        runs.append(report)
+        total = report["total"]
+        print(
+            f"{count} sessions: {total['throughput_x_realtime']:.1f}x real time, "
+            f"{total['events']} events, {total['dropped']} dropped, "
+            f"max lag {total['lag_max_ms'] or 0:.1f} ms, CPU {total['cpu_percent']:.0f}%"
+        )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir, f"realtime_sessions_{int(time.time())}.json"
+    )
+    with open(output_path, "w") as f:
+        json.dump(runs, f, indent=2)
+    print(f"Report saved as {output_path}")
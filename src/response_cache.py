@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+
+class ResponseCache:
+    """
+    Persistent cache of transcription responses with least-recently-used eviction.
+
+    Each response is stored as `<key>.json`, where the key hashes a digest of
+    the upload (the recording's file, the signature prefix and the codec; see
+    `upload.upload_digest`), the `definition` dict and the API version. A file's
+    mtime records when it was last used; once the cache grows past `max_bytes`
+    the least recently used entries are deleted. Using the filesystem as the
+    index keeps concurrent processes from corrupting a shared index file.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".build/response_cache",
+        max_bytes: int = 256 * 1024 * 1024,
+        enabled: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(audio_digest: str, definition: dict, url: str) -> str:
+        """
+        Cache key for one request.
+
+        Args:
+            audio_digest (str): Digest identifying the uploaded audio.
+            definition (dict): The definition for the transcription.
+            url (str): The request URL, whose `api-version` is part of the key.
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        api_version = parse_qs(urlparse(url).query).get("api-version", [""])[0]
+        payload = json.dumps(
+            [audio_digest, definition, api_version], sort_keys=True
+        ).encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str):
+        """
+        Look up a response and mark it as recently used.
+
+        Args:
+            key (str): Cache key from `ResponseCache.key`.
+
+        Returns:
+            dict: The cached JSON response, or None on a miss or when disabled.
+        """
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(key), "r") as f:
+                json_data = json.load(f)
+            os.utime(self._path(key))
+        except (OSError, json.JSONDecodeError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json_data
+
+    def put(self, key: str, json_data: dict):
+        """
+        Store a response, then evict least recently used entries over the size cap.
+
+        Args:
+            key (str): Cache key from `ResponseCache.key`.
+            json_data (dict): The JSON response to store.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(json_data, f)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = []
+        for path in Path(self.cache_dir).glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters for this process and the current size on disk.
+
+        Returns:
+            dict: Hits, misses, hit rate, evictions, entries and bytes.
+        """
+        paths = list(Path(self.cache_dir).glob("*.json"))
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(paths),
+            "bytes": sum(path.stat().st_size for path in paths),
+        }
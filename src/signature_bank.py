@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import utils
+
+
+class SignatureBank:
+    """
+    Append-only file of enrolled speaker signatures with a speaker index.
+
+    All signatures live in one raw little-endian int16 PCM file (`<path>.pcm`)
+    that is memory-mapped for reading. The JSON index (`<path>.json`) maps each
+    speaker name to a stable ID, its sample range in the PCM file and the SHA-256
+    of its samples. Enrolling appends the samples and then atomically replaces
+    the index, so the PCM file is never rewritten; re-enrolled or removed
+    speakers leave dead space that `compact` reclaims.
+
+    IDs are never reused. The positional IDs Azure assigns within one request
+    (see `prefix`) are separate from them.
+    """
+
+    index_format = "16000:int16"
+
+    def __init__(self, path: str = "known_speakers/signature_bank"):
+        self.pcm_path = f"{path}.pcm"
+        self.index_path = f"{path}.json"
+        self.sample_rate = 16000
+        self._map = None
+        self.index = {"format": self.index_format, "next_id": 1, "speakers": {}}
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index.get("format") == self.index_format:
+                self.index = index
+        except (OSError, json.JSONDecodeError, ValueError):
+            pass
+
+    @property
+    def speakers(self) -> dict:
+        """
+        Index entries by speaker name: `id`, `start`, `stop`, `sha256`, `source`.
+        """
+        return self.index["speakers"]
+
+    @property
+    def samples(self) -> np.ndarray:
+        """
+        The whole PCM file as a read-only int16 memory map.
+
+        The map is recreated only when the file has grown since the last call;
+        arrays sliced from an earlier map stay valid.
+        """
+        size = os.path.getsize(self.pcm_path) if os.path.exists(self.pcm_path) else 0
+        if self._map is None or len(self._map) != size // 2:
+            self._map = (
+                np.memmap(self.pcm_path, dtype="<i2", mode="r", shape=(size // 2,))
+                if size >= 2
+                else np.zeros(0, dtype="<i2")
+            )
+        return self._map
+
+    def _write_index(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def enroll(
+        self, name: str, samples: np.ndarray, source: str = None, source_sha256=None
+    ) -> int:
+        """
+        Add or replace a speaker's signature by appending it to the PCM file.
+
+        Args:
+            name (str): Speaker name.
+            samples (np.ndarray): 16 kHz int16 signature samples.
+            source (str): File the signature was decoded from, if any.
+            source_sha256 (str): Digest of that file, used by `sync`.
+
+        Returns:
+            int: The speaker's stable ID (unchanged when re-enrolled).
+        """
+        samples = np.ascontiguousarray(samples, dtype="<i2")
+        sha256 = hashlib.sha256(samples.tobytes()).hexdigest()
+        entry = self.speakers.get(name)
+        if entry is not None and entry["sha256"] == sha256:
+            if source_sha256 and entry.get("source_sha256") != source_sha256:
+                entry.update(source=source, source_sha256=source_sha256)
+                self._write_index()
+            return entry["id"]
+
+        os.makedirs(os.path.dirname(self.pcm_path) or ".", exist_ok=True)
+        with open(self.pcm_path, "ab") as f:
+            # Samples start on an even byte even after a torn earlier append
+            if f.tell() % 2:
+                f.write(b"\0")
+            start = f.tell() // 2
+            f.write(samples.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        if entry is None:
+            entry = {"id": self.index["next_id"]}
+            self.index["next_id"] += 1
+        entry.update(
+            start=start,
+            stop=start + len(samples),
+            sha256=sha256,
+            source=source,
+            source_sha256=source_sha256,
+        )
+        self.speakers[name] = entry
+        self._write_index()
+        return entry["id"]
+
+    def remove(self, name: str):
+        """
+        Drop a speaker from the index; its samples become dead space.
+        """
+        if self.speakers.pop(name, None) is not None:
+            self._write_index()
+
+    def sync(self, signatures_path: str = "known_speakers/audio_files/") -> bool:
+        """
+        Enroll every signature file in a directory and drop speakers without one.
+
+        Files are listed by `utils.signature_files`, which keeps one file per
+        speaker name. Files whose digest matches the index are skipped; others
+        are first brought to WAV by `utils.normalize_audio_dir` (ffmpeg for
+        formats soundfile cannot read, such as .m4a) and decoded through
+        `utils.load_signature_bank`, whose cache skips unchanged ones. Files that
+        cannot be converted are reported and left out.
+
+        Args:
+            signatures_path (str): Path to signatures directory
+
+        Returns:
+            bool: Whether the index changed.
+        """
+        before = json.dumps(self.index, sort_keys=True)
+        sign_files = utils.signature_files(signatures_path)
+        names = list(utils.build_speaker_maps(sign_files).values())
+        digests = [
+            utils.file_digest(os.path.join(signatures_path, sign_file))
+            for sign_file in sign_files
+        ]
+
+        stale = [
+            i
+            for i, (name, digest) in enumerate(zip(names, digests))
+            if self.speakers.get(name, {}).get("source_sha256") != digest
+        ]
+        unreadable = set()
+        if stale:
+            decode_paths = utils.normalized_paths(signatures_path)
+            decoded = dict(
+                zip(
+                    *utils.load_signature_bank(
+                        signatures_path, decode_paths=decode_paths
+                    )[:2]
+                )
+            )
+            for i in stale:
+                if sign_files[i] not in decoded:
+                    print(
+                        f"Skipping signature {sign_files[i]}: it could not be decoded"
+                    )
+                    unreadable.add(names[i])
+                    continue
+                self.enroll(names[i], decoded[sign_files[i]], sign_files[i], digests[i])
+
+        for name in set(self.speakers) - (set(names) - unreadable):
+            self.remove(name)
+        return json.dumps(self.index, sort_keys=True) != before
+
+    def prefix(self, names: list = None) -> (dict, list):
+        """
+        Signature prefix for a set of speakers as views of the memory map.
+
+        Args:
+            names (list): Speakers in prefix order; all speakers sorted by name,
+                case-insensitively as in `utils.signature_files`, when None.
+
+        Returns:
+            dict: Positional speaker ID ("1", "2", ...) to speaker name, matching
+                the order Azure assigns IDs in.
+            list: int16 array views, one per speaker, sharing the mapped file.
+        """
+        if names is None:
+            names = sorted(self.speakers, key=str.lower)
+        missing = [name for name in names if name not in self.speakers]
+        if missing:
+            raise KeyError(f"Speakers not enrolled: {', '.join(missing)}")
+        samples = self.samples
+        parts = [
+            samples[self.speakers[name]["start"] : self.speakers[name]["stop"]]
+            for name in names
+        ]
+        return {str(i + 1): name for i, name in enumerate(names)}, parts
+
+    def dead_samples(self) -> int:
+        """
+        Samples in the PCM file that no speaker refers to.
+        """
+        live = sum(entry["stop"] - entry["start"] for entry in self.speakers.values())
+        return len(self.samples) - live
+
+    def compact(self):
+        """
+        Rewrite the PCM file without dead space, keeping every speaker's ID.
+
+        Run it while no other process is using the bank.
+        """
+        samples = self.samples
+        tmp_path = f"{self.pcm_path}.{os.getpid()}.tmp"
+        position = 0
+        with open(tmp_path, "wb") as f:
+            for entry in sorted(self.speakers.values(), key=lambda e: e["start"]):
+                f.write(samples[entry["start"] : entry["stop"]].tobytes())
+                length = entry["stop"] - entry["start"]
+                entry.update(start=position, stop=position + length)
+                position += length
+        self._map = None
+        os.replace(tmp_path, self.pcm_path)
+        self._write_index()
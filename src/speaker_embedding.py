@@ -0,0 +1,307 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.optimize import linear_sum_assignment
+
+import utils
+
+sample_rate = 16000
+frame_length = 400  # 25 ms
+hop_length = 160  # 10 ms
+n_fft = 512
+n_mels = 40
+n_mfcc = 20
+block_frames = 4096  # frames transformed at once by `frame_features`
+
+
+def _mel_filterbank(
+    n_mels: int = n_mels, n_fft: int = n_fft, sr: int = sample_rate
+) -> np.ndarray:
+    """
+    Triangular mel filterbank of shape (n_mels, n_fft // 2 + 1).
+    """
+    mel_points = np.linspace(0, 2595 * np.log10(1 + (sr / 2) / 700), n_mels + 2)
+    hz_points = 700 * (10 ** (mel_points / 2595) - 1)
+    bins = np.fft.rfftfreq(n_fft, 1 / sr)
+
+    lower, center, upper = (
+        hz_points[:-2, None],
+        hz_points[1:-1, None],
+        hz_points[2:, None],
+    )
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling))
+
+
+def _dct_matrix(n_mfcc: int = n_mfcc, n_mels: int = n_mels) -> np.ndarray:
+    """
+    Orthonormal DCT-II basis of shape (n_mels, n_mfcc).
+    """
+    k = np.arange(n_mfcc)[None, :]
+    n = np.arange(n_mels)[:, None]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2 / n_mels)
+    basis[:, 0] /= np.sqrt(2)
+    return basis
+
+
+_filterbank = _mel_filterbank()
+_dct = _dct_matrix()
+_window = np.hamming(frame_length)
+
+
+def frame_features(signal: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Compute MFCCs and log energy for every 10 ms frame of a signal.
+
+    Frames are windowed and transformed `block_frames` at a time, so the
+    temporary spectra stay bounded however long the signal is.
+
+    Args:
+        signal (np.ndarray): Mono audio at 16 kHz, int16 or float.
+
+    Returns:
+        np.ndarray: float32 MFCCs of shape (frames, n_mfcc).
+        np.ndarray: float32 log frame energy of shape (frames,).
+    """
+    if np.issubdtype(signal.dtype, np.integer):
+        signal = signal / 32768.0
+    signal = np.asarray(signal, dtype=np.float32)
+    if len(signal) < frame_length:
+        signal = np.pad(signal, (0, frame_length - len(signal)))
+
+    # Pre-emphasis, then a strided (frames, frame_length) view without copying
+    emphasized = np.append(signal[:1], signal[1:] - 0.97 * signal[:-1])
+    windows = sliding_window_view(emphasized, frame_length)[::hop_length]
+
+    mfcc = np.empty((len(windows), n_mfcc), dtype=np.float32)
+    energy = np.empty(len(windows), dtype=np.float32)
+    for i in range(0, len(windows), block_frames):
+        frames = windows[i : i + block_frames] * _window
+        power = np.abs(np.fft.rfft(frames, n_fft, axis=1)) ** 2 / n_fft
+        mfcc[i : i + block_frames] = np.log(power @ _filterbank.T + 1e-10) @ _dct
+        energy[i : i + block_frames] = np.log(power.sum(axis=1) + 1e-10)
+    return mfcc, energy
+
+
+def segment_features(
+    audio_path: str, start: float, stop: float
+) -> (np.ndarray, np.ndarray):
+    """
+    Frame features of one time range of a file, decoding only that range.
+
+    Returns:
+        np.ndarray: MFCCs of shape (frames, n_mfcc); no frames if the range
+            holds no audio.
+        np.ndarray: Log frame energy of shape (frames,).
+    """
+    blocks = list(utils.iter_pcm16(audio_path, sample_rate, start=start, stop=stop))
+    if not blocks:
+        return np.zeros((0, n_mfcc), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    return frame_features(np.concatenate(blocks))
+
+
+def _voiced(energy: np.ndarray, floor_db: float = 30.0) -> np.ndarray:
+    """
+    Mask of frames within `floor_db` of the loudest frames.
+    """
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+    threshold = np.percentile(energy, 95) - floor_db / 10 * np.log(10)
+    return energy > threshold
+
+
+def pool_segments(
+    mfcc: np.ndarray, voiced: np.ndarray, bounds: np.ndarray
+) -> np.ndarray:
+    """
+    Mean and standard deviation of voiced MFCC frames for many segments at once.
+
+    Uses cumulative sums over the frame axis, so the cost is one pass over the
+    frames plus O(1) per segment regardless of segment length.
+
+    Args:
+        mfcc (np.ndarray): Frame MFCCs of shape (frames, n_mfcc).
+        voiced (np.ndarray): Boolean mask of frames to pool.
+        bounds (np.ndarray): (segments, 2) array of start/stop frame indices.
+
+    Returns:
+        np.ndarray: L2-normalised embeddings of shape (segments, 2 * (n_mfcc - 1)).
+    """
+    features = mfcc[:, 1:] * voiced[:, None]
+    zero = np.zeros((1, features.shape[1]))
+    sums = np.concatenate((zero, np.cumsum(features, axis=0, dtype=np.float64)))
+    squares = np.concatenate((zero, np.cumsum(features**2, axis=0, dtype=np.float64)))
+    counts = np.concatenate(([0], np.cumsum(voiced)))
+
+    start, stop = bounds[:, 0], bounds[:, 1]
+    n = np.maximum(counts[stop] - counts[start], 1)[:, None]
+    mean = (sums[stop] - sums[start]) / n
+    std = np.sqrt(np.maximum((squares[stop] - squares[start]) / n - mean**2, 0))
+    embeddings = np.hstack((mean, std))
+    return embeddings / np.maximum(
+        np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-10
+    )
+
+
+def embed_segments(signal: np.ndarray, segments) -> np.ndarray:
+    """
+    Fixed-size voice embeddings for time segments of one signal.
+
+    Args:
+        signal (np.ndarray): Mono audio at 16 kHz.
+        segments: Iterable of (start seconds, stop seconds).
+
+    Returns:
+        np.ndarray: Embeddings of shape (segments, dims).
+    """
+    mfcc, energy = frame_features(signal)
+    bounds = np.asarray(
+        [(start, stop) for start, stop in segments], dtype=float
+    ).reshape(-1, 2)
+    bounds = np.clip(
+        np.round(bounds * sample_rate / hop_length).astype(int), 0, len(mfcc)
+    )
+    bounds[:, 1] = np.maximum(bounds[:, 1], bounds[:, 0] + 1)
+    bounds = np.minimum(bounds, len(mfcc))
+    return pool_segments(mfcc, _voiced(energy), bounds)
+
+
+class SpeakerBank:
+    """
+    Enrolled voice embeddings for the known speakers.
+
+    Embeddings are computed from the decoded signature bank kept by
+    `utils.load_signature_bank`, so enrolment reuses the cached PCM.
+    """
+
+    def __init__(self, names: list, embeddings: np.ndarray):
+        self.names = names
+        self.embeddings = embeddings
+        self.center = embeddings.mean(axis=0) if len(embeddings) > 1 else 0.0
+
+    @classmethod
+    def from_signatures(
+        cls, signatures_path: str = "known_speakers/audio_files/"
+    ) -> "SpeakerBank":
+        """
+        Enrol every signature in the signatures directory.
+
+        Args:
+            signatures_path (str): Path to signatures directory
+
+        Returns:
+            SpeakerBank: The enrolled bank.
+        """
+        # Formats soundfile cannot read (such as .m4a) are decoded from WAV copies
+        sign_files, bank, _ = utils.load_signature_bank(
+            signatures_path, decode_paths=utils.normalized_paths(signatures_path)
+        )
+        speaker_maps = utils.build_speaker_maps(sign_files)
+        embeddings = np.vstack(
+            [embed_segments(data, [(0, len(data) / sample_rate)]) for data in bank]
+        )
+        return cls(list(speaker_maps.values()), embeddings)
+
+    def similarity(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of embeddings against every enrolled speaker.
+
+        Both sides are centred on the bank mean first, which removes the
+        component shared by all voices (channel, language) from the score.
+
+        Args:
+            embeddings (np.ndarray): Embeddings of shape (n, dims).
+
+        Returns:
+            np.ndarray: Similarity matrix of shape (n, enrolled speakers).
+        """
+        a = embeddings - self.center
+        b = self.embeddings - self.center
+        a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-10)
+        b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-10)
+        return a @ b.T
+
+    def identify(self, embeddings: np.ndarray, threshold: float = 0.3) -> list:
+        """
+        Assign enrolled names to embeddings, one name per embedding at most.
+
+        Args:
+            embeddings (np.ndarray): Embeddings of shape (n, dims).
+            threshold (float): Minimum similarity to accept a name.
+
+        Returns:
+            list: A name or None for every embedding.
+        """
+        scores = self.similarity(embeddings)
+        rows, cols = linear_sum_assignment(-scores)
+        names = [None] * len(embeddings)
+        for row, col in zip(rows, cols):
+            if scores[row, col] >= threshold:
+                names[row] = self.names[col]
+        return names
+
+
+def identify_speakers(
+    audio_path: str, json_data: dict, bank: SpeakerBank, threshold: float = 0.3
+) -> dict:
+    """
+    Map the provider's anonymous speaker IDs to enrolled names.
+
+    The recording is decoded and transformed into frame features once, and
+    every phrase's frames are pooled from them in one batched pass. Phrase embeddings are averaged per speaker ID weighted by
+    the audio each phrase actually covered, and speaker IDs are matched to
+    enrolled speakers by cosine similarity. Speaker IDs without any audio keep
+    their anonymous label.
+
+    Args:
+        audio_path (str): Path to the transcribed audio file.
+        json_data (dict): The transcription JSON response.
+        bank (SpeakerBank): The enrolled speakers.
+        threshold (float): Minimum similarity to accept a name.
+
+    Returns:
+        dict: A dictionary mapping speaker IDs to speaker names, shaped like
+            the speaker maps used by `parse_speaker_text`.
+    """
+    phrases = json_data.get("phrases", [])
+    if not phrases:
+        return {}
+
+    starts = np.array([p.get("offsetMilliseconds", 0) for p in phrases]) / 1000
+    durations = np.array([p.get("durationMilliseconds", 0) for p in phrases]) / 1000
+    labels = np.array([str(p.get("speaker", "Unknown")) for p in phrases])
+
+    # Decode and transform the recording once, then slice every phrase's frames
+    blocks = list(utils.iter_pcm16(audio_path, sample_rate))
+    signal = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int16)
+    mfcc, energy = frame_features(signal)
+    # Frames that hold audio; `frame_features` pads a too short signal
+    audio_frames = (
+        0
+        if len(signal) < frame_length
+        else 1 + (len(signal) - frame_length) // hop_length
+    )
+    spans = np.stack((starts, starts + durations), axis=1)
+    bounds = np.clip(
+        np.round(spans * sample_rate / hop_length).astype(int), 0, audio_frames
+    )
+    frames = bounds[:, 1] - bounds[:, 0]
+    mfcc, energy = mfcc[:audio_frames], energy[:audio_frames]
+    embeddings = pool_segments(mfcc, _voiced(energy), bounds)
+
+    # Mean embedding per speaker ID, weighted by the frames each phrase covered
+    speakers, inverse = np.unique(labels, return_inverse=True)
+    weighted = np.zeros((len(speakers), embeddings.shape[1]))
+    np.add.at(weighted, inverse, embeddings * frames[:, None])
+    heard = np.bincount(inverse, weights=frames, minlength=len(speakers)) > 0
+
+    names = [None] * len(speakers)
+    if heard.any():
+        for i, name in zip(
+            np.flatnonzero(heard), bank.identify(weighted[heard], threshold)
+        ):
+            names[i] = name
+    return {
+        speaker: name if name is not None else f"Speaker {speaker}"
+        for speaker, name in zip(speakers, names)
+    }
@@ -0,0 +1,250 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+# Upper bounds (seconds) of the Prometheus duration histogram buckets
+duration_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Trace ID of the request being processed in the current task or thread
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class _NoopSpan:
+    """
+    Span returned while tracing is disabled; every method does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, n: int):
+        pass
+
+
+_noop = _NoopSpan()
+
+
+class Span:
+    """
+    Times one pipeline stage; use as a context manager.
+    """
+
+    __slots__ = ("tracer", "stage", "attrs", "bytes", "start")
+
+    def __init__(self, tracer, stage: str, nbytes: int, attrs: dict):
+        self.tracer = tracer
+        self.stage = stage
+        self.attrs = attrs
+        self.bytes = nbytes
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(
+            self.stage, self.start, time.perf_counter(), self.bytes, **self.attrs
+        )
+        return False
+
+    def add_bytes(self, n: int):
+        """
+        Count bytes processed by this stage.
+        """
+        self.bytes += n
+
+
+class Tracer:
+    """
+    Per-stage timing spans with JSONL and Prometheus textfile export.
+
+    Spans are grouped into traces, one per request (see `traced`). When a trace
+    ends its spans are appended to `<output_dir>/spans.jsonl`, and the running
+    per-stage totals are rewritten to `<output_dir>/metrics.prom` for the node
+    exporter's textfile collector. Tracing is enabled with the environment
+    variable `TRANSCRIPTION_TRACE=1`; while disabled, `span` returns a shared
+    no-op object and `traced` calls the function directly.
+    """
+
+    def __init__(self, enabled: bool = None, output_dir: str = None):
+        if enabled is None:
+            enabled = os.getenv("TRANSCRIPTION_TRACE", "0") not in ("", "0")
+        self.enabled = enabled
+        self.output_dir = output_dir or os.getenv(
+            "TRANSCRIPTION_TRACE_DIR", "output_log/traces"
+        )
+        self.pending = []
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def span(self, stage: str, nbytes: int = 0, **attrs):
+        """
+        Time a stage of the current trace.
+
+        Args:
+            stage (str): Stage name, e.g. "upload".
+            nbytes (int): Bytes processed, if known up front (see `Span.add_bytes`).
+            **attrs: Extra JSON-serialisable fields for the span record.
+
+        Returns:
+            Span: Context manager timing the block.
+        """
+        if not self.enabled:
+            return _noop
+        return Span(self, stage, nbytes, attrs)
+
+    def record(self, stage: str, start: float, end: float, nbytes: int = 0, **attrs):
+        """
+        Record a span whose bounds were measured elsewhere.
+
+        Args:
+            stage (str): Stage name.
+            start (float): `time.perf_counter()` at the start of the stage.
+            end (float): `time.perf_counter()` at the end of the stage.
+            nbytes (int): Bytes processed by the stage.
+            **attrs: Extra fields for the span record.
+        """
+        if not self.enabled:
+            return
+        seconds = end - start
+        record = {
+            "trace": current_trace.get(),
+            "stage": stage,
+            "start": time.time() - (time.perf_counter() - start),
+            "seconds": seconds,
+            "bytes": nbytes,
+            **attrs,
+        }
+        with self.lock:
+            self.pending.append(record)
+            totals = self.totals.setdefault(
+                stage, [0, 0.0, 0, [0] * len(duration_buckets)]
+            )
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += nbytes
+            for i, bound in enumerate(duration_buckets):
+                if seconds <= bound:
+                    totals[3][i] += 1
+
+    @contextlib.contextmanager
+    def trace(self):
+        """
+        Group the spans recorded in the block into a new trace and flush it.
+
+        Yields:
+            list: Filled with the trace's spans when the block exits.
+        """
+        spans = []
+        if not self.enabled:
+            yield spans
+            return
+        token = current_trace.set(uuid.uuid4().hex[:16])
+        try:
+            yield spans
+        finally:
+            spans.extend(self.flush())
+            current_trace.reset(token)
+
+    def traced(self, name: str):
+        """
+        Decorator running an async function as one trace with a "total" span.
+
+        A call made inside another trace (see `trace`) adds its spans to that
+        trace, which its owner flushes.
+
+        Args:
+            name (str): Name stored on the trace's spans.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                if current_trace.get() is not None:
+                    with self.span("total", operation=name):
+                        return await func(*args, **kwargs)
+                with self.trace():
+                    with self.span("total", operation=name):
+                        return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def flush(self) -> list:
+        """
+        Write the current trace's pending spans and rewrite the Prometheus file.
+
+        Only spans of the trace in `current_trace` are taken, so concurrent
+        requests each flush their own. Spans recorded outside any trace are
+        written along with it.
+
+        Returns:
+            list: The flushed spans of the current trace.
+        """
+        trace_id = current_trace.get()
+        with self.lock:
+            pending = [r for r in self.pending if r["trace"] in (trace_id, None)]
+            self.pending = [
+                r for r in self.pending if r["trace"] not in (trace_id, None)
+            ]
+            totals = {
+                stage: (count, seconds, nbytes, list(buckets))
+                for stage, (count, seconds, nbytes, buckets) in self.totals.items()
+            }
+        if not pending and not totals:
+            return []
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, "spans.jsonl"), "a") as f:
+            for record in pending:
+                f.write(json.dumps(record) + "\n")
+
+        lines = [
+            "# HELP transcription_stage_duration_seconds Time spent per pipeline stage.",
+            "# TYPE transcription_stage_duration_seconds histogram",
+        ]
+        for stage, (count, seconds, _, buckets) in sorted(totals.items()):
+            for bound, bucket in zip(duration_buckets, buckets):
+                lines.append(
+                    f'transcription_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket}'
+                )
+            lines.append(
+                f'transcription_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}'
+            )
+            lines.append(
+                f'transcription_stage_duration_seconds_sum{{stage="{stage}"}} {seconds}'
+            )
+            lines.append(
+                f'transcription_stage_duration_seconds_count{{stage="{stage}"}} {count}'
+            )
+        lines += [
+            "# HELP transcription_stage_bytes_total Bytes processed per pipeline stage.",
+            "# TYPE transcription_stage_bytes_total counter",
+        ]
+        for stage, (_, _, nbytes, _) in sorted(totals.items()):
+            lines.append(f'transcription_stage_bytes_total{{stage="{stage}"}} {nbytes}')
+
+        path = os.path.join(self.output_dir, "metrics.prom")
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+        return [r for r in pending if r["trace"] == trace_id]
+
+
+# Process-wide tracer used by the pipeline modules
+tracer = Tracer()
@@ -0,0 +1,312 @@
+import json
+
+import numpy as np
+
+
+class PhraseTable:
+    """
+    Columnar store of transcribed phrases (or words).
+
+    Each column is a NumPy array with one row per phrase: `offset_ms` and
+    `duration_ms` (int64), `speaker` (int32 codes into `labels`, the speaker IDs
+    or names), `confidence` (float32) and `text` (object). Filtering, shifting
+    and merging operate on whole columns and return new tables.
+    """
+
+    __slots__ = ("offset_ms", "duration_ms", "speaker", "confidence", "text", "labels")
+
+    def __init__(self, offset_ms, duration_ms, speaker, confidence, text, labels):
+        self.offset_ms = np.asarray(offset_ms, dtype=np.int64)
+        self.duration_ms = np.asarray(duration_ms, dtype=np.int64)
+        self.speaker = np.asarray(speaker, dtype=np.int32)
+        self.confidence = np.asarray(confidence, dtype=np.float32)
+        self.text = np.asarray(text, dtype=object)
+        self.labels = list(labels)
+
+    def __len__(self) -> int:
+        return len(self.offset_ms)
+
+    def __getitem__(self, index) -> "PhraseTable":
+        return PhraseTable(
+            self.offset_ms[index],
+            self.duration_ms[index],
+            self.speaker[index],
+            self.confidence[index],
+            self.text[index],
+            self.labels,
+        )
+
+    @classmethod
+    def from_records(cls, records: list) -> "PhraseTable":
+        """
+        Build a table from phrase dicts shaped like the Azure response.
+
+        Args:
+            records (list): Dicts with `offsetMilliseconds`, `durationMilliseconds`,
+                `speaker`, `confidence` and `text`.
+
+        Returns:
+            PhraseTable: The table.
+        """
+        speakers = [str(record.get("speaker", "Unknown")) for record in records]
+        labels, codes = np.unique(
+            np.asarray(speakers, dtype=object), return_inverse=True
+        )
+        return cls(
+            [record.get("offsetMilliseconds", 0) for record in records],
+            [record.get("durationMilliseconds", 0) for record in records],
+            codes.reshape(-1) if len(records) else [],
+            [record.get("confidence", np.nan) for record in records],
+            [record.get("text", "") for record in records],
+            labels.tolist() if len(records) else [],
+        )
+
+    @classmethod
+    def from_azure(cls, json_data: dict, words: bool = False) -> "PhraseTable":
+        """
+        Build a table from a `transcriptions:transcribe` response.
+
+        Args:
+            json_data (dict): The transcription JSON response.
+            words (bool): One row per word (words inherit their phrase's speaker)
+                instead of one row per phrase.
+
+        Returns:
+            PhraseTable: The table.
+        """
+        phrases = json_data.get("phrases", [])
+        if not words:
+            return cls.from_records(phrases)
+        return cls.from_records(
+            [
+                {"speaker": phrase.get("speaker", "Unknown"), **word}
+                for phrase in phrases
+                for word in phrase.get("words", [])
+            ]
+        )
+
+    @classmethod
+    def concat(cls, tables: list) -> "PhraseTable":
+        """
+        Stack tables, merging their speaker labels.
+
+        Args:
+            tables (list): Tables to concatenate in order.
+
+        Returns:
+            PhraseTable: The combined table.
+        """
+        labels = []
+        codes = []
+        for table in tables:
+            remap = []
+            for label in table.labels:
+                if label not in labels:
+                    labels.append(label)
+                remap.append(labels.index(label))
+            codes.append(np.asarray(remap, dtype=np.int32)[table.speaker])
+        return cls(
+            np.concatenate([t.offset_ms for t in tables]) if tables else [],
+            np.concatenate([t.duration_ms for t in tables]) if tables else [],
+            np.concatenate(codes) if tables else [],
+            np.concatenate([t.confidence for t in tables]) if tables else [],
+            np.concatenate([t.text for t in tables]) if tables else [],
+            labels,
+        )
+
+    @property
+    def speakers(self) -> np.ndarray:
+        """
+        Speaker label of every row.
+        """
+        return np.asarray(self.labels, dtype=object)[self.speaker]
+
+    def rename(self, speaker_maps: dict) -> "PhraseTable":
+        """
+        Replace speaker labels through a speaker map; unmapped labels are kept.
+
+        Only the label list is touched, not the rows.
+
+        Args:
+            speaker_maps (dict): A dictionary mapping speaker IDs to speaker names.
+
+        Returns:
+            PhraseTable: The renamed table.
+        """
+        renamed = [speaker_maps.get(label, label) for label in self.labels]
+        labels = list(dict.fromkeys(renamed))
+        remap = np.asarray([labels.index(label) for label in renamed], dtype=np.int32)
+        return PhraseTable(
+            self.offset_ms,
+            self.duration_ms,
+            remap[self.speaker] if len(remap) else self.speaker,
+            self.confidence,
+            self.text,
+            labels,
+        )
+
+    def filter(self, mask) -> "PhraseTable":
+        """
+        Keep the rows where a boolean mask is true.
+        """
+        return self[np.asarray(mask, dtype=bool)]
+
+    def after(self, seconds: float) -> "PhraseTable":
+        """
+        Keep the phrases starting strictly after a time, e.g. the signature cutoff.
+        """
+        return self.filter(self.offset_ms > seconds * 1000)
+
+    def shift(self, milliseconds: int) -> "PhraseTable":
+        """
+        Move every phrase on the timeline by a fixed amount.
+        """
+        return PhraseTable(
+            self.offset_ms + int(milliseconds),
+            self.duration_ms,
+            self.speaker,
+            self.confidence,
+            self.text,
+            self.labels,
+        )
+
+    def sort(self) -> "PhraseTable":
+        """
+        Order the rows by offset.
+        """
+        return self[np.argsort(self.offset_ms, kind="stable")]
+
+    def merge_turns(self, max_gap_ms: int = None) -> "PhraseTable":
+        """
+        Merge consecutive phrases by the same speaker into turns.
+
+        Args:
+            max_gap_ms (int): Start a new turn when the silence between two
+                phrases of the same speaker exceeds this (None never splits).
+
+        Returns:
+            PhraseTable: One row per turn; confidence is duration-weighted.
+        """
+        if len(self) == 0:
+            return self
+        ends = self.offset_ms + self.duration_ms
+        new_turn = np.ones(len(self), dtype=bool)
+        new_turn[1:] = self.speaker[1:] != self.speaker[:-1]
+        if max_gap_ms is not None:
+            new_turn[1:] |= self.offset_ms[1:] - ends[:-1] > max_gap_ms
+        starts = np.flatnonzero(new_turn)
+
+        turn_start = self.offset_ms[starts]
+        turn_end = np.maximum.reduceat(ends, starts)
+        # Duration-weighted confidence, ignoring phrases without one
+        known = ~np.isnan(self.confidence)
+        weights = np.maximum(self.duration_ms, 1) * known
+        total = np.add.reduceat(weights, starts).astype(np.float64)
+        confidence = np.full(len(starts), np.nan)
+        np.divide(
+            np.add.reduceat(np.where(known, self.confidence, 0) * weights, starts),
+            total,
+            out=confidence,
+            where=total > 0,
+        )
+        text = [" ".join(chunk) for chunk in np.split(self.text, starts[1:])]
+        return PhraseTable(
+            turn_start,
+            turn_end - turn_start,
+            self.speaker[starts],
+            confidence,
+            text,
+            self.labels,
+        )
+
+    def records(self) -> list:
+        """
+        Rows as phrase dicts shaped like the Azure response.
+        """
+        speakers = self.speakers
+        return [
+            {
+                "speaker": speakers[i],
+                "offsetMilliseconds": int(self.offset_ms[i]),
+                "durationMilliseconds": int(self.duration_ms[i]),
+                "confidence": (
+                    None if np.isnan(self.confidence[i]) else float(self.confidence[i])
+                ),
+                "text": self.text[i],
+            }
+            for i in range(len(self))
+        ]
+
+    def render_text(self) -> list:
+        """
+        Render every phrase in the plain-text transcript format.
+
+        Returns:
+            list: A list of strings with speaker labels and their spoken text.
+        """
+        speakers = self.speakers
+        return [
+            f'Speaker: {speakers[i]}\nText: "{self.text[i]}"\nOffset: {int(self.offset_ms[i])/1000}\nDuration: {int(self.duration_ms[i])/1000}'
+            for i in range(len(self))
+        ]
+
+    def to_jsonl(self, path: str):
+        """
+        Write one JSON object per phrase.
+        """
+        with open(path, "w") as f:
+            for record in self.records():
+                f.write(json.dumps(record) + "\n")
+
+    @classmethod
+    def from_jsonl(cls, path: str) -> "PhraseTable":
+        """
+        Read a table written by `to_jsonl`.
+        """
+        with open(path, "r") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        for record in records:
+            if record.get("confidence") is None:
+                record["confidence"] = np.nan
+        return cls.from_records(records)
+
+    def to_binary(self, path: str):
+        """
+        Write the columns to a compressed `.npz` file.
+
+        Text is stored as one UTF-8 buffer plus row boundaries, so the file holds
+        no pickled objects.
+        """
+        encoded = [text.encode("utf-8") for text in self.text]
+        bounds = np.cumsum([0] + [len(text) for text in encoded])
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                offset_ms=self.offset_ms,
+                duration_ms=self.duration_ms,
+                speaker=self.speaker,
+                confidence=self.confidence,
+                text=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                text_bounds=bounds,
+                labels=np.frombuffer(json.dumps(self.labels).encode(), dtype=np.uint8),
+            )
+
+    @classmethod
+    def from_binary(cls, path: str) -> "PhraseTable":
+        """
+        Read a table written by `to_binary`.
+        """
+        with np.load(path) as data:
+            buffer = data["text"].tobytes()
+            bounds = data["text_bounds"]
+            return cls(
+                data["offset_ms"],
+                data["duration_ms"],
+                data["speaker"],
+                data["confidence"],
+                [
+                    buffer[bounds[i] : bounds[i + 1]].decode("utf-8")
+                    for i in range(len(bounds) - 1)
+                ],
+                json.loads(data["labels"].tobytes()),
+            )
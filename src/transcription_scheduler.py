@@ -0,0 +1,584 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+import azure_diarization
+import batch_transcribe
+import upload
+import utils
+from transcript import PhraseTable
+
+# Longest upload (signature prefix included) sent to the synchronous endpoint.
+# The service accepts up to two hours, but a request holds its connection for
+# the whole processing time, so long recordings go through the batch API.
+fast_max_seconds = 600
+
+# Largest upload sent to the synchronous endpoint; the service limit is 300 MB
+fast_max_bytes = 200 * 1024 * 1024
+
+# Batch job states that are still in progress
+pending_statuses = {"NotStarted", "Running"}
+
+# Fast endpoint 400 error codes that mean the recording is too long or too
+# large; a 413 always does. Other 400s are reported, not retried as batch jobs.
+fast_length_errors = {"InvalidAudioLength", "AudioLengthExceeded", "PayloadTooLarge"}
+
+
+def submit_url(url: str) -> str:
+    """
+    The batch submit URL of the region and API version of a fast endpoint URL.
+    """
+    return url.replace("transcriptions:transcribe", "transcriptions:submit")
+
+
+def batch_definition(definition: dict, content_url: str, display_name: str) -> dict:
+    """
+    Translate a `transcriptions:transcribe` definition into a batch job request.
+
+    The batch API has its own diarization schema: `diarizationEnabled` plus
+    `diarization.speakers.minCount/maxCount` instead of the fast endpoint's
+    `diarization.enabled/maxSpeakers`.
+
+    Args:
+        definition (dict): The definition for the transcription.
+        content_url (str): URL the service reads the audio from.
+        display_name (str): Name of the job.
+
+    Returns:
+        dict: The body of the `transcriptions:submit` request.
+    """
+    locales = definition.get("locales", ["en-US"])
+    diarization = definition.get("diarization", {"enabled": True})
+    properties = {
+        "diarizationEnabled": diarization.get("enabled", True),
+        "profanityFilterMode": definition.get("profanityFilterMode", "Masked"),
+        "timeToLiveHours": 48,
+    }
+    if properties["diarizationEnabled"] and "maxSpeakers" in diarization:
+        properties["diarization"] = {
+            "speakers": {"minCount": 1, "maxCount": diarization["maxSpeakers"]}
+        }
+    if len(locales) > 1:
+        properties["languageIdentification"] = {"candidateLocales": locales}
+    return {
+        "contentUrls": [content_url],
+        "locale": locales[0],
+        "displayName": display_name,
+        "properties": properties,
+    }
+
+
+def too_long_for_fast(response) -> bool:
+    """
+    Whether a fast endpoint error says the upload exceeds its duration or size limit.
+    """
+    if response.status_code == 413:
+        return True
+    if response.status_code != 400:
+        return False
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        return False
+    return isinstance(error, dict) and error.get("code") in fast_length_errors
+
+
+def normalize_batch(result: dict) -> dict:
+    """
+    Convert a batch result file into the `transcriptions:transcribe` response shape.
+
+    Only recognised phrases are kept, with their best alternative, so
+    `PhraseTable.from_azure` and `save_transcript` handle both routes alike.
+
+    Args:
+        result (dict): The job's `Transcription` result file.
+
+    Returns:
+        dict: `durationMilliseconds` and `phrases` like the fast endpoint returns.
+    """
+    phrases = []
+    for phrase in result.get("recognizedPhrases", []):
+        if phrase.get("recognitionStatus", "Success") != "Success":
+            continue
+        best = phrase["nBest"][0]
+        phrases.append(
+            {
+                "speaker": phrase.get("speaker"),
+                "offsetMilliseconds": phrase.get(
+                    "offsetMilliseconds", phrase.get("offsetInTicks", 0) // 10_000
+                ),
+                "durationMilliseconds": phrase.get(
+                    "durationMilliseconds", phrase.get("durationInTicks", 0) // 10_000
+                ),
+                "text": best["display"],
+                "confidence": best.get("confidence"),
+                "locale": phrase.get("locale"),
+            }
+        )
+    phrases.sort(key=lambda phrase: phrase["offsetMilliseconds"])
+    duration = result.get(
+        "durationMilliseconds", result.get("durationInTicks", 0) // 10_000
+    )
+    return {"durationMilliseconds": duration, "phrases": phrases}
+
+
+class TranscriptionScheduler:
+    """
+    Route each recording to the fast endpoint or the batch API by its duration.
+
+    Uploads up to `fast_max_seconds` (signature prefix included) are posted to
+    the synchronous `transcriptions:transcribe` endpoint. Longer ones are
+    uploaded to blob storage and submitted as batch jobs, which are polled with
+    exponential backoff; up to `max_batch_jobs` run at once, and waiting on
+    them holds no connection. A recording the fast endpoint rejects as too long
+    is retried through the batch API. Either way the response is normalised to
+    the fast endpoint's shape and written like `transcribe_azure` does.
+
+    Args:
+        url (str): The fast transcription URL; the batch URL is derived from it.
+        SPEECH_KEY (str): The subscription key.
+        storage_url (str): Blob container URL, with a SAS token granting
+            write and read access, for the batch uploads.
+        definition (dict): The definition for the transcription.
+        fast_max_seconds (float): Longest upload sent to the fast endpoint.
+        fast_max_bytes (int): Largest upload sent to the fast endpoint.
+        concurrency (int): Uploads (and fast requests) in flight.
+        max_batch_jobs (int): Batch jobs submitted and not yet finished.
+        poll_interval (float): First delay between status polls.
+        max_poll_interval (float): Longest delay between status polls.
+        poll_backoff (float): Factor by which the poll delay grows.
+        batch_timeout (float): Seconds after which a batch job is abandoned.
+        retries (int): Maximum retries per request for 429/5xx responses.
+        rate (float): Maximum fast requests started per second (0 for no limit).
+        roster (list): Expected speakers (see `upload.roster_prefix`).
+        output_dir (str): Directory for transcripts and the summary.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        SPEECH_KEY: str,
+        storage_url: str = None,
+        definition: dict = azure_diarization.definition,
+        fast_max_seconds: float = fast_max_seconds,
+        fast_max_bytes: int = fast_max_bytes,
+        concurrency: int = 4,
+        max_batch_jobs: int = 32,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 30.0,
+        poll_backoff: float = 1.5,
+        batch_timeout: float = 4 * 3600,
+        retries: int = 4,
+        rate: float = 0.0,
+        roster: list = None,
+        output_dir: str = "output_log",
+    ):
+        self.url = url
+        self.submit_url = submit_url(url)
+        self.SPEECH_KEY = SPEECH_KEY
+        self.storage_url = storage_url
+        self.definition = definition
+        self.fast_max_seconds = fast_max_seconds
+        self.fast_max_bytes = fast_max_bytes
+        self.concurrency = concurrency
+        self.max_batch_jobs = max_batch_jobs
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_backoff = poll_backoff
+        self.batch_timeout = batch_timeout
+        self.retries = retries
+        self.rate = rate
+        self.roster = roster
+        self.output_dir = output_dir
+
+    async def route(self, audio_path: str) -> dict:
+        """
+        Decide how to transcribe a recording from its duration.
+
+        The duration is read from the header only (`utils.get_audio_duration`).
+
+        Returns:
+            dict: The route ("fast" or "batch"), the recording's duration and
+                the duration and size of the upload.
+        """
+        audio_seconds = await utils.get_audio_duration(audio_path)
+        upload_seconds = audio_seconds + self.signs_duration
+        upload_bytes = 44 + int(upload_seconds * 16000) * 2
+        fast = (
+            upload_seconds <= self.fast_max_seconds
+            and upload_bytes <= self.fast_max_bytes
+        )
+        return {
+            "route": "fast" if fast else "batch",
+            "audio_seconds": audio_seconds,
+            "upload_seconds": upload_seconds,
+            "upload_bytes": upload_bytes,
+        }
+
+    async def _request(self, method: str, url: str, record: dict, **kwargs):
+        """
+        Send one request, retrying throttled and transient failures with backoff.
+
+        A `data` callable is called for a fresh body on every attempt.
+
+        Returns:
+            requests.Response: The last response (None if no attempt connected).
+        """
+        make_data = kwargs.pop("data", None)
+        response = None
+        for attempt in range(self.retries + 1):
+            record["attempts"] += 1
+            delay = 0.5 * 2**attempt * (0.5 + random.random())
+            try:
+                # Bodies read their header and decode as they are built
+                data = (
+                    await asyncio.to_thread(make_data)
+                    if callable(make_data)
+                    else make_data
+                )
+                response = await asyncio.to_thread(
+                    self.session.request,
+                    method,
+                    url,
+                    data=data,
+                    timeout=300,
+                    **kwargs,
+                )
+            except requests.RequestException as e:
+                print(f"{method} {url.split('?')[0]} failed: {e}")
+                response = None
+            else:
+                if response.status_code not in batch_transcribe.retry_statuses:
+                    return response
+                try:
+                    delay = float(response.headers.get("Retry-After", delay))
+                except ValueError:
+                    pass
+            if attempt < self.retries:
+                await asyncio.sleep(delay)
+        return response
+
+    async def _fast(self, audio_path: str, record: dict):
+        async with self.uploads:
+            response, attempts, size = await batch_transcribe.post_with_retry(
+                self.session,
+                self.url,
+                self.SPEECH_KEY,
+                self.definition,
+                audio_path,
+                self.limiter,
+                self.retries,
+                make_body=lambda: upload.MultipartAudioBody(
+                    self.definition, self.prefix, audio_path
+                ),
+            )
+        record["attempts"] += attempts
+        record["bytes_uploaded"] += size
+        if response is not None and response.status_code == 200:
+            return response.json()
+        if response is not None and too_long_for_fast(response):
+            print(
+                f"{audio_path}: rejected by the fast endpoint, submitting a batch job"
+            )
+            record["fallback"] = True
+            return await self._batch(audio_path, record)
+        record["error"] = (
+            f"status {response.status_code}: {response.text[:200]}"
+            if response is not None
+            else "connection failed"
+        )
+        return None
+
+    async def _batch(self, audio_path: str, record: dict):
+        if not self.storage_url:
+            record["error"] = "no blob storage URL configured for batch jobs"
+            return None
+        headers = {"Ocp-Apim-Subscription-Key": self.SPEECH_KEY}
+        container, _, sas = self.storage_url.partition("?")
+        name = f"{Path(audio_path).stem}-{uuid.uuid4().hex[:8]}.wav"
+        blob_url = f"{container.rstrip('/')}/{name}" + (f"?{sas}" if sas else "")
+
+        # Upload the prefixed recording, streamed, for the service to read
+        async with self.uploads:
+            body = await asyncio.to_thread(
+                upload.AudioFileBody, self.prefix, audio_path
+            )
+            record["bytes_uploaded"] += len(body)
+            response = await self._request(
+                "PUT",
+                blob_url,
+                record,
+                data=lambda: upload.AudioFileBody(self.prefix, audio_path),
+                headers={
+                    "x-ms-blob-type": "BlockBlob",
+                    "Content-Type": body.content_type,
+                    "Content-Length": str(len(body)),
+                },
+            )
+        if response is None or response.status_code not in (200, 201):
+            record["error"] = (
+                f"blob upload failed: {getattr(response, 'status_code', None)}"
+            )
+            return None
+
+        try:
+            async with self.batch_jobs:
+                return await self._run_job(audio_path, blob_url, headers, record)
+        finally:
+            await self._request("DELETE", blob_url, record)
+
+    async def _run_job(self, audio_path, blob_url, headers, record):
+        response = await self._request(
+            "POST",
+            self.submit_url,
+            record,
+            json=batch_definition(self.definition, blob_url, Path(audio_path).name),
+            headers=headers,
+        )
+        if response is None or response.status_code != 201:
+            record["error"] = (
+                f"submit failed: {getattr(response, 'status_code', None)}"
+                f" {getattr(response, 'text', '')[:200]}"
+            )
+            return None
+        job = response.json()
+        job_url = job["self"]
+        record["submitted_at"] = time.perf_counter() - record["started"]
+
+        try:
+            delay = self.poll_interval
+            deadline = time.monotonic() + self.batch_timeout
+            while job["status"] in pending_statuses:
+                if time.monotonic() > deadline:
+                    record["error"] = f"batch job still {job['status']} at timeout"
+                    return None
+                # Jitter keeps many jobs from polling in lockstep
+                await asyncio.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * self.poll_backoff, self.max_poll_interval)
+                response = await self._request("GET", job_url, record, headers=headers)
+                record["polls"] += 1
+                if response is None or response.status_code != 200:
+                    continue
+                job = response.json()
+                retry_after = response.headers.get("Retry-After")
+                if retry_after is not None:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+
+            if job["status"] != "Succeeded":
+                error = job.get("properties", {}).get("error", {})
+                record["error"] = (
+                    f"batch job {job['status']}: {error.get('message', error)}"
+                )
+                return None
+
+            response = await self._request(
+                "GET", job["links"]["files"], record, headers=headers
+            )
+            if response is None or response.status_code != 200:
+                record["error"] = (
+                    "could not list the batch result files: "
+                    f"{getattr(response, 'status_code', None)}"
+                )
+                return None
+            content_urls = [
+                value["links"]["contentUrl"]
+                for value in response.json().get("values", [])
+                if value.get("kind") == "Transcription"
+            ]
+            if not content_urls:
+                record["error"] = "batch job listed no transcription file"
+                return None
+            # Result files are SAS URLs, fetched without the subscription key
+            response = await self._request("GET", content_urls[0], record)
+            if response is None or response.status_code != 200:
+                record["error"] = "could not download the batch result"
+                return None
+            return normalize_batch(response.json())
+        finally:
+            await self._request("DELETE", job_url, record, headers=headers)
+
+    async def transcribe(self, audio_path: str) -> (dict, PhraseTable):
+        """
+        Transcribe one recording through the route chosen for it.
+
+        Returns:
+            dict: The job record: route, durations, attempts, polls, timing,
+                the transcript path or the error.
+            PhraseTable: The phrases on the recording's timeline (None on error).
+        """
+        record = {
+            "file": audio_path,
+            "route": None,
+            "audio_seconds": None,
+            "upload_seconds": None,
+            "upload_bytes": None,
+            "fallback": False,
+            "attempts": 0,
+            "polls": 0,
+            "bytes_uploaded": 0,
+            "error": None,
+            "started": time.perf_counter(),
+        }
+        started = record["started"]
+        table = None
+        # One unreadable or failing recording must not abort the others
+        try:
+            record.update(await self.route(audio_path))
+            if record["route"] == "fast":
+                json_data = await self._fast(audio_path, record)
+            else:
+                json_data = await self._batch(audio_path, record)
+            record["seconds"] = time.perf_counter() - started
+
+            if json_data is not None:
+                record["output"] = await azure_diarization.save_transcript(
+                    json_data,
+                    self.speaker_maps,
+                    self.signs_duration,
+                    audio_path,
+                    self.output_dir,
+                    echo=False,
+                )
+                table = (
+                    PhraseTable.from_azure(json_data)
+                    .rename(self.speaker_maps)
+                    .after(self.signs_duration - 1)
+                    .shift(-int(round(self.signs_duration * 1000)))
+                )
+                record["phrases"] = len(table)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            record.setdefault("seconds", time.perf_counter() - started)
+            table = None
+        del record["started"]
+        print(
+            f"{audio_path}: {record['route'] or 'not routed'}"
+            f"{' (fallback)' if record['fallback'] else ''} "
+            f"{'failed: ' + record['error'] if record['error'] else 'done'} "
+            f"in {record['seconds']:.2f}s"
+        )
+        return record, table
+
+    async def run(self, audio_paths: list) -> dict:
+        """
+        Transcribe every recording, fast and batch jobs side by side.
+
+        Returns:
+            dict: The summary, also written to `output_dir`.
+        """
+        self.speaker_maps, self.prefix, segments = upload.roster_prefix(self.roster)
+        self.signs_duration = segments[-1][2]
+        self.session = batch_transcribe.make_session(
+            self.concurrency + self.max_batch_jobs
+        )
+        self.limiter = batch_transcribe.RateLimiter(self.rate, burst=self.concurrency)
+        self.uploads = asyncio.Semaphore(self.concurrency)
+        self.batch_jobs = asyncio.Semaphore(self.max_batch_jobs)
+
+        t1 = time.perf_counter()
+        try:
+            results = await asyncio.gather(
+                *(self.transcribe(audio_path) for audio_path in audio_paths)
+            )
+        finally:
+            self.session.close()
+        wall = time.perf_counter() - t1
+
+        records = [record for record, _ in results]
+        summary = {
+            "files": len(records),
+            "succeeded": sum(record["error"] is None for record in records),
+            "fast": sum(record["route"] == "fast" for record in records),
+            "batch": sum(record["route"] == "batch" for record in records),
+            "fallbacks": sum(record["fallback"] for record in records),
+            "fast_max_seconds": self.fast_max_seconds,
+            "wall_seconds": wall,
+            "audio_seconds": sum(record["audio_seconds"] or 0 for record in records),
+            "results": sorted(records, key=lambda record: record["file"]),
+        }
+        for route in ("fast", "batch"):
+            summary[f"{route}_seconds"] = batch_transcribe.percentiles(
+                [
+                    record["seconds"]
+                    for record in records
+                    if record["route"] == route and record["error"] is None
+                ]
+            )
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary_path = os.path.join(
+            self.output_dir, f"schedule_summary_{int(time.time())}.json"
+        )
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(
+            f"Transcribed {summary['succeeded']}/{summary['files']} files "
+            f"({summary['fast']} fast, {summary['batch']} batch) in {wall:.2f}s; "
+            f"summary saved as {summary_path}"
+        )
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Transcribe recordings through the fast or the batch Azure API "
+        "depending on their duration."
+    )
+    parser.add_argument("source", help="Directory of recordings or manifest file")
+    parser.add_argument("--fast-max-seconds", type=float, default=fast_max_seconds)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-batch-jobs", type=int, default=32)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--roster", nargs="+")
+    parser.add_argument("--output-dir", default="output_log")
+    parser.add_argument(
+        "--storage-url",
+        default=os.getenv("AZURE_STORAGE_CONTAINER_URL"),
+        help="Blob container URL with a SAS token for batch uploads "
+        "(default: $AZURE_STORAGE_CONTAINER_URL)",
+    )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="Run against a local mock_azure_server serving both APIs",
+    )
+    args = parser.parse_args()
+
+    if args.mock:
+        import mock_azure_server
+
+        server, url = mock_azure_server.start_mock_server(
+            latency=0.1,
+            seconds_per_audio_second=0.01,
+            fast_max_seconds=args.fast_max_seconds,
+            batch_latency=1.0,
+            batch_seconds_per_audio_second=0.02,
+        )
+        SPEECH_KEY = "local"
+        storage_url = url.split(mock_azure_server.transcribe_path)[0] + "/blobs"
+    else:
+        url, SPEECH_KEY = asyncio.run(azure_diarization.setup_azure())
+        storage_url = args.storage_url
+
+    scheduler = TranscriptionScheduler(
+        url,
+        SPEECH_KEY,
+        storage_url,
+        fast_max_seconds=args.fast_max_seconds,
+        concurrency=args.concurrency,
+        max_batch_jobs=args.max_batch_jobs,
+        poll_interval=args.poll_interval,
+        roster=args.roster,
+        output_dir=args.output_dir,
+    )
+    asyncio.run(scheduler.run(batch_transcribe.collect_inputs(args.source)))
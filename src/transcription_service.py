@@ -0,0 +1,493 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import azure_diarization
+import batch_transcribe
+import upload
+from transcript import PhraseTable
+
+# Largest accepted upload in bytes
+max_upload_bytes = 512 << 20
+
+status_reasons = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    411: "Length Required",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class Job:
+    """
+    One uploaded recording waiting for, or being processed by, a worker.
+
+    Progress is published as event dicts on `events`; the last event is either
+    "done" or "error".
+    """
+
+    __slots__ = ("id", "audio_path", "roster", "codec", "events", "created")
+
+    def __init__(self, job_id: int, audio_path: str, roster: list, codec: str):
+        self.id = job_id
+        self.audio_path = audio_path
+        self.roster = roster
+        self.codec = codec
+        self.events = asyncio.Queue()
+        self.created = time.perf_counter()
+
+
+class TranscriptionService:
+    """
+    Long-lived HTTP front end for `transcribe_azure` with warm state.
+
+    The signature bank, the prefix of every roster seen so far (see
+    `upload.roster_prefix`), the response cache and one keep-alive connection
+    pool to the transcription endpoint are loaded once and shared by all
+    requests, so a request costs about its upload and provider time.
+
+    `POST /transcribe` takes the raw audio file as the body (optional query
+    parameters `roster=Prem,Varun` and `codec=flac`). The upload is spooled to
+    `upload_dir` and queued; when `queue_size` jobs are already waiting the
+    request is refused with 503. The response is newline-delimited JSON sent as
+    it becomes available: a "queued" event, one "phrase" event per phrase on the
+    recording's timeline, then "done" with timings (or "error"). `GET /health`
+    reports the queue state.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        SPEECH_KEY: str,
+        definition: dict = azure_diarization.definition,
+        concurrency: int = 2,
+        queue_size: int = 16,
+        rate: float = 0.0,
+        retries: int = 2,
+        use_cache: bool = True,
+        upload_dir: str = ".build/service_uploads",
+    ):
+        self.url = url
+        self.SPEECH_KEY = SPEECH_KEY
+        self.definition = definition
+        self.concurrency = concurrency
+        self.retries = retries
+        self.use_cache = use_cache
+        self.upload_dir = upload_dir
+        self.queue = asyncio.Queue(queue_size)
+        self.limiter = batch_transcribe.RateLimiter(rate, burst=concurrency)
+        self.session = None
+        self.server = None
+        self.workers = []
+        self.ids = itertools.count(1)
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def warm(self):
+        """
+        Load the signature prefix and open the upstream connection pool.
+        """
+        t1 = time.perf_counter()
+        speaker_maps, _, _ = await asyncio.to_thread(upload.roster_prefix)
+        self.session = batch_transcribe.make_session(self.concurrency)
+        # Any answer leaves a pooled TLS connection behind; failures are not fatal
+        try:
+            await asyncio.to_thread(self.session.head, self.url, timeout=10)
+        except requests.RequestException as e:
+            print(f"Could not pre-connect to {self.url}: {e}")
+        print(
+            f"Warmed {len(speaker_maps)} signatures and the connection pool "
+            f"in {time.perf_counter() - t1:.2f}s"
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8770):
+        """
+        Warm up, start the workers and listen for requests.
+
+        Returns:
+            str: Base URL of the service.
+        """
+        await self.warm()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.workers = [
+            asyncio.create_task(self.worker()) for _ in range(self.concurrency)
+        ]
+        self.server = await asyncio.start_server(self.handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        """
+        Stop listening, cancel the workers and close the connection pool.
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.session is not None:
+            self.session.close()
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            self.busy += 1
+            try:
+                if await self.run_job(job):
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                job.events.put_nowait({"event": "error", "error": repr(e)})
+            finally:
+                self.busy -= 1
+                self.queue.task_done()
+                try:
+                    os.remove(job.audio_path)
+                except OSError:
+                    pass
+
+    async def run_job(self, job: Job):
+        """
+        Transcribe one job and publish its phrases.
+
+        Returns:
+            bool: Whether the transcription succeeded.
+        """
+        started = time.perf_counter()
+        job.events.put_nowait(
+            {"event": "started", "queued_seconds": started - job.created}
+        )
+        # Syncs the signature bank when the signature files changed
+        speaker_maps, prefix, segments = await asyncio.to_thread(
+            upload.roster_prefix, job.roster
+        )
+        signs_duration = segments[-1][2]
+
+        def make_body():
+            return upload.MultipartAudioBody(
+                self.definition, prefix, job.audio_path, codec=job.codec
+            )
+
+        # Keyed on the uploaded file, so a hit decodes and encodes nothing
+        json_data = cache_key = None
+        if self.use_cache:
+            audio_digest = await asyncio.to_thread(
+                lambda: upload.upload_digest(
+                    job.audio_path, upload.prefix_digest(prefix), job.codec
+                )
+            )
+            cache_key = azure_diarization.response_cache.key(
+                audio_digest, self.definition, self.url
+            )
+            json_data = azure_diarization.response_cache.get(cache_key)
+
+        attempts = size = 0
+        request_seconds = 0.0
+        if json_data is None:
+            t1 = time.perf_counter()
+            response, attempts, size = await batch_transcribe.post_with_retry(
+                self.session,
+                self.url,
+                self.SPEECH_KEY,
+                self.definition,
+                job.audio_path,
+                self.limiter,
+                self.retries,
+                make_body=make_body,
+            )
+            request_seconds = time.perf_counter() - t1
+            if response is None or response.status_code != 200:
+                job.events.put_nowait(
+                    {
+                        "event": "error",
+                        "status": (
+                            response.status_code if response is not None else None
+                        ),
+                        "error": (
+                            response.text[:500]
+                            if response is not None
+                            else "no response"
+                        ),
+                        "attempts": attempts,
+                    }
+                )
+                return False
+            json_data = response.json()
+            if self.use_cache:
+                azure_diarization.response_cache.put(cache_key, json_data)
+
+        table = (
+            PhraseTable.from_azure(json_data)
+            .rename(speaker_maps)
+            .after(signs_duration - 1)
+            .shift(-int(round(signs_duration * 1000)))
+        )
+        for record in table.records():
+            job.events.put_nowait({"event": "phrase", **record})
+
+        finished = time.perf_counter()
+        job.events.put_nowait(
+            {
+                "event": "done",
+                "phrases": len(table),
+                "cached": attempts == 0,
+                "attempts": attempts,
+                "bytes_uploaded": size,
+                "queued_seconds": started - job.created,
+                "request_seconds": request_seconds,
+                # Time spent in the service itself, outside the queue and the request
+                "overhead_seconds": finished - started - request_seconds,
+                "total_seconds": finished - job.created,
+            }
+        )
+        return True
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, ConnectionError):
+            writer.close()
+            return
+
+        target = urlparse(target)
+        try:
+            if method == "GET" and target.path == "/health":
+                await self._reply(writer, 200, self.health())
+            elif method == "POST" and target.path == "/transcribe":
+                await self.transcribe(reader, writer, headers, parse_qs(target.query))
+            else:
+                await self._reply(writer, 404, {"error": "NotFound"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def health(self) -> dict:
+        """
+        Queue and worker state.
+        """
+        return {
+            "status": "ok",
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "busy_workers": self.busy,
+            "workers": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def transcribe(self, reader, writer, headers: dict, query: dict):
+        if "content-length" not in headers:
+            await self._reply(writer, 411, {"error": "Content-Length required"})
+            return
+        try:
+            length = int(headers["content-length"])
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            await self._reply(
+                writer,
+                400,
+                {
+                    "event": "error",
+                    "status": 400,
+                    "error": f"Invalid Content-Length: {headers['content-length']!r}",
+                },
+                ndjson=True,
+            )
+            return
+        if length > max_upload_bytes:
+            await self._reply(writer, 413, {"error": "Upload too large"})
+            return
+        if self.queue.full():
+            await self._reply(
+                writer,
+                503,
+                {"error": "Queue full", **self.health()},
+                {"Retry-After": "1"},
+            )
+            return
+
+        roster = query.get("roster", [""])[0]
+        roster = [name for name in roster.split(",") if name] or None
+        codec = query.get("codec", ["wav"])[0]
+        try:
+            await asyncio.to_thread(upload.roster_prefix, roster)
+        except ValueError as e:
+            await self._reply(writer, 400, {"error": str(e)})
+            return
+
+        # Spool the upload so it can be decoded block by block like a local file
+        job_id = next(self.ids)
+        audio_path = os.path.join(self.upload_dir, f"{os.getpid()}_{job_id}.audio")
+        with open(audio_path, "wb") as f:
+            remaining = length
+            while remaining:
+                data = await reader.read(min(remaining, 1 << 16))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+        if remaining:
+            os.remove(audio_path)
+            return
+
+        job = Job(job_id, audio_path, roster, codec)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            os.remove(audio_path)
+            await self._reply(
+                writer,
+                503,
+                {"error": "Queue full", **self.health()},
+                {"Retry-After": "1"},
+            )
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        event = {"event": "queued", "job": job_id, "position": self.queue.qsize()}
+        while True:
+            data = (json.dumps(event) + "\n").encode()
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+            if event["event"] in ("done", "error"):
+                break
+            event = await job.events.get()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _reply(
+        self,
+        writer,
+        status: int,
+        payload: dict,
+        headers: dict = None,
+        ndjson: bool = False,
+    ):
+        # An NDJSON reply is one event line, read like a streamed response
+        if ndjson:
+            data = (json.dumps(payload) + "\n").encode()
+        else:
+            data = json.dumps(payload).encode()
+        head = [
+            f"HTTP/1.1 {status} {status_reasons[status]}",
+            f"Content-Type: application/{'x-ndjson' if ndjson else 'json'}",
+            f"Content-Length: {len(data)}",
+            "Connection: close",
+        ]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+
+def submit(service_url: str, audio_path: str, roster: list = None, codec: str = "wav"):
+    """
+    Upload a recording to a running service and yield its events as they arrive.
+
+    Args:
+        service_url (str): Base URL of the service, e.g. "http://127.0.0.1:8770".
+        audio_path (str): Path to the audio file to transcribe.
+        roster (list): Names of the speakers expected in the recording.
+        codec (str): Upload codec between the service and the provider.
+
+    Yields:
+        dict: "queued", "started", "phrase" and finally "done" or "error" events.
+    """
+    params = {"codec": codec}
+    if roster:
+        params["roster"] = ",".join(roster)
+    with open(audio_path, "rb") as f:
+        response = requests.post(
+            f"{service_url}/transcribe", params=params, data=f, stream=True
+        )
+    with response:
+        if response.status_code != 200:
+            yield {**response.json(), "event": "error", "status": response.status_code}
+            return
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+async def serve(service: TranscriptionService, host: str, port: int):
+    base_url = await service.start(host, port)
+    print(f"Transcription service listening on {base_url}")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local transcription service keeping signatures and connections warm."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Run the service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8770)
+    serve_parser.add_argument("--concurrency", type=int, default=2)
+    serve_parser.add_argument("--queue-size", type=int, default=16)
+    serve_parser.add_argument("--rate", type=float, default=0.0)
+    serve_parser.add_argument(
+        "--url", help="Override the transcription URL (e.g. a mock_azure_server)"
+    )
+    submit_parser = commands.add_parser("submit", help="Transcribe through a service")
+    submit_parser.add_argument("audio_path")
+    submit_parser.add_argument("--service", default="http://127.0.0.1:8770")
+    submit_parser.add_argument("--roster", nargs="+")
+    submit_parser.add_argument("--codec", default="wav")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        url, SPEECH_KEY = asyncio.run(azure_diarization.setup_azure())
+        if args.url:
+            url, SPEECH_KEY = args.url, SPEECH_KEY or "local"
+        service = TranscriptionService(
+            url,
+            SPEECH_KEY,
+            concurrency=args.concurrency,
+            queue_size=args.queue_size,
+            rate=args.rate,
+        )
+        try:
+            asyncio.run(serve(service, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        for event in submit(args.service, args.audio_path, args.roster, args.codec):
+            if event["event"] == "phrase":
+                print(
+                    f"Speaker: {event['speaker']}\nText: \"{event['text']}\"\n"
+                    f"Offset: {event['offsetMilliseconds'] / 1000}\n"
+                    f"Duration: {event['durationMilliseconds'] / 1000}",
+                    end="\n\n",
+                )
+            else:
+                print(json.dumps(event))
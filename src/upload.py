@@ -0,0 +1,406 @@
+import hashlib
+import json
+import os
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+import audio_codecs
+import utils
+from signature_bank import SignatureBank
+
+# Decoded signature prefixes kept in memory, keyed by the signature directory state
+_prefix_cache = {}
+_bank_cache = {}
+
+# Roster prefixes kept in memory, least recently used first
+_roster_cache = OrderedDict()
+roster_cache_size = 16
+
+
+def wav_header(
+    num_frames: int, sample_rate: int = 16000, channels: int = 1, sample_width: int = 2
+) -> bytes:
+    """
+    Build a canonical 44-byte PCM WAV header.
+
+    Args:
+        num_frames (int): Number of frames that will follow the header.
+        sample_rate (int): Sample rate in Hz.
+        channels (int): Number of channels.
+        sample_width (int): Bytes per sample.
+
+    Returns:
+        bytes: The RIFF/WAVE header.
+    """
+    data_size = num_frames * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        channels,
+        sample_rate,
+        sample_rate * channels * sample_width,
+        channels * sample_width,
+        sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+def _signatures_stamp(signatures_path: str) -> tuple:
+    # Changes whenever a signature file is added, removed or modified
+    stamp = []
+    for sign_file in sorted(os.listdir(signatures_path)):
+        if Path(sign_file).suffix.lower() in utils.signature_formats:
+            stat = os.stat(os.path.join(signatures_path, sign_file))
+            stamp.append((sign_file, stat.st_size, stat.st_mtime_ns))
+    return (os.path.abspath(signatures_path), tuple(stamp))
+
+
+def synced_bank(signatures_path: str = "known_speakers/audio_files/"):
+    """
+    The `SignatureBank`, synced with the signature directory when it changed.
+
+    Args:
+        signatures_path (str): Path to signatures directory
+
+    Returns:
+        SignatureBank: The synced bank.
+    """
+    key = _signatures_stamp(signatures_path)
+    if key not in _bank_cache:
+        bank = SignatureBank()
+        bank.sync(signatures_path)
+        if not bank.speakers:
+            raise ValueError(f"No signature files found in {signatures_path}.")
+        _bank_cache.clear()
+        _bank_cache[key] = bank
+    return _bank_cache[key]
+
+
+def signature_prefix(
+    signatures_path: str = "known_speakers/audio_files/",
+) -> (dict, bytes):
+    """
+    Return the speaker map and the signature prefix as 16-bit PCM bytes.
+
+    The signature directory is synced into the `SignatureBank` and the prefix
+    copied out of it once, then kept in memory until a signature file is added,
+    removed or modified. Use `roster_prefix` for zero-copy prefixes of a subset
+    of speakers.
+
+    Args:
+        signatures_path (str): Path to signatures directory
+
+    Returns:
+        dict: A dictionary mapping speaker IDs to speaker names
+        bytes: The concatenated int16 signature audio
+    """
+    key = _signatures_stamp(signatures_path)
+    if key not in _prefix_cache:
+        speaker_maps, parts = synced_bank(signatures_path).prefix()
+        _prefix_cache.clear()
+        _prefix_cache[key] = (
+            speaker_maps,
+            b"".join(part.tobytes() for part in parts),
+            np.cumsum([0] + [len(part) for part in parts]),
+        )
+    speaker_maps, prefix, _ = _prefix_cache[key]
+    return speaker_maps, prefix
+
+
+def roster_prefix(
+    roster: list = None,
+    signatures_path: str = "known_speakers/audio_files/",
+    sample_rate: int = 16000,
+) -> (dict, list, list):
+    """
+    Signature prefix holding only the speakers expected in a recording.
+
+    Names are matched case-insensitively and placed in the bank's default
+    order, so the same roster always yields the same prefix. The result is a list
+    of views of the memory-mapped bank; the most recently used rosters are kept
+    in a bounded LRU cache.
+
+    Args:
+        roster (list): Expected speaker names; None for every enrolled speaker.
+        signatures_path (str): Path to signatures directory
+        sample_rate (int): Sample rate of the prefix
+
+    Returns:
+        dict: A dictionary mapping the roster's positional speaker IDs to names
+        list: int16 views of the signatures, in prefix order
+        list: (speaker ID, start seconds, end seconds) for every signature
+    """
+    bank = synced_bank(signatures_path)
+    enrolled = {name.lower(): name for name in bank.speakers}
+    if roster is None:
+        names = sorted(bank.speakers, key=str.lower)
+    else:
+        unknown = [name for name in roster if name.lower() not in enrolled]
+        if unknown or not roster:
+            raise ValueError(
+                f"Roster names not enrolled: {', '.join(unknown) or '(empty roster)'}; "
+                f"enrolled speakers are {', '.join(sorted(bank.speakers))}."
+            )
+        names = sorted({enrolled[name.lower()] for name in roster}, key=str.lower)
+
+    key = tuple((name, bank.speakers[name]["sha256"]) for name in names)
+    if key in _roster_cache:
+        _roster_cache.move_to_end(key)
+        return _roster_cache[key]
+
+    speaker_maps, parts = bank.prefix(names)
+    bounds = np.cumsum([0] + [len(part) for part in parts])
+    segments = [
+        (speaker_id, bounds[i] / sample_rate, bounds[i + 1] / sample_rate)
+        for i, speaker_id in enumerate(speaker_maps)
+    ]
+    _roster_cache[key] = (speaker_maps, parts, segments)
+    while len(_roster_cache) > roster_cache_size:
+        _roster_cache.popitem(last=False)
+    return _roster_cache[key]
+
+
+def roster_prefix_wav(
+    roster: list = None,
+    signatures_path: str = "known_speakers/audio_files/",
+    output_dir: str = ".build/roster_signs",
+) -> (dict, str):
+    """
+    Write a roster's signature prefix as a WAV file for the file-based pipeline.
+
+    Files are named after the roster's content, reused while they exist and
+    pruned to the `roster_cache_size` most recently used.
+
+    Args:
+        roster (list): Expected speaker names; None for every enrolled speaker.
+        signatures_path (str): Path to signatures directory
+        output_dir (str): Directory for the prefix files.
+
+    Returns:
+        dict: A dictionary mapping the roster's positional speaker IDs to names
+        str: Path to the prefix WAV
+    """
+    speaker_maps, parts, _ = roster_prefix(roster, signatures_path)
+    bank = synced_bank(signatures_path)
+    digest = hashlib.sha256(
+        json.dumps(
+            [(name, bank.speakers[name]["sha256"]) for name in speaker_maps.values()]
+        ).encode()
+    ).hexdigest()[:16]
+    path = os.path.join(output_dir, f"{digest}.wav")
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        frames = sum(len(part) for part in parts)
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+            f.write(wav_header(frames))
+            for part in parts:
+                f.write(memoryview(part).cast("B"))
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+        prefixes = sorted(Path(output_dir).glob("*.wav"), key=os.path.getmtime)
+        for stale in prefixes[:-roster_cache_size]:
+            stale.unlink(missing_ok=True)
+    return speaker_maps, path
+
+
+def prefix_digest(prefix) -> str:
+    """
+    SHA-256 of a signature prefix.
+
+    Args:
+        prefix: PCM bytes or a list of int16 views, as taken by
+            `MultipartAudioBody`.
+
+    Returns:
+        str: Hex digest of the prefix samples.
+    """
+    if isinstance(prefix, (bytes, bytearray, memoryview)):
+        prefix = [prefix]
+    digest = hashlib.sha256()
+    for part in prefix:
+        digest.update(memoryview(part).cast("B"))
+    return digest.hexdigest()
+
+
+def upload_digest(audio_file: str, prefix_digest: str, codec: str = "wav") -> str:
+    """
+    Identify an upload before its body or combined file is built.
+
+    Only the recording's file is hashed; nothing is decoded or encoded, so a
+    response cache keyed on it is hit without paying for either.
+
+    Args:
+        audio_file (str): Path to the recording.
+        prefix_digest (str): Digest of the signature prefix sent before it,
+            e.g. from `prefix_digest` or `utils.file_digest` of the prefix WAV.
+        codec (str): The upload codec.
+
+    Returns:
+        str: Hex digest of the recording, prefix and codec.
+    """
+    return hashlib.sha256(
+        f"{utils.file_digest(audio_file)}:{prefix_digest}:{codec}".encode()
+    ).hexdigest()
+
+
+def signature_segments(
+    signatures_path: str = "known_speakers/audio_files/", sample_rate: int = 16000
+) -> list:
+    """
+    Time ranges of each signature inside the prefix returned by `signature_prefix`.
+
+    Args:
+        signatures_path (str): Path to signatures directory
+        sample_rate (int): Sample rate of the prefix
+
+    Returns:
+        list: (speaker ID, start seconds, end seconds) for every signature
+    """
+    signature_prefix(signatures_path)
+    speaker_maps, _, bounds = next(iter(_prefix_cache.values()))
+    return [
+        (speaker_id, bounds[i] / sample_rate, bounds[i + 1] / sample_rate)
+        for i, speaker_id in enumerate(speaker_maps)
+    ]
+
+
+class MultipartAudioBody:
+    """
+    Streaming multipart/form-data body for the `transcriptions:transcribe` endpoint.
+
+    The `audio` part is a WAV file made of a header, the in-memory signature prefix
+    and the user audio decoded block by block with `utils.iter_pcm16`. The total
+    length is known up front, so `requests` sends it with a Content-Length header
+    instead of chunked encoding, and nothing is written to disk. `start` and `stop`
+    (seconds) restrict the upload to a window of the recording. With a `codec`
+    other than "wav" the audio is encoded in memory (see `audio_codecs.encode_pcm16`)
+    before sending. `prefix` is either PCM bytes or a list of int16 views such as
+    those returned by `SignatureBank.prefix`, which are sent without copying.
+    """
+
+    def __init__(
+        self,
+        definition: dict,
+        prefix,
+        audio_file: str,
+        sample_rate: int = 16000,
+        block_size: int = 1 << 16,
+        start: float = 0.0,
+        stop: float = None,
+        codec: str = "wav",
+    ):
+        self.boundary = uuid.uuid4().hex
+        # Raw PCM bytes, or int16 views of a `SignatureBank` sent without copying
+        if isinstance(prefix, (bytes, bytearray, memoryview)):
+            prefix = [prefix]
+        self.prefix = [memoryview(part).cast("B") for part in prefix]
+        self.audio_file = audio_file
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.start = start
+        self.stop = stop
+        self.codec = codec
+
+        self.audio_frames = utils.pcm16_length(audio_file, sample_rate, start, stop)
+        self.prefix_frames = sum(len(part) for part in self.prefix) // 2
+        self.num_frames = self.prefix_frames + self.audio_frames
+
+        # Compressed codecs are encoded up front; only the encoded bytes are held
+        _, _, mime_type, extension = audio_codecs.codecs[codec]
+        self._encoded = None
+        if codec != "wav":
+            self._encoded = audio_codecs.encode_pcm16(
+                self._audio_chunks(), sample_rate, codec
+            )
+
+        self._audio_head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="audio"; filename="{Path(audio_file).stem}{extension}"\r\n'
+            f"Content-Type: {mime_type}\r\n\r\n"
+        ).encode()
+        if self._encoded is None:
+            self._audio_head += wav_header(self.num_frames, sample_rate)
+        self._tail = (
+            f"\r\n--{self.boundary}\r\n"
+            'Content-Disposition: form-data; name="definition"\r\n'
+            "Content-Type: application/json\r\n\r\n"
+            f"{json.dumps(definition)}\r\n"
+            f"--{self.boundary}--\r\n"
+        ).encode()
+        # perf_counter() when the last byte was yielded (see `__iter__`)
+        self.sent_at = None
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        if self._encoded is not None:
+            return len(self._audio_head) + len(self._encoded) + len(self._tail)
+        return len(self._audio_head) + self.num_frames * 2 + len(self._tail)
+
+    def _audio_chunks(self):
+        yield from self.prefix
+
+        # Stream the user audio, holding it to the length announced in the header
+        remaining = self.audio_frames
+        for block in utils.iter_pcm16(
+            self.audio_file, self.sample_rate, self.block_size, self.start, self.stop
+        ):
+            block = block[:remaining]
+            remaining -= len(block)
+            yield block.tobytes()
+        if remaining:
+            yield bytes(remaining * 2)
+
+    def __iter__(self):
+        self.sent_at = None
+        yield self._audio_head
+        if self._encoded is not None:
+            yield self._encoded
+        else:
+            yield from self._audio_chunks()
+        yield self._tail
+        self.sent_at = time.perf_counter()
+
+
+class AudioFileBody(MultipartAudioBody):
+    """
+    The `audio` part of a `MultipartAudioBody` on its own, as a plain audio file.
+
+    Used to upload the prefixed recording to blob storage for the batch API: a
+    streamed WAV with a known length or, for other codecs, the encoded file.
+    """
+
+    def __init__(self, prefix, audio_file: str, codec: str = "wav", **kwargs):
+        super().__init__({}, prefix, audio_file, codec=codec, **kwargs)
+
+    @property
+    def content_type(self) -> str:
+        return audio_codecs.codecs[self.codec][2]
+
+    def __len__(self) -> int:
+        if self._encoded is not None:
+            return len(self._encoded)
+        return 44 + self.num_frames * 2
+
+    def __iter__(self):
+        self.sent_at = None
+        if self._encoded is not None:
+            yield self._encoded
+        else:
+            yield wav_header(self.num_frames, self.sample_rate)
+            yield from self._audio_chunks()
+        self.sent_at = time.perf_counter()
@@ -1,18 +1,23 @@
-import sounddevice as sd
 import numpy as np
 import wave
 from pathlib import Path
-from scipy.signal import resample
-from scipy.io.wavfile import write
 import os
 import subprocess
-import soundfile as sf
 from typing import List
 import asyncio
 import json
+import hashlib
+import math
+import time
 
+from audio_header import get_wav_duration, wav_duration
+from transcript import PhraseTable
+from tracing import tracer
 
 sign_dir = "data/signatures/"  # Directory to save audio signatures
+signature_cache_dir = ".build/signature_cache"  # Decoded signature bank cache
+combined_signs_path = ".build/combined_signs.wav"  # Full signature prefix
+signature_formats = [".wav", ".mp3", ".m4a", ".flac", ".ogg"]
 
 
 # Function to record audio
@@ -24,6 +29,9 @@ async def record_audio(filename: str, duration: int):
         filename (str): The name of the file to save the audio to (with .wav extension).
         duration (int): The duration of the recording in seconds.
     """
+    # PortAudio is only needed for recording
+    import sounddevice as sd
+
     # Audio format parameters
     sample_rate = 16000  # 16 kHz
     channels = 1  # Mono
@@ -64,76 +72,322 @@ async def sign(user: str, dur: int = 4):
 
 # Convert audio file to wav format
 async def convert_to_wav(
-    file_path: str, target_sample_rate: str = "16000", target_channels: str = "1"
-):
+    file_path: str,
+    target_sample_rate: str = "16000",
+    target_channels: str = "1",
+    output_path: str = None,
+) -> str:
     """
-    Convert an audio file to .wav format using ffmpeg and delete the original file.
+    Convert an audio file to .wav format using ffmpeg. The source file is kept.
 
     Args:
         file_path (str): The path to the audio file to convert.
+        target_sample_rate (str): Target sample rate in Hz.
+        target_channels (str): Target number of channels.
+        output_path (str): Path of the converted file; defaults to the source
+            path with a .wav suffix.
+
+    Returns:
+        str: Path to the converted file.
+    """
+    output_path = output_path or str(Path(file_path).with_suffix(".wav"))
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-y",
+        "-i",
+        file_path,
+        "-ar",
+        target_sample_rate,
+        "-ac",
+        target_channels,
+        "-c:a",
+        "pcm_s16le",
+        output_path,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"Error converting {file_path} to .wav using ffmpeg: "
+            f"{stderr.decode(errors='replace').strip().splitlines()[-1:]}"
+        )
+    return output_path
+
+
+def _is_target_wav(info, target_samplerate: int) -> bool:
+    return (
+        info.format == "WAV"
+        and info.subtype == "PCM_16"
+        and info.samplerate == target_samplerate
+        and info.channels == 1
+    )
+
+
+async def normalize_audio_dir(
+    audio_path: str = "known_speakers/audio_files",
+    output_dir: str = ".build/normalized",
+    workers: int = os.cpu_count() or 4,
+    target_samplerate: int = 16000,
+) -> (dict, list):
+    """
+    Bring every audio file in a directory to 16-bit mono WAV at the target rate.
+
+    Conversion is incremental and non-destructive:
+    - Files that already are 16-bit mono WAV at the target rate are used in place.
+    - Formats `soundfile` can read are decoded and resampled in-process (in a
+      worker thread) with `stream_combine_audio`.
+    - Anything else goes through ffmpeg.
+    - A manifest in `output_dir` records each source's size, mtime and SHA-256;
+      sources whose stat or content hash is unchanged and whose output exists are
+      skipped.
+    Up to `workers` conversions run at once. Sources are never modified or deleted.
+
+    Args:
+        audio_path (str): The directory containing the audio files.
+        output_dir (str): Directory for converted files and the manifest.
+        workers (int): Maximum number of concurrent conversions.
+        target_samplerate (int): Target sample rate in Hz.
+
+    Returns:
+        dict: Source file name to the WAV path to read it from.
+        list: Per-file timings: file, method (skip, wav, soundfile, ffmpeg or
+            failed) and seconds.
     """
+    import soundfile as sf
+
+    out_dir = os.path.join(
+        output_dir,
+        hashlib.sha256(os.path.abspath(audio_path).encode()).hexdigest()[:16],
+    )
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
     try:
-        output_path = str(Path(file_path).with_suffix(".wav"))
-        process = asyncio.create_subprocess_exec(
-            "ffmpeg",
-            "-i",
-            file_path,
-            "-ar",
-            target_sample_rate,
-            "-ac",
-            target_channels,
-            output_path,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError, ValueError):
+        manifest = {}
+
+    readable = {f".{ext.lower()}" for ext in sf.available_formats()} | {".mp3", ".ogg"}
+    semaphore = asyncio.Semaphore(max(1, workers))
+    outputs = {}
+    timings = []
+    new_manifest = {}
+
+    async def normalize(source: Path):
+        t1 = time.perf_counter()
+        stat = source.stat()
+        entry = manifest.get(source.name, {})
+        output_path = os.path.join(out_dir, f"{source.name}.wav")
+        method = "skip"
+
+        if (entry.get("size"), entry.get("mtime_ns")) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            content_hash = entry["sha256"]
+        else:
+            content_hash = await asyncio.to_thread(file_digest, str(source))
+
+        if entry.get("sha256") == content_hash and os.path.exists(
+            entry.get("output", "")
+        ):
+            output_path = entry["output"]
+        else:
+            async with semaphore:
+                try:
+                    info = (
+                        sf.info(str(source))
+                        if source.suffix.lower() in readable
+                        else None
+                    )
+                except RuntimeError:
+                    info = None
+                try:
+                    if info is not None and _is_target_wav(info, target_samplerate):
+                        method = "wav"
+                        output_path = str(source)
+                    elif info is not None:
+                        method = "soundfile"
+                        await asyncio.to_thread(
+                            stream_combine_audio,
+                            [str(source)],
+                            output_path,
+                            target_samplerate,
+                        )
+                    else:
+                        method = "ffmpeg"
+                        await convert_to_wav(
+                            str(source), str(target_samplerate), "1", output_path
+                        )
+                except (RuntimeError, OSError) as e:
+                    print(f"Could not normalize {source.name}: {e}")
+                    timings.append(
+                        {
+                            "file": source.name,
+                            "method": "failed",
+                            "seconds": time.perf_counter() - t1,
+                        }
+                    )
+                    return
+
+        outputs[source.name] = output_path
+        new_manifest[source.name] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash,
+            "output": output_path,
+        }
+        timings.append(
+            {"file": source.name, "method": method, "seconds": time.perf_counter() - t1}
         )
-        process.communicate()
-        Path(file_path).unlink()
-    except subprocess.CalledProcessError as e:
-        print(f"Error converting {file_path} to .wav using ffmpeg: {e}")
+
+    sources = [
+        path
+        for path in sorted(Path(audio_path).iterdir())
+        if path.is_file() and path.suffix.lower() in signature_formats
+    ]
+    await asyncio.gather(*(normalize(source) for source in sources))
+
+    # Drop converted files whose source is gone
+    for name, entry in manifest.items():
+        if name not in new_manifest and entry.get("output", "").startswith(out_dir):
+            Path(entry["output"]).unlink(missing_ok=True)
+
+    with open(manifest_path, "w") as f:
+        json.dump(new_manifest, f, indent=4)
+
+    timings.sort(key=lambda timing: -timing["seconds"])
+    for timing in timings:
+        if timing["method"] in ("soundfile", "ffmpeg"):
+            print(
+                f"Normalized {timing['file']} via {timing['method']} in {timing['seconds']:.3f}s"
+            )
+    return outputs, timings
+
+
+def normalized_paths(
+    audio_path: str = "known_speakers/audio_files", workers: int = os.cpu_count() or 4
+) -> dict:
+    """
+    Blocking `normalize_audio_dir` for synchronous callers.
+
+    Runs the conversion on its own event loop, in a separate thread when the
+    caller is itself running inside an event loop.
+
+    Args:
+        audio_path (str): The directory containing the audio files.
+        workers (int): Maximum number of concurrent conversions.
+
+    Returns:
+        dict: Source file name to the WAV path to read it from.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(normalize_audio_dir(audio_path, workers=workers))[0]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(
+            lambda: asyncio.run(normalize_audio_dir(audio_path, workers=workers))
+        ).result()[0]
 
 
 # Convert all audio files in a directory to wav format
 async def convert_all_to_wav(
     audio_path: str = "known_speakers/audio_files",
-):
+    workers: int = os.cpu_count() or 4,
+) -> (dict, list):
     """
     Convert all audio files in a directory to .wav format with specified configurations.
 
+    Thin wrapper over `normalize_audio_dir`; converted files are written under
+    `.build/normalized` and the originals are left untouched.
+
     Args:
         audio_path (str): The directory containing the audio files.
-        target_sample_rate (int): Target sample rate in Hz. Default is 16000 Hz.
-        target_channels (int): Target number of channels. Default is 1 (Mono).
-    """
-    # Supported audio file extensions
-    audio_formats = [".mp3", ".m4a", ".flac", ".ogg"]
+        workers (int): Maximum number of concurrent conversions.
 
-    # Iterate over all files in the directory
-    for audio_file in Path(audio_path).glob("*"):
-        if audio_file.suffix in audio_formats:
-            await convert_to_wav(str(audio_file))
-        elif audio_file.suffix != ".wav":
-            # Delete non-wav audio files
-            Path(audio_file).unlink()
-            print(f"Deleted non-wav file: {audio_file}")
+    Returns:
+        dict: Source file name to the WAV path to read it from.
+        list: Per-file timings.
+    """
+    return await normalize_audio_dir(audio_path, workers=workers)
 
 
 async def combine_audio(
-    audio_file_paths: List[str], output_name: str = "combined_audio"
+    audio_file_paths: List[str],
+    output_name: str = "combined_audio",
+    stream: bool = False,
+    block_size: int = 1 << 16,
 ) -> str:
     """
     Combine multiple audio files into a single audio file.
 
+    Decoding, resampling and concatenation run off the event loop in
+    `audio_pool`: on threads, or in its worker processes once a long-lived
+    caller has started them, with the samples passed back through shared
+    memory. The output is written from a thread. With `stream=True` the inputs
+    are read, resampled and written block by block (see `stream_combine_audio`)
+    in a worker, so peak memory does not depend on input length.
+
     Args:
         audio_file_paths (List[str]): List of paths to the audio files to combine.
         output_name (str): Name of the output audio file.
+        stream (bool): Use the bounded-memory streaming path.
+        block_size (int): Frames read per block in streaming mode.
 
     Returns:
         str: Path to the combined audio file.
     """
+    import audio_pool
+
     if not audio_file_paths:
         raise ValueError("No audio files provided.")
 
-    target_samplerate = 16000  # 16 kHz
+    # Ensure the output directory exists
+    output_dir = ".build"
+    os.makedirs(output_dir, exist_ok=True)
+    combined_file_path = os.path.join(output_dir, f"{output_name}.wav")
+
+    if stream:
+        await audio_pool.run(
+            stream_combine_audio,
+            audio_file_paths,
+            combined_file_path,
+            16000,
+            block_size,
+        )
+    else:
+        # Save the combined audio as 16-bit 16 kHz WAV
+        await audio_pool.combine(audio_file_paths, combined_file_path)
+    print(f"Combined audio saved as {combined_file_path}")
+    return combined_file_path
+
+
+def combine_pcm16(
+    audio_file_paths: List[str], output_path: str, target_samplerate: int = 16000
+) -> str:
+    """
+    Combine audio files into a 16-bit mono WAV in memory, on the calling thread.
+
+    This is the blocking equivalent of `combine_audio`; both produce the same
+    samples.
+
+    Args:
+        audio_file_paths (List[str]): List of paths to the audio files to combine.
+        output_path (str): Path of the output WAV file.
+        target_samplerate (int): Sample rate of the output.
+
+    Returns:
+        str: `output_path`.
+    """
+    import soundfile as sf
+    from scipy.io.wavfile import write
+    from scipy.signal import resample
+
     combined_data = None
 
     for file_path in audio_file_paths:
@@ -144,6 +398,10 @@ async def combine_audio(
         if np.issubdtype(data.dtype, np.integer):
             data = data / np.iinfo(data.dtype).max
 
+        # Downmix multichannel audio to mono
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+
         # Resample if the sample rate is different from the target
         if sr != target_samplerate:
             num_samples = int(len(data) * target_samplerate / sr)
@@ -161,94 +419,684 @@ async def combine_audio(
     # Convert to 16-bit PCM
     combined_data = (combined_data * 32767).astype(np.int16)
 
-    # Ensure the output directory exists
-    output_dir = ".build"
-    os.makedirs(output_dir, exist_ok=True)
+    write(output_path, target_samplerate, combined_data)
+    return output_path
 
-    # Save the combined audio as 16-bit 16 kHz WAV
-    combined_file_path = os.path.join(output_dir, f"{output_name}.wav")
-    write(combined_file_path, target_samplerate, combined_data)
-    print(f"Combined audio saved as {combined_file_path}")
 
-    return combined_file_path
+class StreamingResampler:
+    """
+    Chunked polyphase resampler for arbitrarily long signals.
 
+    Blocks pushed through `process` are resampled with `resample_poly` over a window
+    that carries enough neighbouring context for the FIR filter, and only the outputs
+    owned by the block are emitted. Output boundaries are kept on multiples of the
+    decimation factor, so the concatenated output equals `resample_poly` applied to
+    the whole signal, up to floating point rounding. Memory use is bounded by the
+    block size plus the filter context.
+    """
 
-import json
-import os
+    def __init__(self, source_rate: int, target_rate: int):
+        g = math.gcd(source_rate, target_rate)
+        self.up = target_rate // g
+        self.down = source_rate // g
 
+        # Same low-pass design as resample_poly's default window
+        max_rate = max(self.up, self.down)
+        self.window = None
+        self.pad = 0
+        if max_rate > 1:
+            from scipy.signal import firwin
 
-async def speaker_map_processor(
-    audio_file: str,
+            self.window = firwin(
+                2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0)
+            )
+            # Input context needed on each side, rounded up to a multiple of `down`
+            pad = -(-len(self.window) // self.up) + 1
+            self.pad = -(-pad // self.down) * self.down
+
+        self._buffer = np.zeros(0)
+        self._buffer_start = 0  # Input index of the first buffered sample
+        self._emitted = 0  # Input index up to which output has been produced
+
+    def _emit(self, end: int, final: bool = False) -> np.ndarray:
+        seg_start = max(0, self._emitted - self.pad)
+        seg = self._buffer[seg_start - self._buffer_start :]
+        if not final:
+            seg = seg[: end + self.pad - seg_start]
+        from scipy.signal import resample_poly
+
+        out = resample_poly(seg, self.up, self.down, window=self.window)
+        first = (self._emitted - seg_start) * self.up // self.down
+        if final:
+            out = out[first:]
+        else:
+            out = out[first : first + (end - self._emitted) * self.up // self.down]
+        self._emitted = end
+
+        # Drop input that is no longer needed as filter context
+        keep_from = max(0, self._emitted - self.pad)
+        self._buffer = self._buffer[keep_from - self._buffer_start :]
+        self._buffer_start = keep_from
+        return out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Push a block of mono samples and return the output that is ready.
+
+        Args:
+            block (np.ndarray): The next block of input samples.
+
+        Returns:
+            np.ndarray: Resampled output (may be empty).
+        """
+        if self.up == self.down == 1:
+            return block
+        self._buffer = np.concatenate((self._buffer, block))
+        total = self._buffer_start + len(self._buffer)
+        end = (total - self.pad) // self.down * self.down
+        if end <= self._emitted:
+            return np.zeros(0)
+        return self._emit(end)
+
+    def flush(self) -> np.ndarray:
+        """
+        Return the remaining output once the input is exhausted.
+
+        Returns:
+            np.ndarray: The tail of the resampled output.
+        """
+        if self.up == self.down == 1 or len(self._buffer) == 0:
+            return np.zeros(0)
+        total = self._buffer_start + len(self._buffer)
+        return self._emit(total, final=True)
+
+
+def _frame_range(info, start: float, stop: float) -> (int, int):
+    first = min(info.frames, int(round(start * info.samplerate)))
+    last = info.frames if stop is None else int(round(stop * info.samplerate))
+    return first, max(first, min(info.frames, last))
+
+
+def pcm16_length(
+    file_path: str,
+    target_samplerate: int = 16000,
+    start: float = 0.0,
+    stop: float = None,
+) -> int:
+    """
+    Number of frames `iter_pcm16` will produce for a file, read from its header.
+
+    Args:
+        file_path (str): Path to the audio file.
+        target_samplerate (int): Sample rate of the decoded audio.
+        start (float): Start of the decoded range in seconds.
+        stop (float): End of the decoded range in seconds (None for the end).
+
+    Returns:
+        int: Output length in frames.
+    """
+    import soundfile as sf
+
+    info = sf.info(file_path)
+    first, last = _frame_range(info, start, stop)
+    if info.samplerate == target_samplerate:
+        return last - first
+    return -(-(last - first) * target_samplerate // info.samplerate)
+
+
+def iter_pcm16(
+    file_path: str,
+    target_samplerate: int = 16000,
+    block_size: int = 1 << 16,
+    start: float = 0.0,
+    stop: float = None,
+):
+    """
+    Decode an audio file into 16-bit mono PCM blocks at the target sample rate.
+
+    Multi-channel input is downmixed to mono. Quantisation matches `combine_audio`.
+
+    Args:
+        file_path (str): Path to the audio file.
+        target_samplerate (int): Sample rate of the decoded audio.
+        block_size (int): Frames read per block.
+        start (float): Start of the decoded range in seconds.
+        stop (float): End of the decoded range in seconds (None for the end).
+
+    Yields:
+        np.ndarray: int16 blocks of decoded audio.
+    """
+    import soundfile as sf
+
+    with sf.SoundFile(file_path) as f:
+        first, last = _frame_range(f, start, stop)
+        f.seek(first)
+        resampler = StreamingResampler(f.samplerate, target_samplerate)
+        for block in f.blocks(
+            blocksize=block_size, frames=last - first, always_2d=True
+        ):
+            data = resampler.process(block.mean(axis=1))
+            if len(data):
+                yield (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+        data = resampler.flush()
+        if len(data):
+            yield (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def pcm_chunks(
+    file_path: str,
+    chunk_ms: int = 100,
+    target_samplerate: int = 16000,
+    start: float = 0.0,
+    stop: float = None,
+):
+    """
+    Yield raw 16-bit mono PCM in chunks of exactly `chunk_ms` of audio.
+
+    The file is decoded with `iter_pcm16`, so the WAV header (or any other
+    container) never reaches the stream, and other sample rates and channel
+    layouts are converted on the fly. Only the last chunk may be shorter.
+
+    Args:
+        file_path (str): Path to the audio file.
+        chunk_ms (int): Duration of each chunk in milliseconds.
+        target_samplerate (int): Sample rate of the stream.
+        start (float): Start of the streamed range in seconds.
+        stop (float): End of the streamed range in seconds (None for the end).
+
+    Yields:
+        bytes: Little-endian PCM chunks.
+    """
+    chunk_bytes = target_samplerate * chunk_ms // 1000 * 2
+    pending = b""
+    for block in iter_pcm16(file_path, target_samplerate, start=start, stop=stop):
+        pending += block.astype("<i2").tobytes()
+        usable = len(pending) - len(pending) % chunk_bytes
+        for i in range(0, usable, chunk_bytes):
+            yield pending[i : i + chunk_bytes]
+        pending = pending[usable:]
+    if pending:
+        yield pending
+
+
+async def pcm_chunks_async(
+    file_path: str,
+    chunk_ms: int = 100,
+    target_samplerate: int = 16000,
+    start: float = 0.0,
+    stop: float = None,
+    max_pending: int = 8,
+):
+    """
+    `pcm_chunks` decoded in a worker thread, for senders on the event loop.
+
+    The thread hands chunks over through a bounded `asyncio.Queue`, so it
+    decodes at most `max_pending` chunks ahead of the consumer. Decoding
+    errors are raised in the consumer. If the consumer stops early, the thread
+    is stopped too.
+
+    Args:
+        file_path (str): Path to the audio file.
+        chunk_ms (int): Duration of each chunk in milliseconds.
+        target_samplerate (int): Sample rate of the stream.
+        start (float): Start of the streamed range in seconds.
+        stop (float): End of the streamed range in seconds (None for the end).
+        max_pending (int): Chunks decoded ahead of the consumer.
+
+    Yields:
+        bytes: Little-endian PCM chunks.
+    """
+    import threading
+
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=max_pending)
+    cancelled = threading.Event()
+    done = object()
+
+    def put(item):
+        # Wait for room in the queue, unless the consumer has gone away
+        future = asyncio.run_coroutine_threadsafe(chunks.put(item), loop)
+        while not cancelled.is_set():
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                pass
+        future.cancel()
+
+    def decode():
+        try:
+            for chunk in pcm_chunks(
+                file_path, chunk_ms, target_samplerate, start=start, stop=stop
+            ):
+                if cancelled.is_set():
+                    return
+                put(chunk)
+        except Exception as e:
+            put(e)
+        else:
+            put(done)
+
+    decoder = asyncio.create_task(asyncio.to_thread(decode))
+    try:
+        while (chunk := await chunks.get()) is not done:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        await decoder
+
+
+def stream_combine_audio(
+    audio_file_paths: List[str],
+    output_path: str,
+    target_samplerate: int = 16000,
+    block_size: int = 1 << 16,
+) -> int:
+    """
+    Combine audio files into a 16-bit mono WAV without holding them in memory.
+
+    Each input is decoded block by block through `iter_pcm16` and appended to the
+    output file as it is produced. Inputs already at the target rate are copied
+    sample-exactly relative to `combine_audio`; resampled inputs use a polyphase
+    filter instead of the FFT resampler and differ from the in-memory path by
+    less than 1e-3 of full scale RMS (away from the first and last few
+    milliseconds, where the FFT resampler wraps around).
+
+    Args:
+        audio_file_paths (List[str]): List of paths to the audio files to combine.
+        output_path (str): Path of the output WAV file.
+        target_samplerate (int): Sample rate of the output.
+        block_size (int): Frames read per block.
+
+    Returns:
+        int: Number of frames written.
+    """
+    import soundfile as sf
+
+    frames = 0
+    with sf.SoundFile(
+        output_path, "w", samplerate=target_samplerate, channels=1, subtype="PCM_16"
+    ) as out:
+        for file_path in audio_file_paths:
+            for block in iter_pcm16(file_path, target_samplerate, block_size):
+                out.write(block)
+                frames += len(block)
+    return frames
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 content hash of a file without loading it whole.
+
+    Args:
+        file_path (str): Path to the file to hash.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def decode_signature(file_path: str, target_samplerate: int = 16000) -> np.ndarray:
+    """
+    Decode a signature file into 16-bit PCM at the target sample rate.
+
+    Uses the same normalisation, resampling and quantisation as `combine_audio`,
+    so a bank assembled from decoded signatures is sample-identical to one
+    produced by combining the files directly.
+
+    Args:
+        file_path (str): Path to the signature audio file.
+        target_samplerate (int): Sample rate of the decoded audio.
+
+    Returns:
+        np.ndarray: The decoded int16 samples.
+    """
+    import soundfile as sf
+
+    data, sr = sf.read(file_path)
+
+    # Normalize audio if it's integer-based
+    if np.issubdtype(data.dtype, np.integer):
+        data = data / np.iinfo(data.dtype).max
+
+    # Downmix multichannel audio to mono
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+
+    # Resample if the sample rate is different from the target
+    if sr != target_samplerate:
+        from scipy.signal import resample
+
+        num_samples = int(len(data) * target_samplerate / sr)
+        data = resample(data, num_samples)
+
+    return (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def speaker_name(sign_file: str) -> str:
+    """
+    Speaker name for a signature file: its stem in title case.
+    """
+    return os.path.splitext(sign_file)[0].title()
+
+
+def signature_files(signatures_path: str, decode_paths: dict = None) -> List[str]:
+    """
+    Signature files in a directory, one per speaker, in prefix order.
+
+    Speakers are ordered by name, case-insensitively, the same order
+    `SignatureBank.prefix` uses, so positional speaker IDs agree between the
+    file and in-memory paths. When several files name the same speaker
+    (`alice.wav` and `alice.m4a`, or `Alice.wav` and `alice.wav`), the one in
+    the earliest `signature_formats` entry is kept and the others are reported.
+
+    Args:
+        signatures_path (str): Path to signatures directory
+        decode_paths (dict): When given, only files present in it are listed
+
+    Returns:
+        List[str]: Signature file names
+    """
+    candidates = sorted(
+        (
+            speaker_name(sign_file).lower(),
+            signature_formats.index(Path(sign_file).suffix.lower()),
+            sign_file,
+        )
+        for sign_file in os.listdir(signatures_path)
+        if Path(sign_file).suffix.lower() in signature_formats
+        and (decode_paths is None or sign_file in decode_paths)
+    )
+    kept = {}
+    for name, _, sign_file in candidates:
+        if name in kept:
+            print(
+                f"Skipping signature {sign_file}: {kept[name]} already provides "
+                f"{speaker_name(sign_file)}"
+            )
+            continue
+        kept[name] = sign_file
+    return list(kept.values())
+
+
+def load_signature_bank(
     signatures_path: str = "known_speakers/audio_files/",
-    speakers_json: str = "known_speakers/speaker_maps.json",
-    output: str = "combined_audio",
-) -> (dict, str):
+    cache_dir: str = signature_cache_dir,
+    target_samplerate: int = 16000,
+    decode_paths: dict = None,
+) -> (List[str], List[np.ndarray], bool):
     """
-    Combine all signature files and append the final audio buffer into a single .wav file.
-    The audio buffer is first converted to .wav before concatenation.
+    Load the decoded signature bank, re-decoding only entries that changed.
+
+    Every signature is keyed by the SHA-256 of its contents and the target format,
+    and its decoded samples are persisted as `<key>.npy` in the cache directory.
+    An index maps file names to their keys so unchanged files are not even re-hashed
+    (their size and mtime are compared first). Entries whose files were removed are
+    evicted from the cache.
 
     Args:
-        audio_file (str): Path to the input audio file
         signatures_path (str): Path to signatures directory
-        speakers_json (str): Path to the speaker maps JSON file
-        output (str): Name of the output .wav file
+        cache_dir (str): Directory holding the decoded signature cache
+        target_samplerate (int): Sample rate of the decoded signatures
+        decode_paths (dict): Signature file name to the file to decode it from,
+            as returned by `normalize_audio_dir`; signatures missing from it
+            are skipped
+
+    Returns:
+        List[str]: Signature file names, as listed by `signature_files`
+        List[np.ndarray]: Decoded int16 samples for each signature
+        bool: Whether any entry was added, changed or removed
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "index.json")
+    target_format = f"{target_samplerate}:int16"
+
+    # Load the previous index, discarding it if it was built for another format
+    index = {"format": target_format, "entries": {}}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("format") == target_format:
+                index = cached
+        except (json.JSONDecodeError, ValueError, AttributeError):
+            print("Signature cache index is corrupted. Rebuilding signature cache.")
+
+    sign_files = signature_files(signatures_path, decode_paths)
+    changed = set(index["entries"]) != set(sign_files)
+
+    entries = {}
+    bank = []
+    for sign_file in sign_files:
+        file_path = os.path.join(signatures_path, sign_file)
+        stat = os.stat(file_path)
+        entry = index["entries"].get(sign_file)
+
+        # Only re-hash files whose size or mtime moved
+        if entry is None or (entry["size"], entry["mtime_ns"]) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            content_hash = file_digest(file_path)
+        else:
+            content_hash = entry["sha256"]
+
+        key = hashlib.sha256(f"{content_hash}:{target_format}".encode()).hexdigest()
+        npy_path = os.path.join(cache_dir, f"{key}.npy")
+        try:
+            data = np.load(npy_path)
+        except (OSError, ValueError):
+            print(f"Decoding signature {sign_file}")
+            data = decode_signature(
+                (decode_paths or {}).get(sign_file, file_path), target_samplerate
+            )
+            np.save(npy_path, data)
+            changed = True
+        if entry is None or entry["key"] != key:
+            changed = True
+
+        entries[sign_file] = {
+            "sha256": content_hash,
+            "key": key,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "samples": len(data),
+        }
+        bank.append(data)
+
+    # Evict decoded signatures that are no longer referenced
+    live_keys = {entry["key"] for entry in entries.values()}
+    for npy_file in Path(cache_dir).glob("*.npy"):
+        if npy_file.stem not in live_keys:
+            npy_file.unlink()
+
+    index["entries"] = entries
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=4)
+
+    return sign_files, bank, changed
+
+
+def build_speaker_maps(sign_files: List[str]) -> dict:
+    """
+    Map the 1-based position of each signature in the prefix to a speaker name.
+
+    Args:
+        sign_files (List[str]): Signature file names in prefix order
 
     Returns:
         dict: A dictionary mapping speaker IDs to speaker names
-        str: Path to the combined audio file
     """
-    # Path to the combined signature file
-    combined_signs_path = ".build/combined_signs.wav"
+    return {
+        str(i + 1): speaker_name(sign_file) for i, sign_file in enumerate(sign_files)
+    }
+
+
+def write_signature_files(
+    speaker_maps: dict,
+    bank: List[np.ndarray],
+    changed: bool,
+    speakers_json: str,
+    combined_signs_path: str,
+):
+    """
+    Rewrite the combined signature prefix and the speaker maps when outdated.
 
+    Args:
+        speaker_maps (dict): Speaker IDs to names for the current bank
+        bank (List[np.ndarray]): Decoded int16 signatures in prefix order
+        changed (bool): Whether the signature bank changed
+        speakers_json (str): Path to the speaker maps JSON file
+        combined_signs_path (str): Path to the combined signature WAV
+    """
     # Check if the speaker maps already exist and are up to date
     recreate_maps = True
     if os.path.exists(speakers_json):
         try:
             with open(speakers_json, "r") as f:
-                speaker_maps = json.load(f)
-                if (
-                    isinstance(speaker_maps, dict)
-                    and len(speaker_maps) == len(os.listdir(signatures_path))
-                    and os.path.exists(combined_signs_path)
-                ):
-                    print("Speaker maps already exist.")
+                if json.load(f) == speaker_maps:
                     recreate_maps = False
-                else:
-                    print(
-                        "Speaker maps are outdated or invalid. Recreating speaker maps."
-                    )
         except (json.JSONDecodeError, ValueError):
             print("Speaker maps file is corrupted. Recreating speaker maps.")
+
+    if changed or not os.path.exists(combined_signs_path):
+        print("Signature bank changed. Rebuilding combined signatures.")
+        os.makedirs(os.path.dirname(combined_signs_path), exist_ok=True)
+        from scipy.io.wavfile import write
+
+        write(combined_signs_path, 16000, np.concatenate(bank))
     else:
-        print("Speaker maps do not exist. Creating speaker maps.")
+        print("Signature bank is up to date.")
 
     if recreate_maps:
-        # Convert all signature files to WAV format (if needed)
-        await convert_all_to_wav(signatures_path)
+        print("Speaker maps are outdated or invalid. Recreating speaker maps.")
+        # Save the updated speaker map
+        with open(speakers_json, "w") as f:
+            json.dump(speaker_maps, f, indent=4)
+
+
+async def signature_prefix_file(
+    signatures_path: str = "known_speakers/audio_files/",
+    speakers_json: str = "known_speakers/speaker_maps.json",
+    roster: List[str] = None,
+) -> (dict, str):
+    """
+    The speaker maps and the WAV file holding the signature prefix.
 
-        # Get sorted list of signature files
-        sign_files = sorted(os.listdir(signatures_path))
+    The prefix is only rebuilt when the content of the signature bank changes;
+    see `load_signature_bank`. File I/O runs on threads, so the event loop is
+    not blocked.
 
-        # Combine all signature files into one audio array using combine_audio
-        await combine_audio(
-            [os.path.join(signatures_path, sign_file) for sign_file in sign_files],
-            output_name="combined_signs",
+    Args:
+        signatures_path (str): Path to signatures directory
+        speakers_json (str): Path to the speaker maps JSON file
+        roster (List[str]): Expected speakers; only their signatures are
+            included and the speaker map is numbered for them
+
+    Returns:
+        dict: A dictionary mapping speaker IDs to speaker names
+        str: Path to the signature prefix WAV
+    """
+    if roster is not None:
+        # Imported here because upload imports this module
+        import upload
+
+        return await asyncio.to_thread(
+            upload.roster_prefix_wav, roster, signatures_path
         )
 
-        # Create a speaker map
-        speaker_maps = {
-            i + 1: os.path.splitext(sign_file)[0].title()
-            for i, sign_file in enumerate(sign_files)
-        }
+    # Convert any new or changed non-wav signature files to WAV format
+    with tracer.span("conversion"):
+        decode_paths, _ = await convert_all_to_wav(signatures_path)
 
-        # Save the updated speaker map
-        with open(speakers_json, "w") as f:
-            json.dump(speaker_maps, f, indent=4)
+    # Load the decoded signature bank, re-decoding only what changed
+    with tracer.span("signature_cache") as span:
+        sign_files, bank, changed = await asyncio.to_thread(
+            load_signature_bank, signatures_path, decode_paths=decode_paths
+        )
+        span.add_bytes(sum(signature.nbytes for signature in bank))
+    if not bank:
+        raise ValueError(f"No signature files found in {signatures_path}.")
+
+    # Create a speaker map
+    speaker_maps = build_speaker_maps(sign_files)
+
+    await asyncio.to_thread(
+        write_signature_files,
+        speaker_maps,
+        bank,
+        changed,
+        speakers_json,
+        combined_signs_path,
+    )
+    return speaker_maps, combined_signs_path
+
+
+async def prepend_signatures(
+    signs_path: str,
+    audio_file: str,
+    output: str = "combined_audio",
+    stream: bool = False,
+) -> str:
+    """
+    Write the signature prefix followed by the recording as one .wav file.
+
+    Args:
+        signs_path (str): Path to the signature prefix WAV
+        audio_file (str): Path to the input audio file
+        output (str): Name of the output .wav file
+        stream (bool): Combine with the bounded-memory streaming path
 
-    # Use the combine_audio function to combine the signature files and the audio buffer
-    await combine_audio([combined_signs_path, audio_file], output_name=output)
+    Returns:
+        str: Path to the combined audio file
+    """
     final_output_path = f".build/{output}.wav"
+    with tracer.span("combine_audio") as span:
+        await combine_audio([signs_path, audio_file], output_name=output, stream=stream)
+        span.add_bytes(os.path.getsize(final_output_path))
+    return final_output_path
+
+
+async def speaker_map_processor(
+    audio_file: str,
+    signatures_path: str = "known_speakers/audio_files/",
+    speakers_json: str = "known_speakers/speaker_maps.json",
+    output: str = "combined_audio",
+    stream: bool = False,
+    roster: List[str] = None,
+) -> (dict, str):
+    """
+    Combine all signature files and append the final audio buffer into a single .wav file.
+    The audio buffer is first converted to .wav before concatenation.
+
+    The combined signature prefix is only rebuilt when the content of the signature
+    bank changes (see `signature_prefix_file`), and the combining runs in
+    `audio_pool`, so the event loop is not blocked.
 
+    Args:
+        audio_file (str): Path to the input audio file
+        signatures_path (str): Path to signatures directory
+        speakers_json (str): Path to the speaker maps JSON file
+        output (str): Name of the output .wav file
+        stream (bool): Combine with the bounded-memory streaming path
+        roster (List[str]): Expected speakers; only their signatures are
+            prepended and the speaker map is numbered for them
+
+    Returns:
+        dict: A dictionary mapping speaker IDs to speaker names
+        str: Path to the combined audio file
+    """
+    speaker_maps, signs_path = await signature_prefix_file(
+        signatures_path, speakers_json, roster
+    )
+    final_output_path = await prepend_signatures(signs_path, audio_file, output, stream)
     return speaker_maps, final_output_path
 
 
@@ -256,45 +1104,34 @@ async def parse_speaker_text(json_data, speaker_maps):
     """
     Parse the JSON response to extract speaker and text information.
 
+    This is the plain-text renderer of `transcript.PhraseTable`; use the table
+    directly to filter, shift or merge phrases before rendering.
+
     Args:
         json_data (dict): The transcription JSON response.
 
     Returns:
         list: A list of strings with speaker labels and their spoken text.
     """
-    parsed_output = []
+    return PhraseTable.from_azure(json_data).rename(speaker_maps).render_text()
 
-    # Extract phrases from the response
-    phrases = json_data.get("phrases", [])
 
-    for phrase in phrases:
-        speaker = phrase.get("speaker", "Unknown")
-        text = phrase.get("text", "")
-        offset = phrase.get("offsetMilliseconds", 0)
-        duration = phrase.get("durationMilliseconds", 0)
-        try:
-            parsed_output.append(
-                f'Speaker: {speaker_maps[str(speaker)]}\nText: "{text}"\nOffset: {offset/1000}\nDuration: {duration/1000}'
-            )
-        except KeyError:
-            parsed_output.append(
-                f'Speaker: {speaker}\nText: "{text}"\nOffset: {offset/1000}\nDuration: {duration/1000}'
-            )
-    return parsed_output
-
-
-async def get_wav_duration(file_path):
+async def get_audio_duration(file_path):
     """
-    Returns the duration in seconds of a WAV file.
+    Returns the duration in seconds of an audio file in any supported format.
 
-    :param file_path: Path to the WAV file
+    WAV headers are read with `wave`; other formats, and WAV files `wave` cannot
+    parse (float or extensible), use their decoded length from `pcm16_length`.
+
+    :param file_path: Path to the audio file
     :return: Duration in seconds (float)
     """
-    with wave.open(file_path, "r") as wav_file:
-        frames = wav_file.getnframes()
-        rate = wav_file.getframerate()
-        duration = frames / float(rate)
-    return duration
+    if Path(file_path).suffix.lower() == ".wav":
+        try:
+            return await get_wav_duration(file_path)
+        except (wave.Error, EOFError):
+            pass
+    return await asyncio.to_thread(pcm16_length, file_path, 16000) / 16000
 
 
 if __name__ == "__main__":
@@ -306,4 +1143,4 @@ if __name__ == "__main__":
     # )
 
     # asyncio.run(record_audio("audio/test.wav", 5))
-    print(asyncio.run(get_wav_duration(".build/combined_signs.wav")))
+    print(asyncio.run(get_wav_duration(combined_signs_path)))
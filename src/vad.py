@@ -0,0 +1,251 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+import utils
+
+
+class RemapTable:
+    """
+    Maps times on a silence-trimmed recording back to the original recording.
+
+    Kept segment `i` starts at `trimmed_ms[i]` in the trimmed audio and at
+    `original_ms[i]` in the original; times are mapped with one binary search
+    per value over these two arrays.
+    """
+
+    __slots__ = ("trimmed_ms", "original_ms")
+
+    def __init__(self, trimmed_ms, original_ms):
+        self.trimmed_ms = np.asarray(trimmed_ms, dtype=np.int64)
+        self.original_ms = np.asarray(original_ms, dtype=np.int64)
+
+    def to_original(self, milliseconds) -> np.ndarray:
+        """
+        Map trimmed-timeline times to the original timeline.
+
+        Args:
+            milliseconds: Scalar or array of times on the trimmed timeline.
+
+        Returns:
+            np.ndarray: The corresponding original times in milliseconds.
+        """
+        t = np.asarray(milliseconds, dtype=np.int64)
+        if len(self.trimmed_ms) == 0:
+            return t
+        i = np.clip(np.searchsorted(self.trimmed_ms, t, side="right") - 1, 0, None)
+        return self.original_ms[i] + (t - self.trimmed_ms[i])
+
+    def remap_response(self, json_data: dict, base_ms: int = 0) -> dict:
+        """
+        Remap phrase and word offsets of a transcription response.
+
+        Only times after `base_ms` (the signature prefix) belong to the trimmed
+        recording; earlier phrases are left unchanged. Durations are recomputed
+        from the remapped end points, so a phrase spanning a removed gap keeps
+        covering it.
+
+        Args:
+            json_data (dict): The transcription JSON response.
+            base_ms (int): Where the trimmed recording starts in the upload.
+
+        Returns:
+            dict: A copy of the response on the original timeline.
+        """
+
+        def remap(items):
+            starts = np.array([item.get("offsetMilliseconds", 0) for item in items])
+            ends = starts + np.array(
+                [item.get("durationMilliseconds", 0) for item in items]
+            )
+            after = starts >= base_ms
+            new_starts = np.where(
+                after, self.to_original(starts - base_ms) + base_ms, starts
+            )
+            new_ends = np.where(
+                after, self.to_original(np.maximum(ends - base_ms, 0)) + base_ms, ends
+            )
+            return [
+                {
+                    **item,
+                    "offsetMilliseconds": int(start),
+                    "durationMilliseconds": int(max(end - start, 0)),
+                }
+                for item, start, end in zip(items, new_starts, new_ends)
+            ]
+
+        phrases = (
+            remap(json_data.get("phrases", [])) if json_data.get("phrases") else []
+        )
+        for phrase in phrases:
+            if phrase.get("words"):
+                phrase["words"] = remap(phrase["words"])
+        return {**json_data, "phrases": phrases}
+
+
+def frame_features(block: np.ndarray, frame: int) -> (np.ndarray, np.ndarray):
+    """
+    Log energy (dB) and spectral flatness of non-overlapping frames.
+
+    Args:
+        block (np.ndarray): int16 samples; a trailing partial frame is ignored.
+        frame (int): Frame length in samples.
+
+    Returns:
+        np.ndarray: Frame energy in dB relative to full scale.
+        np.ndarray: Spectral flatness in [0, 1] (1 is white noise).
+    """
+    n = len(block) // frame
+    frames = block[: n * frame].reshape(n, frame).astype(np.float32) / 32768.0
+    energy = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame), axis=1)) ** 2 + 1e-12
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return energy, flatness
+
+
+def detect_speech(
+    audio_path: str,
+    sample_rate: int = 16000,
+    frame_ms: int = 30,
+    margin_db: float = 12.0,
+    max_flatness: float = 0.5,
+    min_speech_ms: int = 150,
+    min_silence_ms: int = 600,
+    padding_ms: int = 250,
+) -> np.ndarray:
+    """
+    Find speech regions with a frame energy and spectral flatness detector.
+
+    A frame counts as speech when its energy is `margin_db` above the noise floor
+    (the 10th percentile of frame energy) and its spectrum is not flat like
+    broadband noise. Regions are padded, gaps shorter than `min_silence_ms`
+    are bridged and regions shorter than `min_speech_ms` dropped, all as array
+    operations. The audio is read block by block, so memory stays bounded.
+
+    Args:
+        audio_path (str): Path to the audio file.
+        sample_rate (int): Analysis sample rate.
+        frame_ms (int): Frame length in milliseconds.
+        margin_db (float): Required energy above the noise floor.
+        max_flatness (float): Maximum spectral flatness of a speech frame.
+        min_speech_ms (int): Shortest speech region kept.
+        min_silence_ms (int): Shortest silence removed.
+        padding_ms (int): Context kept around every speech region.
+
+    Returns:
+        np.ndarray: (regions, 2) array of start/stop sample indices.
+    """
+    frame = sample_rate * frame_ms // 1000
+    energies, flatnesses = [], []
+    carry = np.zeros(0, dtype=np.int16)
+    for block in utils.iter_pcm16(audio_path, sample_rate):
+        block = np.concatenate((carry, block))
+        usable = len(block) // frame * frame
+        energy, flatness = frame_features(block[:usable], frame)
+        energies.append(energy)
+        flatnesses.append(flatness)
+        carry = block[usable:]
+    energy = np.concatenate(energies) if energies else np.zeros(0)
+    flatness = np.concatenate(flatnesses) if flatnesses else np.zeros(0)
+    total = len(energy) * frame + len(carry)
+    if len(energy) == 0:
+        return np.array([[0, total]], dtype=np.int64)
+
+    floor = np.percentile(energy, 10)
+    speech = (energy > floor + margin_db) & (flatness < max_flatness)
+
+    # Region boundaries from the padded mask
+    pad = padding_ms // frame_ms
+    if pad:
+        speech = np.convolve(speech, np.ones(2 * pad + 1), mode="same") > 0
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    # Bridge short silences, then drop short regions
+    if len(starts):
+        keep_gap = (starts[1:] - stops[:-1]) * frame_ms >= min_silence_ms
+        starts = starts[np.concatenate(([True], keep_gap))]
+        stops = stops[np.concatenate((keep_gap, [True]))]
+        long_enough = (stops - starts) * frame_ms >= min_speech_ms
+        starts, stops = starts[long_enough], stops[long_enough]
+
+    regions = np.stack((starts, stops), axis=1) * frame
+    regions[:, 1] = np.minimum(regions[:, 1], total)
+    if len(regions) and regions[-1, 1] == len(energy) * frame:
+        regions[-1, 1] = total
+    return regions
+
+
+def trim_silence(
+    audio_path: str, output_dir: str = ".build", sample_rate: int = 16000, **kwargs
+) -> (str, RemapTable, dict):
+    """
+    Write a copy of a recording with the non-speech regions removed.
+
+    Every call writes a new uniquely named file; the caller removes it once
+    the upload is done.
+
+    Args:
+        audio_path (str): Path to the audio file.
+        output_dir (str): Directory for the trimmed WAV.
+        sample_rate (int): Sample rate of the trimmed WAV.
+        **kwargs: Detector settings passed to `detect_speech`.
+
+    Returns:
+        str: Path to the trimmed WAV, owned by the caller.
+        RemapTable: Maps trimmed times back to the original recording.
+        dict: Report with original/kept/removed seconds, removed ratio and the
+            time the stage took.
+    """
+    t1 = time.perf_counter()
+    regions = detect_speech(audio_path, sample_rate, **kwargs)
+    total = utils.pcm16_length(audio_path, sample_rate)
+
+    # A unique name, so concurrent requests for the same recording cannot collide
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=output_dir,
+        prefix=f"vad_{Path(audio_path).stem}_",
+        suffix=".wav",
+        delete=False,
+    ) as f:
+        output_path = f.name
+    try:
+        with sf.SoundFile(
+            output_path, "w", samplerate=sample_rate, channels=1, subtype="PCM_16"
+        ) as out:
+            for start, stop in regions:
+                for block in utils.iter_pcm16(
+                    audio_path,
+                    sample_rate,
+                    start=start / sample_rate,
+                    stop=stop / sample_rate,
+                ):
+                    out.write(block)
+    except BaseException:
+        os.remove(output_path)
+        raise
+
+    lengths = regions[:, 1] - regions[:, 0]
+    trimmed_starts = np.cumsum(lengths) - lengths
+    remap = RemapTable(
+        trimmed_starts * 1000 // sample_rate, regions[:, 0] * 1000 // sample_rate
+    )
+    kept = int(lengths.sum())
+    report = {
+        "original_seconds": total / sample_rate,
+        "kept_seconds": kept / sample_rate,
+        "removed_seconds": (total - kept) / sample_rate,
+        "removed_ratio": (total - kept) / total if total else 0.0,
+        "regions": len(regions),
+        "vad_seconds": time.perf_counter() - t1,
+    }
+    print(
+        f"VAD removed {report['removed_seconds']:.1f}s of {report['original_seconds']:.1f}s "
+        f"({report['removed_ratio']:.0%}) in {report['vad_seconds']:.2f}s"
+    )
+    return output_path, remap, report
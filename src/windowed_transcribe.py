@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+import azure_diarization
+import batch_transcribe
+import upload
+import utils
+
+
+def plan_windows(
+    duration: float, window_seconds: float, overlap_seconds: float
+) -> list:
+    """
+    Split a recording into overlapping windows.
+
+    Each window owns the part of the timeline up to the middle of its overlaps with
+    its neighbours, so every instant belongs to exactly one window.
+
+    Args:
+        duration (float): Recording duration in seconds.
+        window_seconds (float): Length of each window.
+        overlap_seconds (float): Overlap between consecutive windows.
+
+    Returns:
+        list: (start, stop, own_start, own_stop) in seconds for every window.
+    """
+    if overlap_seconds >= window_seconds:
+        raise ValueError("Overlap must be shorter than the window.")
+
+    step = window_seconds - overlap_seconds
+    starts = [0.0]
+    while starts[-1] + window_seconds < duration:
+        starts.append(starts[-1] + step)
+
+    windows = []
+    for i, start in enumerate(starts):
+        stop = min(start + window_seconds, duration)
+        own_start = start + overlap_seconds / 2 if i > 0 else 0.0
+        own_stop = stop - overlap_seconds / 2 if i < len(starts) - 1 else float("inf")
+        windows.append((start, stop, own_start, own_stop))
+    return windows
+
+
+def _anchor_labels(phrases, segments, speaker_maps, signs_duration) -> dict:
+    """
+    Map the provider's speaker labels in one window to enrolled names.
+
+    Labels heard inside a signature segment of the prefix are matched to that
+    signature, strongest evidence first and one label per name. Labels without
+    an anchor are left out; the provider numbers labels per request, so their
+    positions say nothing about the enrolled speakers, and `stitch_windows`
+    chains them across windows instead.
+    """
+    votes = defaultdict(float)
+    for phrase in phrases:
+        start = phrase.get("offsetMilliseconds", 0) / 1000
+        length = phrase.get("durationMilliseconds", 0) / 1000
+        if start >= signs_duration - 1:
+            continue
+        for speaker_id, seg_start, seg_stop in segments:
+            overlap = min(start + length, seg_stop) - max(start, seg_start)
+            if overlap > 0:
+                votes[(phrase.get("speaker"), speaker_maps[speaker_id])] += overlap
+
+    names = {}
+    for (label, name), _ in sorted(votes.items(), key=lambda item: -item[1]):
+        if label not in names and name not in names.values():
+            names[label] = name
+    return names
+
+
+def stitch_windows(
+    windows, responses, segments, speaker_maps, signs_duration, overlap_seconds
+) -> list:
+    """
+    Merge per-window responses into phrases on the recording's timeline.
+
+    Offsets are shifted by the window start minus the signature prefix, phrases
+    whose midpoint falls outside the window's owned region are dropped as overlap
+    duplicates, and speaker labels are resolved per window using the signature
+    segments as anchors. Labels that match no signature are chained across windows
+    by how much they coincide with the previous window's speakers in the overlap.
+
+    Args:
+        windows (list): Windows from `plan_windows`.
+        responses (list): The transcription JSON response for each window.
+        segments (list): Signature segments from `upload.signature_segments`.
+        speaker_maps (dict): A dictionary mapping speaker IDs to speaker names.
+        signs_duration (float): Duration of the signature prefix in seconds.
+        overlap_seconds (float): Overlap between consecutive windows.
+
+    Returns:
+        list: Phrases with `speaker` set to a name, sorted by offset.
+    """
+    merged = []
+    previous = []  # (start, stop, name) of the previous window's phrases
+    guests = 0
+
+    for (start, stop, own_start, own_stop), json_data in zip(windows, responses):
+        phrases = json_data.get("phrases", [])
+        names = _anchor_labels(phrases, segments, speaker_maps, signs_duration)
+
+        # Shift the spoken phrases onto the recording timeline
+        placed = []
+        for phrase in phrases:
+            offset = phrase.get("offsetMilliseconds", 0) / 1000
+            if offset < signs_duration - 1:
+                continue
+            phrase_start = start + max(0.0, offset - signs_duration)
+            phrase_stop = phrase_start + phrase.get("durationMilliseconds", 0) / 1000
+            placed.append((phrase_start, phrase_stop, phrase))
+
+        # Chain unanchored labels to the previous window through the overlap
+        coincide = defaultdict(float)
+        for phrase_start, phrase_stop, phrase in placed:
+            label = phrase.get("speaker")
+            if label in names or phrase_start >= start + overlap_seconds:
+                continue
+            for prev_start, prev_stop, prev_name in previous:
+                overlap = min(phrase_stop, prev_stop) - max(phrase_start, prev_start)
+                if overlap > 0:
+                    coincide[(label, prev_name)] += overlap
+        for (label, name), _ in sorted(coincide.items(), key=lambda item: -item[1]):
+            if label not in names and name not in names.values():
+                names[label] = name
+        for _, _, phrase in placed:
+            label = phrase.get("speaker")
+            if label not in names:
+                guests += 1
+                names[label] = f"Guest {guests}"
+
+        previous = []
+        for phrase_start, phrase_stop, phrase in placed:
+            name = names[phrase.get("speaker")]
+            previous.append((phrase_start, phrase_stop, name))
+            if own_start <= (phrase_start + phrase_stop) / 2 < own_stop:
+                merged.append(
+                    {
+                        **phrase,
+                        "speaker": name,
+                        "offsetMilliseconds": int(round(phrase_start * 1000)),
+                    }
+                )
+
+    return sorted(merged, key=lambda phrase: phrase["offsetMilliseconds"])
+
+
+async def transcribe_windowed(
+    audio_path,
+    url,
+    SPEECH_KEY,
+    definition=azure_diarization.definition,
+    window_seconds=120.0,
+    overlap_seconds=10.0,
+    concurrency=4,
+    rate=0.0,
+    retries=4,
+    output_dir="output_log",
+):
+    """
+    Transcribe a long recording as overlapping windows sent in parallel.
+
+    Every window is uploaded with the signature prefix through the streaming
+    request body, so no window is written to disk.
+
+    Args:
+        audio_path (str): Path to the audio file to transcribe.
+        url (str): The URL for the Azure Speech service.
+        SPEECH_KEY (str): The subscription key.
+        definition (dict): The definition for the transcription.
+        window_seconds (float): Length of each window.
+        overlap_seconds (float): Overlap between consecutive windows.
+        concurrency (int): Maximum number of windows in flight.
+        rate (float): Maximum request starts per second (0 disables the limit).
+        retries (int): Maximum retries per window for 429/5xx responses.
+        output_dir (str): Directory to write the transcript to.
+
+    Returns:
+        list: The merged phrases.
+    """
+    speaker_maps, prefix = upload.signature_prefix()
+    segments = upload.signature_segments()
+    signs_duration = len(prefix) / 2 / 16000
+
+    windows = plan_windows(
+        await utils.get_wav_duration(audio_path), window_seconds, overlap_seconds
+    )
+    print(f"Transcribing {audio_path} as {len(windows)} window(s)")
+
+    session = batch_transcribe.make_session(concurrency)
+    limiter = batch_transcribe.RateLimiter(rate, burst=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def transcribe_window(start, stop):
+        def make_body():
+            return upload.MultipartAudioBody(
+                definition, prefix, audio_path, start=start, stop=stop
+            )
+
+        async with semaphore:
+            response, _, _ = await batch_transcribe.post_with_retry(
+                session,
+                url,
+                SPEECH_KEY,
+                definition,
+                audio_path,
+                limiter,
+                retries,
+                make_body=make_body,
+            )
+        if response is None or response.status_code != 200:
+            status = response.status_code if response is not None else "no response"
+            raise RuntimeError(f"Window {start:.1f}-{stop:.1f}s failed: {status}")
+        return response.json()
+
+    t1 = time.time()
+    try:
+        responses = await asyncio.gather(
+            *(transcribe_window(start, stop) for start, stop, _, _ in windows)
+        )
+    finally:
+        session.close()
+    t2 = time.time()
+    print(f"Time taken: {t2 - t1} seconds")
+
+    phrases = stitch_windows(
+        windows, responses, segments, speaker_maps, signs_duration, overlap_seconds
+    )
+    await azure_diarization.save_transcript(
+        {"phrases": phrases}, {}, 0.0, audio_path, output_dir=output_dir
+    )
+    return phrases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Transcribe a long recording as parallel overlapping windows."
+    )
+    parser.add_argument("audio_file")
+    parser.add_argument("--window", type=float, default=120.0)
+    parser.add_argument("--overlap", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--url", help="Override the transcription URL")
+    args = parser.parse_args()
+
+    url, SPEECH_KEY = asyncio.run(azure_diarization.setup_azure())
+    if args.url:
+        url, SPEECH_KEY = args.url, SPEECH_KEY or "local"
+    asyncio.run(
+        transcribe_windowed(
+            args.audio_file,
+            url,
+            SPEECH_KEY,
+            window_seconds=args.window,
+            overlap_seconds=args.overlap,
+            concurrency=args.concurrency,
+        )
+    )
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+# The modules in src/ import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+# Stand-ins for the speech SDKs, last on the path so an installed SDK wins
+sys.path.append(os.path.join(os.path.dirname(__file__), "stubs"))
+
+
+def write_audio(
+    path, seconds: float, sample_rate: int = 16000, channels: int = 1, seed: int = 0
+):
+    """
+    Write a tone with a little noise, so every file has distinct content.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    data = 0.3 * np.sin(2 * np.pi * (200 + 50 * seed) * t) + 0.05 * rng.standard_normal(
+        len(t)
+    )
+    if channels > 1:
+        data = np.stack([data * (1 - 0.2 * c) for c in range(channels)], axis=1)
+    sf.write(str(path), data, sample_rate)
+    return str(path)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """
+    A working directory with two enrolled speakers in known_speakers/audio_files.
+
+    The modules use paths relative to the working directory (`.build/`,
+    `known_speakers/`), so every test gets its own.
+    """
+    import upload
+
+    signatures = tmp_path / "known_speakers" / "audio_files"
+    signatures.mkdir(parents=True)
+    write_audio(signatures / "alice.wav", 2.0, seed=1)
+    write_audio(signatures / "bob.wav", 2.0, seed=2)
+    monkeypatch.chdir(tmp_path)
+    for cache in (upload._prefix_cache, upload._bank_cache, upload._roster_cache):
+        cache.clear()
+    yield tmp_path
+    for cache in (upload._prefix_cache, upload._bank_cache, upload._roster_cache):
+        cache.clear()
+
+
+@pytest.fixture
+def mock_server():
+    """
+    Start `mock_azure_server` instances; all are shut down after the test.
+    """
+    import mock_azure_server
+
+    servers = []
+
+    def start(**kwargs):
+        server, url = mock_azure_server.start_mock_server(**kwargs)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,6 @@
+class TranscribeStreamingClient:
+    def __init__(self, region: str = None):
+        self.region = region
+
+    async def start_stream_transcription(self, **kwargs):
+        raise RuntimeError("the Amazon Transcribe SDK is not installed")
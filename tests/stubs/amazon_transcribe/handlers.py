@@ -0,0 +1,14 @@
+from amazon_transcribe.model import TranscriptEvent
+
+
+class TranscriptResultStreamHandler:
+    def __init__(self, transcript_result_stream):
+        self._transcript_result_stream = transcript_result_stream
+
+    async def handle_events(self):
+        async for event in self._transcript_result_stream:
+            if isinstance(event, TranscriptEvent):
+                await self.handle_transcript_event(event)
+
+    async def handle_transcript_event(self, transcript_event: TranscriptEvent):
+        raise NotImplementedError
@@ -0,0 +1,23 @@
+class _Shape:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Item(_Shape):
+    pass
+
+
+class Alternative(_Shape):
+    pass
+
+
+class Result(_Shape):
+    pass
+
+
+class Transcript(_Shape):
+    pass
+
+
+class TranscriptEvent(_Shape):
+    pass
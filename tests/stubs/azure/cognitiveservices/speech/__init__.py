@@ -0,0 +1,29 @@
+import enum
+import types
+
+
+class ResultReason(enum.Enum):
+    NoMatch = 0
+    RecognizingSpeech = 1
+    RecognizedSpeech = 2
+
+
+class PropertyId(enum.Enum):
+    SpeechServiceResponse_DiarizeIntermediateResults = 0
+
+
+class SessionEventArgs:
+    pass
+
+
+class SpeechRecognitionEventArgs:
+    pass
+
+
+class SpeechConfig:
+    def __init__(self, **kwargs):
+        raise RuntimeError("the Speech SDK is not installed")
+
+
+audio = types.SimpleNamespace()
+transcription = types.SimpleNamespace()
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+import aws_transcription
+import mock_aws_transcribe
+from conftest import write_audio
+
+
+def stream(audio_path, **kwargs):
+    client = mock_aws_transcribe.MockTranscribeStreamingClient(latency=0.0)
+    return asyncio.run(
+        asyncio.wait_for(
+            aws_transcription.stream_file(client, audio_path, speed=None, **kwargs),
+            timeout=30,
+        )
+    )
+
+
+def test_stream_file_collects_finals(tmp_path):
+    result = stream(write_audio(tmp_path / "tone.wav", 5.0))
+    assert result["audio_seconds"] == pytest.approx(5.0)
+    assert [r["end"] for r in result["results"] if not r["partial"]][
+        -1
+    ] == pytest.approx(5.0)
+    assert result["on_result_errors"] == 0
+
+
+def test_failing_on_result_does_not_stall_the_stream(tmp_path):
+    def on_result(record):
+        raise RuntimeError("handler failed")
+
+    result = stream(
+        write_audio(tmp_path / "tone.wav", 5.0), max_pending=1, on_result=on_result
+    )
+    assert result["on_result_errors"] == len(result["results"]) > 0
+    assert result["transcript"]
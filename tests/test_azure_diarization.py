@@ -0,0 +1,72 @@
+import asyncio
+import inspect
+
+import pytest
+
+import azure_diarization
+import audio_codecs
+from conftest import write_audio
+
+
+def transcribe(url, audio_path, **kwargs):
+    return asyncio.run(
+        azure_diarization.transcribe_azure(
+            azure_diarization.definition,
+            url,
+            "local",
+            audio_path,
+            **{"use_cache": False, "output_dir": "out", "echo": False, **kwargs},
+        )
+    )
+
+
+def test_default_codec_comes_from_backend_codecs():
+    default = (
+        inspect.signature(azure_diarization.transcribe_azure)
+        .parameters["codec"]
+        .default
+    )
+    assert default == audio_codecs.backend_codecs["azure"]
+
+
+def test_file_path_does_not_build_the_signature_bank(workspace, mock_server):
+    _, url = mock_server()
+    audio_path = write_audio(workspace / "talk.wav", 12.0, seed=3)
+    table = transcribe(url, audio_path)
+    assert len(table) == 3
+    # Offsets are on the recording's timeline, after the 4 s signature prefix
+    assert table.offset_ms.min() >= 0
+    assert not (workspace / "known_speakers" / "signature_bank.json").exists()
+
+
+@pytest.mark.parametrize("options", [{"in_memory": True}, {"codec": "flac"}])
+def test_in_memory_paths_match_file_path(workspace, mock_server, options):
+    _, url = mock_server()
+    audio_path = write_audio(workspace / "talk.wav", 12.0, seed=3)
+    expected = transcribe(url, audio_path).records()
+    assert transcribe(url, audio_path, **options).records() == expected
+
+
+@pytest.mark.parametrize("options", [{}, {"in_memory": True}, {"codec": "flac"}])
+def test_cache_hit_builds_no_body_or_combined_file(
+    workspace, mock_server, monkeypatch, options
+):
+    server, url = mock_server()
+    audio_path = write_audio(workspace / "talk.wav", 12.0, seed=3)
+    expected = transcribe(url, audio_path, use_cache=True, **options).records()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("built an upload on a cache hit")
+
+    monkeypatch.setattr(azure_diarization.upload, "MultipartAudioBody", fail)
+    monkeypatch.setattr(azure_diarization.utils, "prepend_signatures", fail)
+    assert transcribe(url, audio_path, use_cache=True, **options).records() == expected
+    assert server.requests == 1
+
+
+@pytest.mark.parametrize("options", [{}, {"in_memory": True}])
+def test_trimmed_copy_is_removed_after_upload(workspace, mock_server, options):
+    _, url = mock_server()
+    audio_path = write_audio(workspace / "talk.wav", 12.0, seed=3)
+    transcribe(url, audio_path, trim_silence=True, **options)
+    assert not list((workspace / ".build").glob("vad_*.wav"))
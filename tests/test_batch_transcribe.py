@@ -0,0 +1,86 @@
+import asyncio
+
+import json
+
+from batch_transcribe import RateLimiter, make_session, post_with_retry, run_batch
+from conftest import write_audio
+
+
+def test_run_batch_records_failures_per_file(workspace, mock_server):
+    _, url = mock_server()
+    recordings = workspace / "recordings"
+    recordings.mkdir()
+    write_audio(recordings / "a.wav", 3.0, seed=3)
+    write_audio(recordings / "b.flac", 2.0, seed=4)
+    (recordings / "c.wav").write_bytes((recordings / "a.wav").read_bytes()[:30])
+
+    summary = asyncio.run(
+        run_batch(str(recordings), url, "local", rate=0, output_dir="out")
+    )
+    results = {r["file"].rsplit("/", 1)[-1]: r for r in summary["results"]}
+    assert (summary["files"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    assert results["b.flac"]["audio_seconds"] == 2.0
+    assert results["b.flac"]["status"] == 200
+    assert results["c.wav"]["status"] is None
+    assert results["c.wav"]["error"]
+    assert summary["retries"] == 0
+
+
+def test_run_batch_retries_throttled_requests(workspace, mock_server):
+    server, url = mock_server(failure_rate=1.0)
+    recordings = workspace / "recordings"
+    recordings.mkdir()
+    write_audio(recordings / "a.wav", 1.0)
+
+    summary = asyncio.run(
+        run_batch(str(recordings), url, "local", rate=0, retries=2, output_dir="out")
+    )
+    (record,) = summary["results"]
+    assert record["attempts"] == 3
+    assert record["status"] in (429, 503)
+    assert summary["failed"] == 1
+    assert server.requests == 3
+
+
+def test_same_stem_in_different_directories_keeps_both_transcripts(
+    workspace, mock_server
+):
+    _, url = mock_server()
+    for folder, seed in (("a", 3), ("b", 4)):
+        (workspace / folder).mkdir()
+        write_audio(workspace / folder / "talk.wav", 2.0, seed=seed)
+    manifest = workspace / "manifest.json"
+    manifest.write_text(json.dumps(["a/talk.wav", "b/talk.wav"]))
+
+    summary = asyncio.run(
+        run_batch(str(manifest), url, "local", rate=0, output_dir="out")
+    )
+    outputs = {record["output"] for record in summary["results"]}
+    assert len(outputs) == 2
+    assert all(
+        output.startswith("out/azure_diarization_output_talk_") for output in outputs
+    )
+
+
+def test_post_with_retry_times_out_a_stalled_request(workspace, mock_server):
+    server, url = mock_server(latency=1.0)
+    audio_path = write_audio(workspace / "a.wav", 1.0)
+    session = make_session(1)
+    try:
+        response, attempts, _ = asyncio.run(
+            post_with_retry(
+                session,
+                url,
+                "local",
+                {},
+                audio_path,
+                RateLimiter(0),
+                retries=1,
+                backoff=0.01,
+                timeout=(1, 0.2),
+            )
+        )
+    finally:
+        session.close()
+    assert response is None
+    assert attempts == 2
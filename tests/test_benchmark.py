@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import benchmark
+from conftest import write_audio
+
+
+def test_word_error_rate():
+    result = benchmark.word_error_rate(
+        benchmark.normalize_words("The cat sat."),
+        benchmark.normalize_words("the cat sat down"),
+    )
+    assert result == {"wer": pytest.approx(1 / 3), "errors": 1, "reference_words": 3}
+
+
+def test_missing_references_fail_when_required(workspace):
+    (workspace / "audio").mkdir()
+    write_audio(workspace / "audio" / "talk.wav", 1.0)
+    with pytest.raises(FileNotFoundError, match="talk.wav"):
+        asyncio.run(
+            benchmark.run_benchmark(
+                "audio", backends=["azure"], require_references=True
+            )
+        )
+
+
+def test_mock_transcripts_are_not_scored(workspace):
+    (workspace / "audio").mkdir()
+    write_audio(workspace / "audio" / "talk.wav", 6.0)
+    (workspace / "audio" / "references").mkdir()
+    (workspace / "audio" / "references" / "talk.json").write_text(
+        '{"phrases": [{"speaker": "Alice", "offsetMilliseconds": 0,'
+        ' "durationMilliseconds": 6000, "text": "hello world"}]}'
+    )
+    results = asyncio.run(
+        benchmark.run_benchmark(
+            "audio",
+            backends=["mock"],
+            options=["baseline"],
+            mock_seconds_per_audio_second=0,
+            reference_dir="audio/references",
+        )
+    )
+    (row,) = results["runs"]
+    assert row["status"] == "ok"
+    assert "wer" not in row and "der" not in row
@@ -0,0 +1,14 @@
+import os
+
+import cli
+import utils
+from conftest import write_audio
+
+
+def test_duration_imports_no_heavy_module(tmp_path):
+    audio_path = write_audio(tmp_path / "talk.wav", 1.5)
+    result = cli.measure_startup(
+        [os.path.join(cli.src_dir, "cli.py"), "duration", audio_path], runs=1
+    )
+    assert result["heavy_imports"] == []
+    assert utils.wav_duration(audio_path) == 1.5
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+import azure_diarization
+import upload
+from conftest import write_audio
+from hedged_dispatch import Endpoint, HedgedDispatcher
+
+
+@pytest.fixture
+def make_body(tmp_path):
+    audio_path = write_audio(tmp_path / "one_second.wav", 1.0)
+    return lambda: upload.MultipartAudioBody(
+        azure_diarization.definition, b"", audio_path
+    )
+
+
+@pytest.fixture
+def dispatcher_for(mock_server):
+    dispatchers = []
+
+    def build(primary: dict, secondary: dict, **kwargs):
+        endpoints = [
+            Endpoint(name, mock_server(**options)[1], "local")
+            for name, options in (("primary", primary), ("secondary", secondary))
+        ]
+        dispatcher = HedgedDispatcher(endpoints, **kwargs)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield build
+    for dispatcher in dispatchers:
+        dispatcher.close()
+
+
+def test_fast_primary_is_not_hedged(dispatcher_for, make_body):
+    dispatcher = dispatcher_for({}, {})
+    response, info = asyncio.run(dispatcher.post(make_body))
+    assert response.status_code == 200
+    assert info["endpoint"] == "primary" and not info["hedged"]
+    assert dispatcher.endpoints[1].counts["requests"] == 0
+
+
+def test_slow_primary_is_hedged_to_secondary(dispatcher_for, make_body):
+    dispatcher = dispatcher_for({"latency": 2.0}, {}, initial_hedge_ratio=0.05)
+    response, info = asyncio.run(dispatcher.post(make_body))
+    assert response.status_code == 200
+    assert info["endpoint"] == "secondary" and info["hedged"]
+    assert info["seconds"] < 1.5
+    primary, secondary = dispatcher.endpoints
+    assert (primary.counts["hedges"], secondary.counts["hedges"]) == (0, 1)
+    assert secondary.counts["wins"] == 1
+
+
+def test_failing_primary_is_hedged_immediately(dispatcher_for, make_body):
+    dispatcher = dispatcher_for({"failure_rate": 1.0}, {}, initial_hedge_ratio=10.0)
+    response, info = asyncio.run(dispatcher.post(make_body))
+    assert response.status_code == 200
+    assert info["endpoint"] == "secondary"
+    assert info["seconds"] < 5.0
+    assert dispatcher.endpoints[0].error_rate() == 1.0
+
+
+def test_every_endpoint_failing_returns_last_failure(dispatcher_for, make_body):
+    dispatcher = dispatcher_for({"failure_rate": 1.0}, {"failure_rate": 1.0})
+    response, info = asyncio.run(dispatcher.post(make_body))
+    assert response.status_code in (429, 503)
+    assert info["endpoint"] is None and info["hedged"]
+
+
+def test_degraded_endpoint_is_ranked_last():
+    primary = Endpoint("primary", "http://primary", "key")
+    secondary = Endpoint("secondary", "http://secondary", "key")
+    for _ in range(5):
+        primary.record(3.0, 1.0, True)
+        secondary.record(0.5, 1.0, True)
+    dispatcher = HedgedDispatcher([primary, secondary], min_samples=5)
+    try:
+        assert dispatcher.degraded(primary) and not dispatcher.degraded(secondary)
+        assert dispatcher.ranked() == [secondary, primary]
+        # Hedge after the best endpoint's p95, scaled to the audio length
+        assert dispatcher.hedge_delay(2.0) == pytest.approx(1.0)
+    finally:
+        dispatcher.close()
+
+
+def test_requires_an_endpoint():
+    with pytest.raises(ValueError):
+        HedgedDispatcher([])
+
+
+class FailingBody:
+    # A body whose audio cannot be read once the upload starts
+    def __init__(self, body):
+        self.content_type = body.content_type
+        self.num_frames = body.num_frames
+        self.sample_rate = body.sample_rate
+        self.length = len(body)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        raise RuntimeError("Error opening 'talk.wav': System error.")
+        yield b""
+
+
+def test_unexpected_error_is_hedged_to_secondary(dispatcher_for, make_body):
+    dispatcher = dispatcher_for({}, {}, initial_hedge_ratio=10.0)
+    response, info = asyncio.run(dispatcher.post(make_body, FailingBody(make_body())))
+    assert response.status_code == 200
+    assert info["endpoint"] == "secondary"
+    primary = dispatcher.endpoints[0].stats()
+    assert primary["errors"] == 1 and primary["error_rate"] == 1.0
+    assert primary["last_error"].startswith("RuntimeError")
@@ -0,0 +1,53 @@
+import threading
+import types
+
+import pytest
+
+import real_time_azure
+from mock_azure_realtime import MockPushStream
+
+
+def test_ring_buffer_keeps_order_across_wraparound():
+    ring = real_time_azure.RingBuffer(7)
+    data = bytes(range(200))
+
+    def write():
+        for i in range(0, len(data), 5):
+            ring.write(data[i : i + 5])
+        ring.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    received = b""
+    while chunk := ring.read(3):
+        received += chunk
+    writer.join()
+    assert received == data
+
+
+def test_latency_report_bins_partials_and_finals():
+    tracker = real_time_azure.LatencyTracker()
+    tracker.sent(1000)
+    result = types.SimpleNamespace(
+        offset=0,
+        duration=10_000_000,
+        reason=real_time_azure.speechsdk.ResultReason.RecognizedSpeech,
+    )
+    tracker.transcribing(types.SimpleNamespace(result=result))
+    tracker.transcribing(types.SimpleNamespace(result=result))
+    tracker.transcribed(types.SimpleNamespace(result=result))
+    report = tracker.report()
+    assert report["partial"]["utterances"] == report["final"]["utterances"] == 1
+    assert sum(report["final"]["histogram"]) == 1
+    assert len(report["final"]["histogram"]) == len(real_time_azure.latency_bins)
+
+
+def test_pump_file_closes_the_stream_when_decoding_fails(tmp_path):
+    bad = tmp_path / "bad.wav"
+    bad.write_bytes(b"RIFF" + bytes(26))
+    stream = MockPushStream(16000)
+    with pytest.raises(Exception):
+        real_time_azure.pump_file(
+            str(bad), stream, real_time_azure.LatencyTracker(), realtime=False
+        )
+    assert stream.audio.get(timeout=1) is None
@@ -0,0 +1,57 @@
+from conftest import write_audio
+from mock_azure_realtime import MockTranscriberFactory
+from realtime_sessions import SessionManager
+
+
+def manager(**kwargs):
+    options = dict(
+        consumers=3,
+        transcriber_factory=MockTranscriberFactory(latency=0.0, utterance_seconds=1.0),
+        realtime=False,
+        stop_timeout=10,
+    )
+    options.update(kwargs)
+    return SessionManager(**options)
+
+
+def test_every_session_reports_its_finals(tmp_path):
+    audio = [write_audio(tmp_path / f"{i}.wav", 3.0, seed=i) for i in range(3)]
+    report = manager(consumers=2).run(audio)
+    assert [session["finals"] for session in report["sessions"]] == [3, 3, 3]
+    assert report["total"]["sessions"] == 3
+
+
+def test_events_of_a_session_are_handled_in_order(tmp_path):
+    audio = [write_audio(tmp_path / f"{i}.wav", 4.0, seed=i) for i in range(5)]
+    received = {}
+
+    def on_event(session, event):
+        received.setdefault(session.id, []).append(event.received)
+
+    report = manager(on_event=on_event).run(audio)
+    assert report["total"]["failed"] == 0
+    assert all(times == sorted(times) for times in received.values())
+    assert all(session["finals"] == 4 for session in report["sessions"])
+
+
+def test_failed_session_is_reported_without_stopping_the_others(tmp_path):
+    good = write_audio(tmp_path / "good.wav", 2.0)
+    bad = tmp_path / "bad.wav"
+    bad.write_bytes(open(good, "rb").read()[:30])
+    report = manager().run([good, str(bad)])
+    good_report, bad_report = report["sessions"]
+    assert good_report["error"] is None and good_report["finals"] == 2
+    assert bad_report["error"] and bad_report["events"] == 0
+    assert report["total"]["failed"] == 1
+
+
+def test_session_that_never_starts_still_reports(tmp_path):
+    def factory(sample_rate, stopped):
+        raise RuntimeError("no service")
+
+    report = manager(transcriber_factory=factory).run(
+        [write_audio(tmp_path / "a.wav", 1.0)]
+    )
+    (session,) = report["sessions"]
+    assert session["error"] == "RuntimeError: no service"
+    assert session["wall_seconds"] is None and session["audio_seconds"] == 0
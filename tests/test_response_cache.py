@@ -0,0 +1,42 @@
+import os
+
+from response_cache import ResponseCache
+
+url = "https://example.com/speechtotext/transcriptions:transcribe"
+
+
+def test_key_depends_on_audio_definition_and_api_version():
+    key = ResponseCache.key("abc", {"locales": ["en-US"]}, f"{url}?api-version=1")
+    assert key == ResponseCache.key(
+        "abc", {"locales": ["en-US"]}, f"{url}?api-version=1"
+    )
+    assert key != ResponseCache.key(
+        "abd", {"locales": ["en-US"]}, f"{url}?api-version=1"
+    )
+    assert key != ResponseCache.key(
+        "abc", {"locales": ["de-DE"]}, f"{url}?api-version=1"
+    )
+    assert key != ResponseCache.key(
+        "abc", {"locales": ["en-US"]}, f"{url}?api-version=2"
+    )
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    payload = {"phrases": ["x" * 80]}
+    cache.put("a", payload)
+    cache.put("b", payload)
+    # Entries written in the same instant share an mtime, so age "b" explicitly
+    os.utime(tmp_path / "b.json", ns=(0, 0))
+    assert cache.get("a") == payload
+    cache.put("c", payload)
+    assert cache.get("b") is None
+    assert cache.get("a") == payload and cache.get("c") == payload
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), enabled=False)
+    cache.put("a", {})
+    assert cache.get("a") is None
+    assert not (tmp_path / "cache").exists()
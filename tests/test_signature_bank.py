@@ -0,0 +1,56 @@
+import numpy as np
+
+import utils
+from conftest import write_audio
+from signature_bank import SignatureBank
+
+
+def test_sync_enrolls_normalized_files_and_skips_undecodable(workspace):
+    signatures = workspace / "known_speakers" / "audio_files"
+    write_audio(signatures / "dave.flac", 1.5, sample_rate=44100, channels=2, seed=5)
+    (signatures / "carol.m4a").write_bytes(np.random.default_rng(0).bytes(2048))
+
+    bank = SignatureBank()
+    assert bank.sync(str(signatures))
+    assert sorted(bank.speakers) == ["Alice", "Bob", "Dave"]
+    dave = bank.speakers["Dave"]
+    assert dave["stop"] - dave["start"] == 24000
+    # Sources are never modified
+    assert (signatures / "carol.m4a").exists()
+
+    # A second sync of the same directory changes nothing
+    assert not SignatureBank().sync(str(signatures))
+
+
+def test_sync_drops_removed_speakers(workspace):
+    signatures = workspace / "known_speakers" / "audio_files"
+    bank = SignatureBank()
+    bank.sync(str(signatures))
+    (signatures / "bob.wav").unlink()
+    assert bank.sync(str(signatures))
+    assert list(bank.speakers) == ["Alice"]
+    speaker_maps, parts = bank.prefix()
+    assert list(speaker_maps.values()) == ["Alice"]
+    np.testing.assert_array_equal(
+        parts[0], utils.decode_signature(str(signatures / "alice.wav"))
+    )
+
+
+def test_sync_keeps_one_source_per_speaker(workspace):
+    signatures = workspace / "known_speakers" / "audio_files"
+    write_audio(signatures / "alice.flac", 1.0, seed=6)
+    write_audio(signatures / "Carl.wav", 1.0, seed=7)
+
+    bank = SignatureBank()
+    assert bank.sync(str(signatures))
+    assert bank.speakers["Alice"]["source"] == "alice.wav"
+    size = len(bank.samples)
+    # The duplicate no longer makes the entry stale on every start
+    assert not SignatureBank().sync(str(signatures))
+    assert len(SignatureBank().samples) == size
+
+    # The bank's prefix and the file path number speakers the same way
+    speaker_maps, _ = bank.prefix()
+    sign_files, _, _ = utils.load_signature_bank(str(signatures))
+    assert sign_files == ["alice.wav", "bob.wav", "Carl.wav"]
+    assert utils.build_speaker_maps(sign_files) == speaker_maps
@@ -0,0 +1,103 @@
+import numpy as np
+import soundfile as sf
+
+import speaker_embedding
+from conftest import write_audio
+
+
+def phrases(*spans):
+    return {
+        "phrases": [
+            {
+                "speaker": speaker,
+                "offsetMilliseconds": int(start * 1000),
+                "durationMilliseconds": int((stop - start) * 1000),
+            }
+            for speaker, start, stop in spans
+        ]
+    }
+
+
+def bank():
+    rng = np.random.default_rng(0)
+    return speaker_embedding.SpeakerBank(["Alice", "Bob"], rng.standard_normal((2, 38)))
+
+
+def test_pool_segments_matches_direct_statistics():
+    rng = np.random.default_rng(0)
+    mfcc = rng.standard_normal((50, speaker_embedding.n_mfcc))
+    voiced = rng.random(50) > 0.3
+    bounds = np.array([[0, 20], [10, 50]])
+    pooled = speaker_embedding.pool_segments(mfcc, voiced, bounds)
+    for (start, stop), embedding in zip(bounds, pooled):
+        frames = mfcc[start:stop, 1:][voiced[start:stop]]
+        expected = np.hstack((frames.mean(axis=0), frames.std(axis=0)))
+        np.testing.assert_allclose(embedding, expected / np.linalg.norm(expected))
+
+
+def test_identify_assigns_each_name_once():
+    rng = np.random.default_rng(1)
+    enrolled = rng.standard_normal((2, 24))
+    bank = speaker_embedding.SpeakerBank(["Alice", "Bob"], enrolled)
+    heard = np.vstack((enrolled[1], enrolled[1] * 0.9, enrolled[0]))
+    assert bank.identify(heard, threshold=-1.0) == ["Bob", None, "Alice"]
+
+
+def test_frame_features_in_blocks_match_one_pass(monkeypatch):
+    signal = np.random.default_rng(1).standard_normal(16000 * 3).astype(np.float32)
+    mfcc, energy = speaker_embedding.frame_features(signal)
+    monkeypatch.setattr(speaker_embedding, "block_frames", 7)
+    blocked_mfcc, blocked_energy = speaker_embedding.frame_features(signal)
+    np.testing.assert_allclose(blocked_mfcc, mfcc, rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(blocked_energy, energy, rtol=1e-5, atol=1e-4)
+
+
+def test_segment_features_decode_only_the_range(tmp_path):
+    path = write_audio(tmp_path / "tone.wav", 5.0)
+    mfcc, energy = speaker_embedding.segment_features(path, 1.0, 2.0)
+    assert mfcc.shape == (98, speaker_embedding.n_mfcc)
+    assert energy.shape == (98,)
+    empty, _ = speaker_embedding.segment_features(path, 6.0, 7.0)
+    assert empty.shape == (0, speaker_embedding.n_mfcc)
+
+
+def test_identify_speakers_handles_empty_audio(tmp_path):
+    path = str(tmp_path / "empty.wav")
+    sf.write(path, np.zeros(0, dtype=np.int16), 16000)
+    names = speaker_embedding.identify_speakers(
+        path, phrases((1, 0.0, 1.0), (2, 1.0, 2.0)), bank()
+    )
+    assert names == {"1": "Speaker 1", "2": "Speaker 2"}
+
+
+def test_identify_speakers_names_only_heard_speakers(tmp_path):
+    path = write_audio(tmp_path / "tone.wav", 3.0)
+    names = speaker_embedding.identify_speakers(
+        path, phrases((1, 0.0, 2.0), (2, 10.0, 12.0)), bank(), threshold=-1.0
+    )
+    assert names["1"] in ("Alice", "Bob")
+    assert names["2"] == "Speaker 2"
+    assert speaker_embedding.identify_speakers(path, {}, bank()) == {}
+
+
+def test_identify_speakers_decodes_the_recording_once(tmp_path, monkeypatch):
+    path = write_audio(tmp_path / "tone.wav", 3.0)
+    calls = []
+    iter_pcm16 = speaker_embedding.utils.iter_pcm16
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return iter_pcm16(*args, **kwargs)
+
+    monkeypatch.setattr(speaker_embedding.utils, "iter_pcm16", counted)
+    spans = [(i % 2 + 1, i * 0.25, i * 0.25 + 0.5) for i in range(10)]
+    speaker_embedding.identify_speakers(path, phrases(*spans), bank(), threshold=-1.0)
+    assert len(calls) == 1
+
+
+def test_from_signatures_skips_signatures_that_cannot_be_converted(workspace):
+    signatures = workspace / "known_speakers" / "audio_files"
+    (signatures / "carol.m4a").write_bytes(np.random.default_rng(0).bytes(2048))
+    enrolled = speaker_embedding.SpeakerBank.from_signatures(str(signatures))
+    assert enrolled.names == ["Alice", "Bob"]
+    assert enrolled.embeddings.shape[0] == 2
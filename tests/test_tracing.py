@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from tracing import Tracer
+
+
+def test_concurrent_traces_flush_only_their_own_spans(tmp_path):
+    tracer = Tracer(enabled=True, output_dir=str(tmp_path))
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow():
+        with tracer.span("upload", 100):
+            started.set()
+            await release.wait()
+
+    async def fast():
+        await started.wait()
+        with tracer.span("upload", 5):
+            pass
+        release.set()
+
+    async def run(func):
+        with tracer.trace() as spans:
+            await func()
+        return spans
+
+    async def main():
+        return await asyncio.gather(run(slow), run(fast))
+
+    slow_spans, fast_spans = asyncio.run(main())
+    assert [span["bytes"] for span in slow_spans] == [100]
+    assert [span["bytes"] for span in fast_spans] == [5]
+    assert not tracer.pending
+    lines = (tmp_path / "spans.jsonl").read_text().splitlines()
+    assert sorted(json.loads(line)["bytes"] for line in lines) == [5, 100]
+
+
+def test_traced_call_joins_the_callers_trace(tmp_path):
+    tracer = Tracer(enabled=True, output_dir=str(tmp_path))
+
+    @tracer.traced("inner")
+    async def inner():
+        with tracer.span("upload", 7):
+            pass
+
+    async def main():
+        with tracer.trace() as spans:
+            await inner()
+        return spans
+
+    spans = asyncio.run(main())
+    assert [(span["stage"], span["bytes"]) for span in spans] == [
+        ("upload", 7),
+        ("total", 0),
+    ]
+    assert len({span["trace"] for span in spans}) == 1
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from transcript import PhraseTable
+
+records = [
+    {
+        "speaker": "1",
+        "offsetMilliseconds": 0,
+        "durationMilliseconds": 1500,
+        "confidence": 0.75,
+        "text": "Hello there.",
+    },
+    {
+        "speaker": "2",
+        "offsetMilliseconds": 1600,
+        "durationMilliseconds": 800,
+        "confidence": None,
+        "text": "Hi, ünïcode – too.",
+    },
+    {
+        "speaker": "1",
+        "offsetMilliseconds": 2500,
+        "durationMilliseconds": 1000,
+        "confidence": 0.5,
+        "text": "Bye.",
+    },
+]
+
+
+@pytest.fixture
+def table():
+    return PhraseTable.from_records(
+        [{**record, "confidence": record["confidence"] or np.nan} for record in records]
+    )
+
+
+def test_records_round_trip(table):
+    assert PhraseTable.from_records(table.records()).records() == records
+
+
+def test_jsonl_round_trip(table, tmp_path):
+    table.to_jsonl(tmp_path / "phrases.jsonl")
+    assert PhraseTable.from_jsonl(tmp_path / "phrases.jsonl").records() == records
+
+
+def test_binary_round_trip(table, tmp_path):
+    table.to_binary(tmp_path / "phrases.npz")
+    loaded = PhraseTable.from_binary(tmp_path / "phrases.npz")
+    assert loaded.records() == records
+    assert loaded.labels == table.labels
+
+
+def test_empty_table_round_trips(tmp_path):
+    empty = PhraseTable.from_records([])
+    empty.to_binary(tmp_path / "empty.npz")
+    assert len(PhraseTable.from_binary(tmp_path / "empty.npz")) == 0
+    assert len(empty.merge_turns()) == 0
+
+
+def test_rename_after_and_shift(table):
+    moved = table.rename({"1": "Alice", "2": "Bob"}).after(1.0).shift(-1000)
+    assert list(moved.speakers) == ["Bob", "Alice"]
+    assert list(moved.offset_ms) == [600, 1500]
+
+
+def test_merge_turns_weights_confidence_by_duration():
+    turns = PhraseTable.from_records(
+        [
+            {
+                "speaker": "1",
+                "offsetMilliseconds": 0,
+                "durationMilliseconds": 1000,
+                "confidence": 1.0,
+                "text": "a",
+            },
+            {
+                "speaker": "1",
+                "offsetMilliseconds": 1000,
+                "durationMilliseconds": 3000,
+                "confidence": 0.5,
+                "text": "b",
+            },
+            {
+                "speaker": "2",
+                "offsetMilliseconds": 4000,
+                "durationMilliseconds": 1000,
+                "confidence": np.nan,
+                "text": "c",
+            },
+        ]
+    ).merge_turns()
+    assert list(turns.text) == ["a b", "c"]
+    assert list(turns.duration_ms) == [4000, 1000]
+    assert turns.confidence[0] == pytest.approx(0.625)
+    assert np.isnan(turns.confidence[1])
+
+
+def test_concat_merges_labels(table):
+    other = PhraseTable.from_records([{"speaker": "3", "text": "x"}])
+    combined = PhraseTable.concat([table, other])
+    assert list(combined.speakers) == ["1", "2", "1", "3"]
@@ -0,0 +1,168 @@
+import asyncio
+
+import mock_azure_server
+from conftest import write_audio
+from transcription_scheduler import (
+    TranscriptionScheduler,
+    batch_definition,
+    normalize_batch,
+)
+
+
+def test_normalize_batch_keeps_recognized_phrases_in_order():
+    result = {
+        "durationInTicks": 50_000_000,
+        "recognizedPhrases": [
+            {
+                "recognitionStatus": "Success",
+                "speaker": 2,
+                "offsetInTicks": 20_000_000,
+                "durationInTicks": 10_000_000,
+                "nBest": [{"display": "Second.", "confidence": 0.8}],
+            },
+            {
+                "recognitionStatus": "NoMatch",
+                "speaker": 1,
+                "offsetInTicks": 5_000_000,
+                "durationInTicks": 1_000_000,
+                "nBest": [{"display": ""}],
+            },
+            {
+                "speaker": 1,
+                "offsetMilliseconds": 0,
+                "durationMilliseconds": 1500,
+                "nBest": [{"display": "First."}],
+            },
+        ],
+    }
+    normalized = normalize_batch(result)
+    assert normalized["durationMilliseconds"] == 5000
+    assert [
+        (p["speaker"], p["offsetMilliseconds"], p["durationMilliseconds"], p["text"])
+        for p in normalized["phrases"]
+    ] == [(1, 0, 1500, "First."), (2, 2000, 1000, "Second.")]
+
+
+def test_normalize_batch_matches_fast_response():
+    fast = mock_azure_server.fake_phrases(12.0)
+    batch = normalize_batch(mock_azure_server.batch_result(12.0, "blob"))["phrases"]
+    keys = ("speaker", "offsetMilliseconds", "durationMilliseconds", "text")
+    assert [{k: p[k] for k in keys} for p in batch] == [
+        {k: p[k] for k in keys} for p in fast
+    ]
+
+
+def test_batch_definition_uses_the_batch_diarization_schema():
+    definition = {
+        "locales": ["en-US", "de-DE"],
+        "diarization": {"maxSpeakers": 12, "enabled": True},
+    }
+    body = batch_definition(definition, "http://blob/a.wav", "a.wav")
+    properties = body["properties"]
+    assert properties["diarizationEnabled"] is True
+    assert properties["diarization"] == {"speakers": {"minCount": 1, "maxCount": 12}}
+    assert body["locale"] == "en-US"
+    assert properties["languageIdentification"]["candidateLocales"] == [
+        "en-US",
+        "de-DE",
+    ]
+    disabled = batch_definition({"diarization": {"enabled": False}}, "u", "n")
+    assert disabled["properties"]["diarizationEnabled"] is False
+    assert "diarization" not in disabled["properties"]
+
+
+def scheduler(url, tmp_path, **kwargs):
+    return TranscriptionScheduler(
+        url,
+        "local",
+        url.split(mock_azure_server.transcribe_path)[0] + "/blobs",
+        poll_interval=0.05,
+        max_poll_interval=0.1,
+        retries=1,
+        output_dir=str(tmp_path / "out"),
+        **kwargs,
+    )
+
+
+def test_routes_by_duration(workspace, mock_server):
+    server, url = mock_server()
+    short = write_audio(workspace / "short.wav", 3.0, seed=3)
+    long = write_audio(workspace / "long.wav", 20.0, seed=4)
+    summary = asyncio.run(
+        scheduler(url, workspace, fast_max_seconds=15).run([short, long])
+    )
+    routes = {record["file"]: record["route"] for record in summary["results"]}
+    assert routes == {short: "fast", long: "batch"}
+    assert summary["succeeded"] == 2
+    assert summary["fallbacks"] == 0
+    # Jobs and blobs are deleted once their result is read
+    assert not server.jobs and not server.blobs
+
+
+def test_rejected_fast_request_falls_back_to_batch(workspace, mock_server):
+    _, url = mock_server(fast_max_seconds=10)
+    long = write_audio(workspace / "long.wav", 12.0)
+    summary = asyncio.run(scheduler(url, workspace).run([long]))
+    (record,) = summary["results"]
+    assert record["fallback"] and record["error"] is None
+    assert record["phrases"] > 0
+
+
+def test_unreadable_recording_does_not_abort_the_others(workspace, mock_server):
+    _, url = mock_server()
+    good = write_audio(workspace / "good.wav", 3.0)
+    bad = workspace / "bad.wav"
+    bad.write_bytes(open(good, "rb").read()[:30])
+    summary = asyncio.run(scheduler(url, workspace).run([good, str(bad)]))
+    results = {record["file"]: record for record in summary["results"]}
+    assert summary["succeeded"] == 1
+    assert results[good]["error"] is None
+    assert results[str(bad)]["route"] is None
+    assert "Error" in results[str(bad)]["error"]
+
+
+def test_batch_route_without_storage_reports_error(workspace, mock_server):
+    _, url = mock_server()
+    long = write_audio(workspace / "long.wav", 20.0)
+    run = scheduler(url, workspace, fast_max_seconds=15)
+    run.storage_url = None
+    (record,) = asyncio.run(run.run([long]))["results"]
+    assert record["route"] == "batch"
+    assert "no blob storage URL" in record["error"]
+
+
+def test_failed_result_listing_is_reported(workspace, mock_server, monkeypatch):
+    do_get = mock_azure_server.MockAzureHandler.do_GET
+
+    def failing_files(handler):
+        if handler.path.split("?")[0].endswith("/files"):
+            handler._reply(404, {"error": {"code": "NotFound"}})
+        else:
+            do_get(handler)
+
+    monkeypatch.setattr(mock_azure_server.MockAzureHandler, "do_GET", failing_files)
+    server, url = mock_server()
+    long = write_audio(workspace / "long.wav", 20.0)
+    summary = asyncio.run(scheduler(url, workspace, fast_max_seconds=15).run([long]))
+    (record,) = summary["results"]
+    assert record["error"] == "could not list the batch result files: 404"
+    assert not server.jobs and not server.blobs
+
+
+def test_other_fast_errors_do_not_fall_back(workspace, mock_server, monkeypatch):
+    do_post = mock_azure_server.MockAzureHandler.do_POST
+
+    def invalid_request(handler):
+        if handler.path.startswith(mock_azure_server.transcribe_path):
+            handler.rfile.read(int(handler.headers["Content-Length"]))
+            handler._reply(400, {"error": {"code": "InvalidArgument"}})
+        else:
+            do_post(handler)
+
+    monkeypatch.setattr(mock_azure_server.MockAzureHandler, "do_POST", invalid_request)
+    server, url = mock_server()
+    short = write_audio(workspace / "short.wav", 3.0)
+    (record,) = asyncio.run(scheduler(url, workspace).run([short]))["results"]
+    assert not record["fallback"]
+    assert record["error"].startswith("status 400")
+    assert not server.jobs
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from conftest import write_audio
+from transcription_service import TranscriptionService, submit
+
+
+def serve(url, scenario, **kwargs):
+    async def run():
+        service = TranscriptionService(url, "local", use_cache=False, **kwargs)
+        base_url = await service.start(port=0)
+        try:
+            return await scenario(service, base_url)
+        finally:
+            await service.stop()
+
+    return asyncio.run(run())
+
+
+def test_streams_phrases_of_an_upload(workspace, mock_server):
+    _, url = mock_server()
+    audio_path = write_audio(workspace / "talk.wav", 12.0, seed=3)
+
+    async def scenario(service, base_url):
+        return await asyncio.to_thread(lambda: list(submit(base_url, audio_path)))
+
+    events = serve(url, scenario)
+    assert events[0]["event"] == "queued"
+    assert events[-1]["event"] == "done"
+    phrases = [event for event in events if event["event"] == "phrase"]
+    assert len(phrases) == events[-1]["phrases"] > 0
+
+
+def test_invalid_content_length_returns_an_error_line(workspace, mock_server):
+    _, url = mock_server()
+
+    async def scenario(service, base_url):
+        host, port = base_url.rsplit("/", 1)[-1].split(":")
+        reader, writer = await asyncio.open_connection(host, int(port))
+        writer.write(b"POST /transcribe HTTP/1.1\r\nContent-Length: ten\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    head, _, body = serve(url, scenario).partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 400 ")
+    assert b"Content-Type: application/x-ndjson" in head
+    line, rest = body.split(b"\n", 1)
+    assert json.loads(line)["event"] == "error"
+    assert rest == b""
@@ -0,0 +1,45 @@
+import io
+import os
+import subprocess
+import sys
+
+import numpy as np
+import soundfile as sf
+
+import upload
+import utils
+from conftest import write_audio
+
+
+def test_multipart_body_streams_prefix_and_audio(tmp_path):
+    audio_path = write_audio(tmp_path / "talk.wav", 2.0, sample_rate=44100)
+    prefix = np.arange(-400, 400, dtype=np.int16)
+    body = upload.MultipartAudioBody(
+        {"locales": ["en-US"]}, prefix.tobytes(), audio_path
+    )
+    data = b"".join(body)
+    assert len(data) == len(body)
+
+    start = data.index(b"RIFF")
+    wav_bytes = data[start : start + 44 + body.num_frames * 2]
+    samples, sample_rate = sf.read(io.BytesIO(wav_bytes), dtype="int16")
+    assert sample_rate == 16000
+    np.testing.assert_array_equal(samples[: len(prefix)], prefix)
+    expected = np.concatenate(list(utils.iter_pcm16(audio_path, 16000)))
+    np.testing.assert_array_equal(samples[len(prefix) :], expected)
+    assert data.endswith(f"--{body.boundary}--\r\n".encode())
+
+
+def test_upload_does_not_import_the_codec_benchmark():
+    code = (
+        "import sys, upload; "
+        "print(sorted({'encoding', 'requests', 'soundfile'} & set(sys.modules)))"
+    )
+    modules = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(upload.__file__),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert modules.strip() == "[]"
@@ -0,0 +1,160 @@
+import asyncio
+
+import numpy as np
+import pytest
+import soundfile as sf
+from scipy.signal import resample_poly
+
+import audio_pool
+import utils
+from conftest import write_audio
+
+
+@pytest.mark.parametrize(
+    "source_rate, target_rate", [(44100, 16000), (8000, 16000), (48000, 16000)]
+)
+@pytest.mark.parametrize("block_size", [1000, 4096, 30000])
+def test_streaming_resampler_matches_resample_poly(
+    source_rate, target_rate, block_size
+):
+    rng = np.random.default_rng(0)
+    signal = rng.standard_normal(source_rate)
+    resampler = utils.StreamingResampler(source_rate, target_rate)
+    out = [
+        resampler.process(signal[i : i + block_size])
+        for i in range(0, len(signal), block_size)
+    ]
+    out.append(resampler.flush())
+
+    g = np.gcd(source_rate, target_rate)
+    expected = resample_poly(
+        signal, target_rate // g, source_rate // g, window=resampler.window
+    )
+    np.testing.assert_allclose(np.concatenate(out), expected, atol=1e-9)
+
+
+def test_streaming_resampler_passes_through_equal_rates():
+    resampler = utils.StreamingResampler(16000, 16000)
+    block = np.arange(10.0)
+    assert resampler.process(block) is block
+    assert len(resampler.flush()) == 0
+
+
+def test_iter_pcm16_range_matches_length(tmp_path):
+    path = write_audio(tmp_path / "tone.wav", 3.0, sample_rate=44100)
+    blocks = list(utils.iter_pcm16(path, 16000, block_size=5000, start=0.5, stop=2.0))
+    assert sum(len(block) for block in blocks) == utils.pcm16_length(
+        path, 16000, start=0.5, stop=2.0
+    )
+
+
+def test_decode_signature_downmixes_stereo(tmp_path):
+    path = write_audio(tmp_path / "stereo.wav", 1.0, sample_rate=22050, channels=2)
+    data = utils.decode_signature(path)
+    assert data.ndim == 1
+    assert len(data) == audio_pool.decoded_length(path)
+
+
+def test_pool_combine_matches_blocking_combine_with_stereo(tmp_path):
+    files = [
+        write_audio(tmp_path / "mono.wav", 1.0, seed=1),
+        write_audio(tmp_path / "stereo.flac", 1.5, sample_rate=44100, channels=2),
+    ]
+    blocking = utils.combine_pcm16(files, str(tmp_path / "blocking.wav"))
+    workers = audio_pool.workers
+    audio_pool.configure(0)
+    try:
+        pooled = asyncio.run(audio_pool.combine(files, str(tmp_path / "pooled.wav")))
+    finally:
+        audio_pool.configure(workers)
+    a, _ = sf.read(blocking, dtype="int16")
+    b, _ = sf.read(pooled, dtype="int16")
+    assert a.ndim == 1
+    np.testing.assert_array_equal(a, b)
+
+
+def test_pool_fits_each_file_to_its_header_length(tmp_path, monkeypatch):
+    files = [
+        write_audio(tmp_path / "a.wav", 1.0, seed=1),
+        write_audio(tmp_path / "b.wav", 1.0, seed=2),
+    ]
+    # Pretend the headers are a few frames off from what decodes
+    header = {files[0]: 15997, files[1]: 16002}
+    monkeypatch.setattr(audio_pool, "decoded_length", lambda path, rate: header[path])
+    workers = audio_pool.workers
+    audio_pool.configure(0)
+    try:
+        pcm = asyncio.run(audio_pool.decode_all(files))
+    finally:
+        audio_pool.configure(workers)
+    try:
+        samples = pcm.array.copy()
+    finally:
+        pcm.unlink()
+    a, b = (utils.decode_signature(path) for path in files)
+    assert len(samples) == 15997 + 16002
+    np.testing.assert_array_equal(samples[:15997], a[:15997])
+    np.testing.assert_array_equal(samples[15997:31997], b)
+    assert not samples[31997:].any()
+
+
+def test_pool_decodes_relative_paths_after_chdir(tmp_path, monkeypatch):
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    monkeypatch.chdir(tmp_path / "first")
+    workers = audio_pool.workers
+    asyncio.run(audio_pool.start(1))
+    try:
+        monkeypatch.chdir(tmp_path / "second")
+        write_audio(tmp_path / "second" / "tone.wav", 1.0)
+        pooled = asyncio.run(audio_pool.combine(["tone.wav"], "combined.wav"))
+    finally:
+        audio_pool.configure(workers)
+    assert sf.info(pooled).frames == 16000
+
+
+def test_get_audio_duration_reads_non_wav(tmp_path):
+    path = write_audio(tmp_path / "tone.flac", 2.5)
+    assert asyncio.run(utils.get_audio_duration(path)) == pytest.approx(2.5)
+
+
+def test_get_audio_duration_rejects_truncated_wav(tmp_path):
+    path = write_audio(tmp_path / "tone.wav", 1.0)
+    with open(path, "rb") as f:
+        head = f.read(30)
+    with open(tmp_path / "bad.wav", "wb") as f:
+        f.write(head)
+    with pytest.raises(sf.LibsndfileError):
+        asyncio.run(utils.get_audio_duration(str(tmp_path / "bad.wav")))
+
+
+def test_pcm_chunks_async_matches_pcm_chunks(tmp_path):
+    path = write_audio(tmp_path / "talk.wav", 2.05, sample_rate=44100)
+
+    async def collect():
+        return [chunk async for chunk in utils.pcm_chunks_async(path, max_pending=2)]
+
+    assert asyncio.run(collect()) == list(utils.pcm_chunks(path))
+
+
+def test_pcm_chunks_async_stops_the_decoder_when_closed_early(tmp_path):
+    path = write_audio(tmp_path / "talk.wav", 5.0)
+
+    async def first_chunk():
+        chunks = utils.pcm_chunks_async(path, max_pending=1)
+        chunk = await anext(chunks)
+        await chunks.aclose()
+        return chunk
+
+    assert len(asyncio.run(asyncio.wait_for(first_chunk(), 5))) == 3200
+
+
+def test_pcm_chunks_async_raises_decoding_errors(tmp_path):
+    path = tmp_path / "bad.wav"
+    path.write_bytes(b"RIFF0000WAVE")
+
+    async def collect():
+        return [chunk async for chunk in utils.pcm_chunks_async(str(path))]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect())
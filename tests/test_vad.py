@@ -0,0 +1,15 @@
+import os
+
+import soundfile as sf
+
+import vad
+from conftest import write_audio
+
+
+def test_trim_silence_writes_a_new_file_per_call(tmp_path):
+    audio_path = write_audio(tmp_path / "talk.wav", 3.0)
+    first, _, report = vad.trim_silence(audio_path, output_dir=str(tmp_path / "out"))
+    second, _, _ = vad.trim_silence(audio_path, output_dir=str(tmp_path / "out"))
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path / "out")
+    assert sf.info(first).frames == round(report["kept_seconds"] * 16000)
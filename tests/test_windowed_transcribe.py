@@ -0,0 +1,81 @@
+import pytest
+
+from windowed_transcribe import plan_windows, stitch_windows
+
+segments = [("1", 0.0, 2.0), ("2", 2.0, 4.0)]
+speaker_maps = {"1": "Alice", "2": "Bob"}
+signs_duration = 4.0
+
+
+def phrase(speaker, offset, duration, text):
+    return {
+        "speaker": speaker,
+        "offsetMilliseconds": int(offset * 1000),
+        "durationMilliseconds": int(duration * 1000),
+        "text": text,
+    }
+
+
+def test_plan_windows_owns_every_instant_once():
+    windows = plan_windows(100.0, 60.0, 10.0)
+    assert windows == [(0.0, 60.0, 0.0, 55.0), (50.0, 100.0, 55.0, float("inf"))]
+    with pytest.raises(ValueError):
+        plan_windows(100.0, 10.0, 10.0)
+
+
+def test_stitch_windows_shifts_dedupes_and_names_speakers():
+    windows = plan_windows(100.0, 60.0, 10.0)
+    responses = [
+        {
+            "phrases": [
+                # The provider's labels differ per window; the prefix anchors them
+                phrase(7, 0.0, 1.8, "alice signature"),
+                phrase(8, 2.1, 1.8, "bob signature"),
+                phrase(7, 14.0, 2.0, "first"),
+                phrase(8, 49.0, 2.0, "bob"),
+                phrase(9, 55.0, 3.0, "guest"),
+            ]
+        },
+        {
+            "phrases": [
+                phrase(3, 0.0, 1.8, "alice signature"),
+                phrase(4, 2.1, 1.8, "bob signature"),
+                # The overlap duplicate of "guest", owned by the first window
+                phrase(5, 5.0, 3.0, "guest"),
+                phrase(3, 24.0, 2.0, "later"),
+                phrase(5, 34.0, 2.0, "guest again"),
+            ]
+        },
+    ]
+    merged = stitch_windows(
+        windows, responses, segments, speaker_maps, signs_duration, 10.0
+    )
+    assert [(p["offsetMilliseconds"], p["speaker"], p["text"]) for p in merged] == [
+        (10000, "Alice", "first"),
+        (45000, "Bob", "bob"),
+        (51000, "Guest 1", "guest"),
+        (70000, "Alice", "later"),
+        (80000, "Guest 1", "guest again"),
+    ]
+
+
+def test_stitch_windows_without_phrases():
+    windows = plan_windows(30.0, 60.0, 10.0)
+    assert stitch_windows(windows, [{}], segments, speaker_maps, 4.0, 10.0) == []
+
+
+def test_unanchored_labels_are_not_named_by_position():
+    windows = plan_windows(30.0, 60.0, 10.0)
+    # Label 2 matches Bob's position but was not heard in his signature
+    responses = [
+        {
+            "phrases": [
+                phrase(1, 0.0, 1.8, "alice signature"),
+                phrase(2, 14.0, 2.0, "guest"),
+            ]
+        }
+    ]
+    merged = stitch_windows(
+        windows, responses, segments, speaker_maps, signs_duration, 10.0
+    )
+    assert [(p["speaker"], p["text"]) for p in merged] == [("Guest 1", "guest")]